@@ -0,0 +1,169 @@
+import hll, partitions
+from bulk_load import transaction
+
+# KPI aggregates materialized from fact_sales (completed/shipped lines only).
+# Distinct order counts do not add up across categories or products, so every
+# grain stores its own `orders` and the views never sum them across that grain.
+KPI_STATUSES = "('completed','shipped')"
+
+# The slice-and-dice cube covers every status x payment method x month x category set.
+# An order has exactly one month, status and payment method, so its counts add up across
+# those; only categories overlap. Each cube row therefore holds one *set* of categories
+# (a bitmask over agg_cube_category) with the distinct orders touching any of them,
+# which makes every dashboard filter a sum over a handful of rows. Sets are enumerated
+# for up to CUBE_MAX_CATEGORIES categories; beyond that only single categories and the
+# all-categories set are kept. ROLLUP stores month_key 0 / status or payment 'ALL'.
+# Categories come from the dim_product version each fact points at (point in time).
+# Single-category rows also carry HyperLogLog sketches (hll.py) of their orders and
+# customers; merging them approximates distinct counts for any set, materialized or not.
+CUBE_MAX_CATEGORIES = 8
+ROLLUP = "ALL"
+
+AGG_TABLES = {
+    "agg_sales_month": """
+      CREATE TABLE IF NOT EXISTS agg_sales_month(
+        month_key INTEGER PRIMARY KEY,
+        orders INTEGER, lines INTEGER, quantity INTEGER, revenue REAL
+      )""",
+    "agg_sales_month_product": """
+      CREATE TABLE IF NOT EXISTS agg_sales_month_product(
+        month_key INTEGER, product_sk INTEGER, product_id INTEGER,
+        orders INTEGER, quantity INTEGER, revenue REAL,
+        PRIMARY KEY (month_key, product_sk)
+      )""",
+    "agg_sales_month_category_payment": """
+      CREATE TABLE IF NOT EXISTS agg_sales_month_category_payment(
+        month_key INTEGER, category TEXT, payment_method TEXT,
+        orders INTEGER, quantity INTEGER, revenue REAL,
+        PRIMARY KEY (month_key, category, payment_method)
+      )""",
+    "agg_cube_category": """
+      CREATE TABLE IF NOT EXISTS agg_cube_category(
+        category TEXT PRIMARY KEY,
+        bit INTEGER NOT NULL UNIQUE
+      )""",
+    "agg_cube": """
+      CREATE TABLE IF NOT EXISTS agg_cube(
+        month_key INTEGER, status TEXT, payment_method TEXT, category_set INTEGER,
+        orders INTEGER, quantity INTEGER, revenue REAL, orders_hll BLOB, customers_hll BLOB,
+        PRIMARY KEY (month_key, status, payment_method, category_set)
+      )""",
+    "agg_cube_product": """
+      CREATE TABLE IF NOT EXISTS agg_cube_product(
+        month_key INTEGER, status TEXT, payment_method TEXT, product_sk INTEGER, product_id INTEGER,
+        orders INTEGER, quantity INTEGER, revenue REAL,
+        PRIMARY KEY (month_key, status, payment_method, product_sk)
+      )""",
+}
+
+# not per month: new categories are appended so the bits already used in agg_cube stay valid
+APPEND_ONLY = {"agg_cube_category"}
+
+AGG_SELECTS = {
+    "agg_sales_month": f"""
+      SELECT fs.month_key, COUNT(DISTINCT fs.order_id), COUNT(*), SUM(fs.quantity), SUM(fs.revenue)
+      FROM {{facts}} fs
+      WHERE fs.status IN {KPI_STATUSES} {{months}}
+      GROUP BY fs.month_key""",
+    "agg_sales_month_product": f"""
+      SELECT fs.month_key, fs.product_sk, fs.product_id, COUNT(DISTINCT fs.order_id), SUM(fs.quantity), SUM(fs.revenue)
+      FROM {{facts}} fs
+      WHERE fs.status IN {KPI_STATUSES} {{months}}
+      GROUP BY fs.month_key, fs.product_sk, fs.product_id""",
+    "agg_sales_month_category_payment": f"""
+      SELECT fs.month_key, dp.category, fs.payment_method,
+             COUNT(DISTINCT fs.order_id), SUM(fs.quantity), SUM(fs.revenue)
+      FROM {{facts}} fs
+      JOIN dim_product dp ON dp.product_sk = fs.product_sk
+      WHERE fs.status IN {KPI_STATUSES} {{months}}
+      GROUP BY fs.month_key, dp.category, fs.payment_method""",
+    "agg_cube_category": """
+      SELECT category, 1 << ((SELECT COUNT(*) FROM agg_cube_category) + ROW_NUMBER() OVER (ORDER BY category) - 1)
+      FROM (SELECT DISTINCT category FROM dim_product
+            WHERE category IS NOT NULL AND category NOT IN (SELECT category FROM agg_cube_category))""",
+    "agg_cube": f"""
+      WITH RECURSIVE
+        bits AS (SELECT category, bit FROM agg_cube_category),
+        lines AS (
+          SELECT fs.month_key, fs.status, fs.payment_method, fs.order_id, fs.customer_id, b.bit,
+                 fs.quantity, fs.revenue
+          FROM {{facts}} fs
+          JOIN dim_product dp ON dp.product_sk = fs.product_sk
+          JOIN bits b ON b.category = dp.category
+          WHERE fs.month_key IS NOT NULL {{months}}),
+        cells AS (
+          SELECT month_key, status, payment_method, bit, SUM(quantity) AS quantity, SUM(revenue) AS revenue,
+                 hll_sketch(order_id) AS orders_hll, hll_sketch(customer_id) AS customers_hll
+          FROM lines GROUP BY month_key, status, payment_method, bit),
+        -- bits are distinct powers of two, so SUM(DISTINCT bit) is the OR of an order's categories
+        masks AS (
+          SELECT month_key, status, payment_method, mask, COUNT(*) AS n
+          FROM (SELECT month_key, status, payment_method, order_id, SUM(DISTINCT bit) AS mask
+                FROM lines GROUP BY month_key, status, payment_method, order_id)
+          GROUP BY month_key, status, payment_method, mask),
+        every_set(s) AS (
+          SELECT 1 WHERE (SELECT COUNT(*) FROM bits) BETWEEN 1 AND {CUBE_MAX_CATEGORIES}
+          UNION ALL SELECT s + 1 FROM every_set WHERE s < (SELECT SUM(bit) FROM bits)),
+        sets(s) AS (
+          SELECT s FROM every_set
+          UNION SELECT bit FROM bits
+          UNION SELECT SUM(bit) FROM bits),
+        ord AS (
+          SELECT m.month_key, m.status, m.payment_method, sets.s, SUM(m.n) AS orders
+          FROM masks m JOIN sets ON m.mask & sets.s
+          GROUP BY m.month_key, m.status, m.payment_method, sets.s),
+        amounts AS (
+          SELECT c.month_key, c.status, c.payment_method, sets.s,
+                 SUM(c.quantity) AS quantity, SUM(c.revenue) AS revenue,
+                 MAX(CASE WHEN c.bit = sets.s THEN c.orders_hll END) AS orders_hll,
+                 MAX(CASE WHEN c.bit = sets.s THEN c.customers_hll END) AS customers_hll
+          FROM cells c JOIN sets ON c.bit & sets.s
+          GROUP BY c.month_key, c.status, c.payment_method, sets.s)
+      SELECT o.month_key, o.status, o.payment_method, o.s, o.orders, a.quantity, a.revenue,
+             a.orders_hll, a.customers_hll
+      FROM ord o JOIN amounts a USING (month_key, status, payment_method, s)""",
+    "agg_cube_product": """
+      SELECT fs.month_key, fs.status, fs.payment_method, fs.product_sk, fs.product_id,
+             COUNT(DISTINCT fs.order_id), SUM(fs.quantity), SUM(fs.revenue)
+      FROM {facts} fs
+      WHERE fs.month_key IS NOT NULL {months}
+      GROUP BY fs.month_key, fs.status, fs.payment_method, fs.product_sk, fs.product_id""",
+}
+
+# (month, status, payment) rollups, derived from the base cells: all three are additive
+_CUBE_ROLLUP = f"""
+  INSERT INTO agg_cube
+  SELECT CASE WHEN g & 1 THEN 0 ELSE month_key END,
+         CASE WHEN g & 2 THEN '{ROLLUP}' ELSE status END,
+         CASE WHEN g & 4 THEN '{ROLLUP}' ELSE payment_method END,
+         category_set, SUM(orders), SUM(quantity), SUM(revenue), hll_merge(orders_hll), hll_merge(customers_hll)
+  FROM agg_cube,
+       (WITH RECURSIVE gs(g) AS (SELECT 1 UNION ALL SELECT g + 1 FROM gs WHERE g < 7) SELECT g FROM gs)
+  WHERE month_key <> 0 AND status <> '{ROLLUP}' AND payment_method <> '{ROLLUP}'
+  GROUP BY 1, 2, 3, 4"""
+
+
+def refresh_aggregates(con, months=None):
+    """Recompute the aggregate tables, either completely (months=None) or only for
+    the given month_keys; returns the number of months refreshed (None = all).
+    Archived months keep the rows they had when their partition was detached."""
+    archived = set(partitions.archived(con))
+    if months is not None:
+        months = sorted({int(m) for m in months if m} - archived)
+        if not months:
+            return 0
+    keys = None if months is None else ", ".join(map(str, months))
+    # a month refresh reads only the partitions of those months
+    facts = partitions.VIEW if keys is None else partitions.source(partitions.online(con, months).values())
+    keep = f" WHERE month_key NOT IN ({', '.join(map(str, archived))})" if archived else ""
+    hll.register(con)
+    with transaction(con):
+        for table, ddl in AGG_TABLES.items():
+            con.execute(ddl)
+            if table not in APPEND_ONLY:
+                con.execute(f"DELETE FROM {table}" + (keep if keys is None else f" WHERE month_key IN ({keys})"))
+            con.execute(f"INSERT INTO {table} " + AGG_SELECTS[table].format(
+                facts=facts, months="" if keys is None else f"AND fs.month_key IN ({keys})"))
+        con.execute(f"DELETE FROM agg_cube WHERE month_key = 0 OR '{ROLLUP}' IN (status, payment_method)")
+        con.execute(_CUBE_ROLLUP)
+    return None if months is None else len(months)
@@ -0,0 +1,311 @@
+import argparse, asyncio, functools, json, random, sqlite3, time, requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from bulk_load import bulk_insert, transaction
+import instrument
+from query_cache import bump_data_version
+
+# Concurrent extraction of paginated JSON APIs into SQLite staging tables.
+#
+# An asyncio loop schedules every page request; the blocking HTTP calls run in the
+# client's own pool of `concurrency` threads (the loop's default executor would cap them
+# at its own size) over one shared requests.Session whose keep-alive pool matches the
+# concurrency, so connections are reused rather than reopened per page. Requests are
+# capped at `concurrency` in flight, paced by a token-bucket rate limit and retried
+# with exponential backoff + jitter on connection errors, timeouts, 429 and 5xx
+# (honouring Retry-After). Pages go onto a queue as they arrive and a single writer
+# appends them to stg_api_<name>__new, which replaces stg_api_<name> only once the
+# whole source was read; a source that fails keeps its last good table.
+#
+# Two pagination styles are understood (see api_stub.py):
+#   page numbers: {"data": [...], "total_pages": N}  -> pages 2..N fetched concurrently
+#   cursors:      {"data": [...], "next": url}       -> followed one after another
+# A bare JSON list is taken as a single page.
+RETRY_STATUS = {429, 500, 502, 503, 504}
+PER_PAGE = 100
+CONCURRENCY = 8
+
+
+class ApiError(RuntimeError):
+    pass
+
+
+class RateLimiter:
+    """Token bucket: `rate` requests per second on average, bursts of up to `burst`."""
+
+    def __init__(self, rate, burst=None):
+        self.rate, self.capacity = float(rate), float(burst or max(1.0, rate))
+        self.tokens, self.updated = self.capacity, time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class ApiClient:
+    def __init__(self, concurrency=CONCURRENCY, rate=None, retries=4, backoff=0.25, max_backoff=8.0,
+                 timeout=10.0, headers=None):
+        self.concurrency, self.retries, self.timeout = int(concurrency), int(retries), timeout
+        self.backoff, self.max_backoff = backoff, max_backoff
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update(headers or {})
+        self._pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="api")
+        self._limit = asyncio.Semaphore(self.concurrency)
+        self._rate = RateLimiter(rate) if rate else None
+        self.stats = {"requests": 0, "retries": 0, "failures": 0, "bytes": 0}
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+        self.session.close()
+
+    def _delay(self, attempt, response=None):
+        retry_after = response is not None and response.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+        # full jitter: anywhere up to the exponential cap, so retries do not arrive in waves
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    async def get_json(self, url, params=None):
+        for attempt in range(self.retries + 1):
+            response = error = None
+            async with self._limit:
+                if self._rate:
+                    await self._rate.acquire()
+                self.stats["requests"] += 1
+                try:
+                    response = await asyncio.get_running_loop().run_in_executor(
+                        self._pool, functools.partial(self.session.get, url, params=params, timeout=self.timeout))
+                    self.stats["bytes"] += len(response.content)
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    error = e
+            if response is not None and response.status_code not in RETRY_STATUS:
+                if not response.ok:
+                    self.stats["failures"] += 1
+                    raise ApiError(f"GET {response.url}: HTTP {response.status_code}")
+                return response.json()
+            if attempt == self.retries:
+                break
+            self.stats["retries"] += 1
+            await asyncio.sleep(self._delay(attempt, response))
+        self.stats["failures"] += 1
+        reason = error if response is None else f"HTTP {response.status_code}"
+        raise ApiError(f"GET {url} failed after {self.retries + 1} attempts: {reason}")
+
+
+def _records(body):
+    return body if isinstance(body, list) else body.get("data", [])
+
+
+async def paginate(client, url, params=None, per_page=PER_PAGE):
+    """Yield the record list of every page of `url`; numbered pages after the first are
+    fetched concurrently (up to 2x the client's concurrency scheduled at a time) and
+    yielded as they complete."""
+    params = dict(params or {})
+    first = await client.get_json(url, {**params, "page": 1, "per_page": per_page})
+    yield _records(first)
+    if isinstance(first, list):
+        return
+    if "total_pages" in first:
+        pages, pending = iter(range(2, int(first["total_pages"]) + 1)), set()
+        try:
+            while True:
+                for page in pages:
+                    pending.add(asyncio.ensure_future(
+                        client.get_json(url, {**params, "page": page, "per_page": per_page})))
+                    if len(pending) >= 2 * client.concurrency:
+                        break
+                if not pending:
+                    return
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield _records(task.result())
+        finally:
+            for task in pending:
+                task.cancel()
+    else:
+        nxt = first.get("next")
+        while nxt:
+            body = await client.get_json(nxt)
+            yield _records(body)
+            nxt = body.get("next")
+
+
+def _value(v):
+    # nested JSON stays JSON text in the staging table
+    return json.dumps(v) if isinstance(v, (dict, list)) else v
+
+
+class _StageWriter:
+    """Appends pages of one source to stg_api_<name>__new, adding columns as new keys appear."""
+
+    def __init__(self, con, name):
+        self.con, self.table, self.final = con, f"stg_api_{name}__new", f"stg_api_{name}"
+        self.columns, self.rows, self.pages = [], 0, 0
+        con.execute(f'DROP TABLE IF EXISTS "{self.table}"')
+
+    def write(self, records):
+        keys = list(dict.fromkeys(k for r in records for k in r))
+        with transaction(self.con):
+            if not self.columns and keys:
+                self.con.execute(f'CREATE TABLE "{self.table}"(' + ", ".join(f'"{k}"' for k in keys) + ")")
+                self.columns = keys
+            for k in keys:
+                if k not in self.columns:
+                    self.con.execute(f'ALTER TABLE "{self.table}" ADD COLUMN "{k}"')
+                    self.columns.append(k)
+            if records:
+                rows = ([_value(r.get(c)) for c in self.columns] for r in records)
+                self.rows += bulk_insert(self.con, f'"{self.table}"', rows, [f'"{c}"' for c in self.columns])
+        self.pages += 1
+
+    def publish(self):
+        with transaction(self.con):
+            self.con.execute(f'DROP TABLE IF EXISTS "{self.final}"')
+            if self.columns:
+                self.con.execute(f'ALTER TABLE "{self.table}" RENAME TO "{self.final}"')
+            else:
+                self.con.execute(f'CREATE TABLE "{self.final}"(id)')
+            bump_data_version(self.con, {self.final})
+
+    def discard(self):
+        with transaction(self.con):
+            self.con.execute(f'DROP TABLE IF EXISTS "{self.table}"')
+
+
+def _source(spec):
+    return {"url": spec, "params": {}} if isinstance(spec, str) else {"params": {}, **spec}
+
+
+async def extract_async(con, sources, per_page=PER_PAGE, strict=False, **client_options):
+    """Stream every source ({name: url or {"url", "params"}}) into stg_api_<name>;
+    returns {name: {rows, pages, seconds, error}} plus the client's "_http" counters."""
+    client = ApiClient(**client_options)
+    queue = asyncio.Queue(maxsize=4 * client.concurrency)
+    results = {name: {"rows": 0, "pages": 0, "seconds": 0.0, "error": None} for name in sources}
+    DONE = object()
+
+    async def produce(name, spec):
+        start = time.perf_counter()
+        try:
+            async for records in paginate(client, spec["url"], spec["params"], per_page):
+                await queue.put((name, records))
+        except Exception as e:
+            results[name]["error"] = f"{type(e).__name__}: {e}"
+        finally:
+            results[name]["seconds"] = time.perf_counter() - start
+            await queue.put((name, DONE))
+
+    async def consume():
+        writers, open_sources = {}, len(sources)
+        while open_sources:
+            name, records = await queue.get()
+            writer = writers.get(name) or writers.setdefault(name, _StageWriter(con, name))
+            if records is not DONE:
+                writer.write(records)
+                continue
+            open_sources -= 1
+            if results[name]["error"] is None:
+                writer.publish()
+            else:
+                writer.discard()
+            results[name].update(rows=writer.rows, pages=writer.pages)
+
+    try:
+        tasks = [produce(name, _source(spec)) for name, spec in sources.items()]
+        await asyncio.gather(consume(), *tasks)
+    finally:
+        client.close()
+    failed = {n: r["error"] for n, r in results.items() if r["error"]}
+    if strict and failed:
+        raise ApiError(f"API extraction failed: {failed}")
+    return {**results, "_http": dict(client.stats)}
+
+
+@instrument.timed("api_extract")
+def extract_api(db, sources, **options):
+    """Synchronous entry point: `db` is a sqlite3 connection or a path; see extract_async."""
+    con = db if isinstance(db, sqlite3.Connection) else sqlite3.connect(db)
+    try:
+        stats = asyncio.run(extract_async(con, sources, **options))
+    finally:
+        if con is not db:
+            con.close()
+    rows = sum(r["rows"] for n, r in stats.items() if n != "_http")
+    instrument.annotate(rows_out=rows, bytes_read=stats["_http"]["bytes"], **{
+        k: v for k, v in stats["_http"].items() if k != "bytes"})
+    return stats
+
+
+def get_json(url, params=None, **options):
+    """One GET with the client's retry/backoff, from synchronous code."""
+    async def one():
+        client = ApiClient(**options)
+        try:
+            return await client.get_json(url, params)
+        finally:
+            client.close()
+    return asyncio.run(one())
+
+
+def _print(stats, seconds):
+    for name, r in stats.items():
+        if name != "_http":
+            status = f"FAILED {r['error']}" if r["error"] else "ok"
+            print(f"  {name:<20} {r['rows']:>10,} rows {r['pages']:>6,} pages {r['seconds']:>8.2f}s  {status}")
+    h = stats["_http"]
+    print(f"  {h['requests']:,} requests, {h['retries']:,} retries, {h['failures']:,} failures, "
+          f"{h['bytes'] / 2**20:,.1f} MiB in {seconds:.2f}s ({h['requests'] / seconds:,.0f} req/s)")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Extract paginated JSON APIs into stg_api_* tables")
+    ap.add_argument("sources", nargs="*", metavar="NAME=URL")
+    ap.add_argument("--db", default="mini_dwh.sqlite")
+    ap.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    ap.add_argument("--rate", type=float, help="max requests per second")
+    ap.add_argument("--retries", type=int, default=4)
+    ap.add_argument("--per-page", type=int, default=PER_PAGE)
+    ap.add_argument("--stub", action="store_true",
+                    help="self-check against a local api_stub server (flaky, slow) into a scratch DB")
+    args = ap.parse_args()
+    options = dict(concurrency=args.concurrency, rate=args.rate, retries=args.retries, per_page=args.per_page)
+
+    if args.stub:
+        import tempfile
+        from api_stub import serve
+        with serve(rows=20_000, latency=0.02, error_rate=0.05, throttle_rate=0.02, seed=1) as srv, \
+                tempfile.TemporaryDirectory() as tmp:
+            db = f"{tmp}/stub.sqlite"
+            start = time.perf_counter()
+            stats = extract_api(db, {"orders": f"{srv.url}/orders",
+                                     "events": {"url": f"{srv.url}/events", "params": {"limit": 500}}}, **options)
+            _print(stats, time.perf_counter() - start)
+            print("  server:", srv.stats)
+            con = sqlite3.connect(db)
+            ok = True
+            for table in ("stg_api_orders", "stg_api_events"):
+                n, distinct = con.execute(f"SELECT COUNT(*), COUNT(DISTINCT id) FROM {table}").fetchone()
+                ok &= n == distinct == srv.rows
+                print(f"  {table}: {n:,} rows, {distinct:,} distinct ids (expected {srv.rows:,})")
+            con.close()
+        print("✅ stub extraction complete" if ok else "❌ stub extraction incomplete")
+        raise SystemExit(0 if ok else 1)
+
+    sources = dict(s.split("=", 1) for s in args.sources)
+    if not sources:
+        ap.error("give at least one NAME=URL source (or --stub)")
+    start = time.perf_counter()
+    stats = extract_api(args.db, sources, **options)
+    _print(stats, time.perf_counter() - start)
+    raise SystemExit(1 if any(r["error"] for n, r in stats.items() if n != "_http") else 0)
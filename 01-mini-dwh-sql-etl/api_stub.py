@@ -0,0 +1,141 @@
+import argparse, json, random, threading, time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Local stand-in for a paginated JSON API, so api_extract can be exercised offline:
+#   GET /<resource>?page=N&per_page=M  -> {"data": [...], "page", "per_page", "total", "total_pages"}
+#   GET /<resource>?after=ID&limit=M   -> {"data": [...], "next": "<url>" or null}   (cursor style)
+# Each resource serves the same deterministic records. Latency, the share of requests
+# answered with HTTP 500 and the share throttled with 429 + Retry-After are settable;
+# the stats count requests, TCP connections and the peak number in flight.
+#
+#   python api_stub.py --port 8765 --rows 5000 --latency 0.05 --error-rate 0.05
+
+
+def record(i):
+    created = datetime(2024, 1, 1) + timedelta(minutes=37 * i)
+    return {"id": i, "customer_id": 1 + i % 400, "amount": round(5 + (i * 7919) % 50000 / 100, 2),
+            "status": ("new", "paid", "refunded")[i % 3], "created_at": created.strftime("%Y-%m-%d %H:%M:%S"),
+            "tags": ["stub", f"batch-{i // 100}"]}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"       # keep-alive, so clients can reuse connections
+
+    def setup(self):
+        super().setup()
+        self.server.count("connections")
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body=None, headers=()):
+        data = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in headers:
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        srv = self.server
+        srv.enter()
+        try:
+            if srv.latency:
+                time.sleep(srv.latency)
+            fate = srv.fate()
+            if fate == "error":
+                return self._send(500, {"error": "stub failure"})
+            if fate == "throttle":
+                return self._send(429, {"error": "slow down"}, [("Retry-After", str(srv.retry_after))])
+            url = urlparse(self.path)
+            q = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            if "after" in q or "limit" in q:
+                after, limit = int(q.get("after", 0)), int(q.get("limit", 100))
+                ids = range(after + 1, min(after + limit, srv.rows) + 1)
+                nxt = f"http://{self.headers['Host']}{url.path}?after={ids[-1]}&limit={limit}" \
+                    if ids and ids[-1] < srv.rows else None
+                return self._send(200, {"data": [record(i) for i in ids], "next": nxt})
+            page, per_page = int(q.get("page", 1)), int(q.get("per_page", 100))
+            ids = range((page - 1) * per_page + 1, min(page * per_page, srv.rows) + 1)
+            self._send(200, {"data": [record(i) for i in ids], "page": page, "per_page": per_page,
+                             "total": srv.rows, "total_pages": -(-srv.rows // per_page)})
+        finally:
+            srv.leave()
+
+
+class StubAPI(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 0), rows=1000, latency=0.0, error_rate=0.0,
+                 throttle_rate=0.0, retry_after=0, seed=0):
+        super().__init__(address, _Handler)
+        self.rows, self.latency, self.retry_after = int(rows), float(latency), retry_after
+        self.error_rate, self.throttle_rate = float(error_rate), float(throttle_rate)
+        self._rng, self._lock, self._in_flight = random.Random(seed), threading.Lock(), 0
+        self.stats = {"requests": 0, "connections": 0, "errors": 0, "throttled": 0, "max_in_flight": 0}
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, key, n=1):
+        with self._lock:
+            self.stats[key] += n
+
+    def enter(self):
+        with self._lock:
+            self.stats["requests"] += 1
+            self._in_flight += 1
+            self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self._in_flight)
+
+    def leave(self):
+        with self._lock:
+            self._in_flight -= 1
+
+    def fate(self):
+        with self._lock:
+            r = self._rng.random()
+        if r < self.error_rate:
+            self.count("errors")
+            return "error"
+        if r < self.error_rate + self.throttle_rate:
+            self.count("throttled")
+            return "throttle"
+        return "ok"
+
+
+@contextmanager
+def serve(**options):
+    """Run a StubAPI on a free local port in a background thread; yields the server."""
+    srv = StubAPI(**options)
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield srv
+    finally:
+        srv.shutdown()
+        srv.server_close()
+        thread.join()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Local paginated JSON API stub")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--rows", type=int, default=5000)
+    ap.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with HTTP 500")
+    ap.add_argument("--throttle-rate", type=float, default=0.0, help="share answered with 429 + Retry-After")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+    srv = StubAPI(("127.0.0.1", args.port), args.rows, args.latency, args.error_rate, args.throttle_rate, seed=args.seed)
+    print(f"stub API on {srv.url}/orders?page=1&per_page=100 (Ctrl+C to stop)")
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        print("\n", srv.stats)
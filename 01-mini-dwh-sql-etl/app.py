@@ -1,56 +1,56 @@
-import os, sqlite3, pandas as pd, streamlit as st
+import os, pandas as pd, streamlit as st
 from pathlib import Path
+from dashboard_queries import cube_layout, cube_queries, run_queries
+from query_cache import QueryCache
+from db_pool import ReadOnlyPool
+from query_backend import get_backend
+from readiness import Warehouse
 
 # --- Robust DB path (absolute, next to this file) ---
 BASE_DIR = Path(__file__).resolve().parent
 DB_PATH = str(BASE_DIR / "mini_dwh.sqlite")
+DATA_DIR = BASE_DIR / "data"
+
+
+# --- Shared pool of read-only, tuned connections (one per process, thread-safe) ---
+@st.cache_resource
+def db_pool() -> ReadOnlyPool:
+    return ReadOnlyPool(DB_PATH, size=int(os.environ.get("DWH_POOL_SIZE", 4)))
+
+
+# --- Warehouse readiness: schema, data version and source CSVs are probed once per process;
+# a missing or outdated warehouse is built/refreshed by a background worker (readiness.py),
+# never inside a rerun, and sessions read the last committed one meanwhile
+@st.cache_resource
+def warehouse() -> Warehouse:
+    wh = Warehouse(DB_PATH, DATA_DIR)
+    wh.ensure()
+    return wh
+
+
+# Shared on-disk result cache: bounded in bytes, TTL'd, and keyed on the ETL's per-table
+# data version stamps, so a reload only invalidates the queries that read what changed
+@st.cache_resource
+def query_cache() -> QueryCache:
+    return QueryCache(
+        BASE_DIR / "query_cache.sqlite",
+        max_bytes=int(os.environ.get("DWH_QUERY_CACHE_BYTES", 64 << 20)),
+        ttl=float(os.environ.get("DWH_QUERY_CACHE_TTL", 3600)),
+    )
+
 
+# --- Query engine: DWH_BACKEND=sqlite (default) or duckdb, over the same tables and views ---
+@st.cache_resource
+def backend():
+    return get_backend(os.environ.get("DWH_BACKEND"), DB_PATH, pool=db_pool())
 
-# --- Helper: does the DB already have our tables? ---
-def _db_has_schema(db_path: str) -> bool:
-    try:
-        con = sqlite3.connect(db_path)
-        cur = con.cursor()
-        cur.execute(
-            """
-            SELECT name
-            FROM sqlite_master
-            WHERE type='table'
-              AND name IN ('fact_sales','dim_product','dim_customer')
-            """
+
+def sql_df(query: str, params: tuple = ()) -> pd.DataFrame:
+    engine = backend()
+    with db_pool().connection() as con:
+        return query_cache().get_or_load(
+            DB_PATH, query, tuple(params), lambda q, p: engine.query(q, p, con=con), src=con, tag=engine.name
         )
-        rows = cur.fetchall()
-        con.close()
-        # Expecting at least these 3 tables after ETL
-        return len(rows) >= 3
-    except Exception:
-        return False
-
-
-# Build DB on first run (or when schema is missing)
-if not _db_has_schema(DB_PATH):
-    import etl_pipeline as etl
-
-    etl.make_synthetic()
-    etl.fetch_api_sample()
-    etl.load_to_sqlite()
-    # Clear any cached queries and rerun once so the new tables are visible
-    try:
-        st.cache_data.clear()
-    except Exception:
-        pass
-    try:
-        st.rerun()
-    except Exception:
-        pass
-
-
-@st.cache_data
-def sql_df(query: str) -> pd.DataFrame:
-    con = sqlite3.connect(DB_PATH)
-    df = pd.read_sql(query, con)
-    con.close()
-    return df
 
 
 # ============ PREMIUM CONFIGURATION ============
@@ -60,6 +60,23 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
+wh = warehouse()
+if not wh.ready:
+    # first start: nothing to show until the build lands
+    if wh.error is not None and not wh.building:
+        st.error(f"Building the data warehouse failed: {wh.error}")
+        if st.button("Retry"):
+            wh.ensure()
+            st.rerun()
+        st.stop()
+    with st.spinner("Building the data warehouse (first run)…"):
+        wh.wait(timeout=5)
+    st.rerun()
+if wh.building:
+    st.info("Refreshing the data warehouse in the background; showing the last loaded data.", icon="🔄")
+elif wh.error is not None:
+    st.warning(f"The last warehouse refresh failed, showing the previous data: {wh.error}")
+
 # ============ MODERN STYLING ============
 st.markdown("""
 <style>
@@ -331,7 +348,7 @@ with st.expander("📊 Architecture Overview", expanded=False):
 st.markdown('<div class="filter-section">', unsafe_allow_html=True)
 st.markdown("### Filters")
 
-months_df = sql_df("SELECT DISTINCT substr(order_date,1,7) AS month FROM fact_sales ORDER BY 1;")
+months_df = sql_df("SELECT DISTINCT printf('%04d-%02d', month_key / 100, month_key % 100) AS month FROM dim_date ORDER BY 1;")
 cats_df = sql_df("SELECT DISTINCT category FROM dim_product ORDER BY 1;")
 pay_df = sql_df("SELECT DISTINCT payment_method FROM fact_sales ORDER BY 1;")
 
@@ -353,25 +370,24 @@ with fcol3:
 st.markdown('</div>', unsafe_allow_html=True)
 
 # ============ DATA PROCESSING ============
-base = sql_df("""
-    SELECT fs.*, dp.category, dp.subcategory
-    FROM fact_sales fs
-    JOIN dim_product dp ON dp.product_id = fs.product_id
-    WHERE fs.status IN ('completed','shipped')
-""")
-
-base = base[base["category"].isin(sel_cats) & base["payment_method"].isin(sel_pmts)]
-base["month"] = base["order_date"].str[:7]
-base = base[(base["month"] >= sel_range[0]) & (base["month"] <= sel_range[1])]
+# filters and aggregation run inside SQLite, over the precomputed agg_cube cells when the
+# selection is materialized there; only the small result sets come back
+# queries the cube cannot answer read only the fact partitions of the selected months
+parts = dict(sql_df("SELECT month_key, table_name FROM etl_partition WHERE state = 'online'").values.tolist())
+queries = cube_queries(sel_range, sel_cats, sel_pmts, cube_layout(sql_df), parts=parts)
+results = run_queries(queries, sql_df)
 
 # KPI calculations
-total_revenue = base["revenue"].sum()
-total_orders = base["order_id"].nunique()
+totals = results["totals"]
+total_revenue = float(totals["revenue"].iloc[0])
+total_orders = int(totals["orders"].iloc[0])
 avg_order_value = total_revenue / max(total_orders, 1)
+total_customers = int(results["customers"]["customers"].iloc[0])
 
-dq_nulls = sql_df("SELECT COUNT(*) AS issues FROM dq_nulls")
-dq_neg = sql_df("SELECT COUNT(*) AS issues FROM dq_negative_qty")
-dq_total = int(dq_nulls["issues"].iloc[0] + dq_neg["issues"].iloc[0])
+# DQ rules run once per ETL load (dq.py); read that run's summary instead of scanning the facts
+dq_results = sql_df("SELECT rule, table_name, severity, checked_rows, failed_rows FROM v_dq_latest ORDER BY rule")
+dq_failed = dict(zip(dq_results["rule"], dq_results["failed_rows"].astype(int)))
+dq_total = int(dq_results["failed_rows"].sum())
 
 # ============ METRIC CARDS ============
 st.markdown("### 📈 Key Performance Indicators")
@@ -397,11 +413,7 @@ for col, icon, label, value, css_class in metrics:
 st.markdown('<div class="section-header">📊 Revenue & Order Trends</div>', unsafe_allow_html=True)
 
 # Monthly trend
-kpi_f = base.groupby("month").agg(
-    orders=("order_id", "nunique"),
-    revenue=("revenue", "sum")
-).reset_index()
-kpi_f["aov"] = (kpi_f["revenue"] / kpi_f["orders"]).round(2)
+kpi_f = results["monthly"]
 
 if not kpi_f.empty:
     st.markdown('<div class="chart-container">', unsafe_allow_html=True)
@@ -420,12 +432,7 @@ if not kpi_f.empty:
 # ============ TOP PRODUCTS ============
 st.markdown('<div class="section-header">🏆 Top Performing Products</div>', unsafe_allow_html=True)
 
-top_f = (
-    base.groupby(["product_id", "category", "subcategory"])
-    .agg(revenue=("revenue", "sum"), orders=("order_id", "nunique"))
-    .reset_index()
-    .nlargest(10, "revenue")
-)
+top_f = results["top_products"]
 
 if not top_f.empty:
     col1, col2 = st.columns([2, 1])
@@ -447,10 +454,7 @@ if not top_f.empty:
 # ============ CATEGORY ANALYSIS ============
 st.markdown('<div class="section-header">🎯 Category Performance</div>', unsafe_allow_html=True)
 
-cat_f = base.groupby("category").agg(
-    revenue=("revenue", "sum"),
-    orders=("order_id", "nunique")
-).reset_index().sort_values("revenue", ascending=False)
+cat_f = results["category"]
 
 if not cat_f.empty:
     cat_f["pct"] = (100 * cat_f["revenue"] / cat_f["revenue"].sum()).round(2)
@@ -484,7 +488,7 @@ if not kpi_f.empty and not cat_f.empty:
         <strong>💡 Key Insights:</strong><br>
         • Highest revenue month: <strong>{best_month}</strong> (${best_month_rev:,.0f})<br>
         • Top category: <strong>{top_cat}</strong> contributing ${top_cat_rev:,.0f} ({100*top_cat_rev/total_revenue:.1f}%)<br>
-        • Average order value: <strong>${avg_order_value:,.2f}</strong> across {total_orders:,} orders
+        • Average order value: <strong>${avg_order_value:,.2f}</strong> across {total_orders:,} orders from {total_customers:,} customers
     </div>
     """, unsafe_allow_html=True)
 
@@ -499,26 +503,17 @@ with d2:
 
 # ============ RAW DATA ============
 
-DATA_DIR = BASE_DIR / "data"
-DATA_DIR.mkdir(exist_ok=True)  # ensure folder exists
-
+# the CSVs as the readiness probe last saw them: no filesystem checks on a rerun
+sources = wh.status["sources"]
 orders_path = DATA_DIR / "orders.csv"
 items_path = DATA_DIR / "order_items.csv"
 
-# --- Generate CSVs automatically if missing ---
-import etl_pipeline as etl
-
-if not orders_path.exists() or not items_path.exists():
-    etl.make_synthetic()  # this should create orders.csv & order_items.csv in DATA_DIR
-    etl.fetch_api_sample()
-    etl.load_to_sqlite()
-
 with st.expander("🔍 View Raw Data Samples"):
     tab1, tab2, tab3 = st.tabs(["📦 Orders", "📋 Order Items", "📊 Fact Table"])
     
     # --- Orders ---
     with tab1:
-        if orders_path.exists():
+        if sources["orders.csv"] is not None:
             raw_orders = pd.read_csv(orders_path, nrows=20, parse_dates=["order_date"])
             st.dataframe(raw_orders, use_container_width=True, height=400)
             st.download_button(
@@ -532,7 +527,7 @@ with st.expander("🔍 View Raw Data Samples"):
 
     # --- Order Items ---
     with tab2:
-        if items_path.exists():
+        if sources["order_items.csv"] is not None:
             raw_items = pd.read_csv(items_path, nrows=20)
             st.dataframe(raw_items, use_container_width=True, height=400)
             st.download_button(
@@ -558,14 +553,15 @@ with st.expander("🔍 View Raw Data Samples"):
 with st.expander("✅ Data Quality Monitoring"):
     st.markdown("""
     <div class="info-box">
-        <strong>Data Quality Checks:</strong> Automated views monitor data integrity throughout the pipeline.
+        <strong>Data Quality Checks:</strong> Rules evaluated after every ETL run monitor data integrity throughout the pipeline.
     </div>
     """, unsafe_allow_html=True)
     
     qcol1, qcol2, qcol3 = st.columns(3)
-    qcol1.metric("Null Value Issues", int(dq_nulls["issues"].iloc[0]))
-    qcol2.metric("Negative Quantity Issues", int(dq_neg["issues"].iloc[0]))
+    qcol1.metric("Null Value Issues", dq_failed.get("nulls", 0))
+    qcol2.metric("Negative Quantity Issues", dq_failed.get("negative_qty", 0))
     qcol3.metric("Total Quality Flags", dq_total)
+    st.dataframe(dq_results, use_container_width=True, hide_index=True)
     
     if dq_total == 0:
         st.success("✅ All data quality checks passed!")
@@ -0,0 +1,83 @@
+import math, re, sys
+from pathlib import Path
+from query_backend import get_backend
+from dashboard_queries import build_queries
+
+# Runs every query in queries.sql (plus the dashboard's own queries) on SQLite and
+# DuckDB and reports any that disagree. EXPLAIN statements are engine-specific and
+# skipped. Floats are compared with a tight relative tolerance, since the two engines
+# may sum in a different order; rows are compared as a multiset unless the query
+# orders them.
+BASE = Path(__file__).resolve().parent
+DB_PATH = BASE / "mini_dwh.sqlite"
+SQL_PATH = BASE / "queries.sql"
+REL_TOL = 1e-9
+
+
+def sql_statements(path=SQL_PATH):
+    for stmt in Path(path).read_text().split(";"):
+        body = "\n".join(l for l in stmt.splitlines() if not l.strip().startswith("--")).strip()
+        if body and not body.upper().startswith("EXPLAIN"):
+            yield body
+
+
+def _same(a, b):
+    if a is None or b is None or (isinstance(a, float) and math.isnan(a)) or (isinstance(b, float) and math.isnan(b)):
+        return (a is None or a != a) and (b is None or b != b)
+    if isinstance(a, (int, float)) and isinstance(b, (int, float)):
+        return math.isclose(a, b, rel_tol=REL_TOL, abs_tol=1e-9)
+    return a == b
+
+
+def _rows(df, ordered):
+    rows = [tuple(v.item() if hasattr(v, "item") else v for v in r) for r in df.itertuples(index=False, name=None)]
+    return rows if ordered else sorted(rows, key=repr)
+
+
+def compare(sql, params, left, right):
+    """None if both backends return the same result, else a short description."""
+    a, b = left.query(sql, params), right.query(sql, params)
+    if [c.lower() for c in a.columns] != [c.lower() for c in b.columns]:
+        return f"columns {list(a.columns)} != {list(b.columns)}"
+    if len(a) != len(b):
+        return f"{len(a)} rows != {len(b)} rows"
+    ordered = re.search(r"\border\s+by\b", sql, re.I) is not None
+    for i, (ra, rb) in enumerate(zip(_rows(a, ordered), _rows(b, ordered))):
+        if not all(_same(x, y) for x, y in zip(ra, rb)):
+            return f"row {i}: {ra} != {rb}"
+    return None
+
+
+def check_parity(db_path=DB_PATH, sql_path=SQL_PATH):
+    """Return [(sql, problem)] for every query whose results differ between engines."""
+    left, right = get_backend("sqlite", db_path), get_backend("duckdb", db_path)
+    try:
+        jobs = [(sql, ()) for sql in sql_statements(sql_path)]
+        months = [m for (m,) in left.query("SELECT DISTINCT printf('%04d-%02d', month_key / 100, month_key % 100) "
+                                            "FROM dim_date ORDER BY 1").itertuples(index=False)]
+        cats = list(left.query("SELECT DISTINCT category FROM dim_product")["category"])
+        pmts = list(left.query("SELECT DISTINCT payment_method FROM fact_sales")["payment_method"])
+        if months:
+            for sel in ((months[0], months[-1]), (months[0], months[0])):
+                for cat_sel in (cats, cats[:1], []):
+                    jobs += build_queries(sel, cat_sel, pmts).values()
+        failures = []
+        for sql, params in jobs:
+            try:
+                problem = compare(sql, params, left, right)
+            except Exception as e:
+                problem = f"{type(e).__name__}: {e}"
+            if problem:
+                failures.append((sql, problem))
+        return failures
+    finally:
+        left.close()
+        right.close()
+
+
+if __name__ == "__main__":
+    failures = check_parity(*sys.argv[1:2])
+    for sql, problem in failures:
+        print("✗", " ".join(sql.split())[:100], "\n   ", problem)
+    print("❌" if failures else "✅", f"{len(failures)} queries differ between sqlite and duckdb")
+    sys.exit(1 if failures else 0)
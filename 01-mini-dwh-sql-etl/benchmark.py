@@ -0,0 +1,151 @@
+import argparse, json, os, platform, resource, shutil, sqlite3, subprocess, sys, tempfile, time
+from contextlib import closing
+from pathlib import Path
+
+# Scale-factor benchmark of the whole pipeline. Like TPC-H, SF 1 is a fixed data volume
+# (~1M order items here) and every other factor scales it linearly. Each factor runs in
+# its own process against a scratch data dir / DB, so nothing in data/ is touched and
+# peak RSS is per factor. Timings are wall seconds, best of --repeat for queries.
+# dashboard.<selection>.<panel> times what the app runs (cube_queries over agg_cube and
+# the selected month partitions); the .exact series times the same panels on the facts.
+#
+#   python benchmark.py --sf 0.01 0.1 1 --out bench.json
+#   python benchmark.py --sf 0.01 0.1 --baseline bench.json --threshold 0.25
+BASE = Path(__file__).resolve().parent
+CUSTOMERS_PER_SF = 160_000          # ~6.2 items per customer with the generator's defaults
+DASHBOARD_SELECTIONS = {"all": None, "one_month": 1}
+
+
+def scale(sf):
+    return {"n_customers": max(int(CUSTOMERS_PER_SF * sf), 10),
+            "n_products": max(int(1000 * sf ** 0.5), 50)}
+
+
+def _best(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def run_factor(sf, repeat=3, backend="sqlite", workers=None):
+    """Generate, load and query one scale factor; meant to run in a fresh process whose
+    DWH_DATA_DIR / DWH_DB_PATH point at a scratch directory."""
+    import etl_pipeline as etl
+    from backend_parity import sql_statements
+    from dashboard_queries import build_queries, cube_layout, cube_queries
+    from query_backend import get_backend
+    import partitions
+
+    t, workers = {}, workers or etl.WORKERS
+    start = time.perf_counter()
+    counts = etl.make_synthetic(**scale(sf))
+    t["generate"] = time.perf_counter() - start
+
+    for mode in ("full", "incremental"):
+        start = time.perf_counter()
+        stats = etl.load_to_sqlite(mode, workers=workers)
+        t[f"load.{mode}"] = time.perf_counter() - start
+        t[f"load.{mode}.extract"] = sum(p["parse_seconds"] for p in stats["partitions"])
+        t.update({f"load.{mode}.{k}": v for k, v in stats["stages"].items()})
+
+    engine = get_backend(backend, etl.DB_PATH)
+    try:
+        engine.query("SELECT 1 FROM fact_sales LIMIT 1")      # DuckDB: copy the tables outside the timings
+        for i, sql in enumerate(sql_statements(), 1):
+            t[f"query.q{i:02d}"] = _best(lambda: engine.query(sql), repeat)
+        months = list(engine.query("SELECT DISTINCT printf('%04d-%02d', month_key / 100, month_key % 100) AS m "
+                                   "FROM dim_date ORDER BY 1")["m"])
+        cats = list(engine.query("SELECT DISTINCT category FROM dim_product")["category"])
+        pmts = list(engine.query("SELECT DISTINCT payment_method FROM fact_sales")["payment_method"])
+        layout = cube_layout(engine.query)
+        with closing(sqlite3.connect(etl.DB_PATH)) as con:
+            parts = partitions.online(con)
+        for label, span in DASHBOARD_SELECTIONS.items():
+            sel = (months[0], months[-1] if span is None else months[span - 1])
+            for name, (sql, params, *finish) in cube_queries(sel, cats, pmts, layout, parts=parts).items():
+                run = lambda: finish[0](engine.query(sql, params)) if finish else engine.query(sql, params)
+                t[f"dashboard.{label}.{name}"] = _best(run, repeat)
+            for name, (sql, params) in build_queries(sel, cats, pmts).items():
+                t[f"dashboard.{label}.{name}.exact"] = _best(lambda: engine.query(sql, params), repeat)
+    finally:
+        engine.close()
+
+    return {"sf": sf, "rows": counts, "db_bytes": etl.DB_PATH.stat().st_size,
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            "timings": t}
+
+
+def run_all(factors, repeat=3, backend="sqlite", workers=None, keep=False):
+    results = {}
+    for sf in factors:
+        scratch = Path(tempfile.mkdtemp(prefix=f"dwh-bench-sf{sf}-"))
+        env = {**os.environ, "DWH_DATA_DIR": str(scratch / "data"), "DWH_DB_PATH": str(scratch / "bench.sqlite")}
+        out = scratch / "result.json"
+        cmd = [sys.executable, str(Path(__file__).resolve()), "--_factor", str(sf), "--_out", str(out),
+               "--repeat", str(repeat), "--backend", backend] + (["--workers", str(workers)] if workers else [])
+        print(f"SF {sf}: {scale(sf)['n_customers']:,} customers ...", flush=True)
+        subprocess.run(cmd, env=env, cwd=BASE, check=True)
+        results[str(sf)] = json.loads(out.read_text())
+        if not keep:
+            shutil.rmtree(scratch, ignore_errors=True)
+    return {"meta": {"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+                     "sqlite": sqlite3.sqlite_version, "platform": platform.platform(),
+                     "cpus": os.cpu_count(), "backend": backend, "repeat": repeat},
+            "results": results}
+
+
+def compare(current, baseline, threshold=0.2, min_seconds=0.05):
+    """Return [(sf, metric, old, new)] for every timing more than `threshold` (relative)
+    and `min_seconds` (absolute, to ignore noise on tiny stages) slower than baseline."""
+    regressions = []
+    for sf, res in current["results"].items():
+        old = baseline.get("results", {}).get(sf, {}).get("timings", {})
+        for metric, new in res["timings"].items():
+            if metric in old and new > old[metric] * (1 + threshold) and new - old[metric] > min_seconds:
+                regressions.append((sf, metric, old[metric], new))
+    return regressions
+
+
+def _print(report):
+    for sf, res in report["results"].items():
+        rows = res["rows"]
+        print(f"\nSF {sf}: {rows['orders']:,} orders, {rows['items']:,} items, "
+              f"db {res['db_bytes'] / 2**20:,.1f} MiB, peak RSS {res['peak_rss_mb']:,.0f} MiB")
+        for metric, secs in res["timings"].items():
+            print(f"  {metric:<44} {secs:>10.4f}s")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Scale-factor benchmark of the mini DWH ETL and queries")
+    ap.add_argument("--sf", type=float, nargs="+", default=[0.01, 0.1], help="scale factors (SF 1 = ~1M order items)")
+    ap.add_argument("--repeat", type=int, default=3, help="query runs per timing (best is kept)")
+    ap.add_argument("--backend", default="sqlite", help="query engine for the query timings (sqlite or duckdb)")
+    ap.add_argument("--workers", type=int, help="ETL worker processes (default: etl_pipeline.WORKERS)")
+    ap.add_argument("--out", type=Path, help="write the results JSON here")
+    ap.add_argument("--baseline", type=Path, help="compare against a previous results JSON")
+    ap.add_argument("--threshold", type=float, default=0.2, help="allowed relative slowdown vs the baseline")
+    ap.add_argument("--min-seconds", type=float, default=0.05, help="ignore slowdowns smaller than this")
+    ap.add_argument("--keep", action="store_true", help="keep the scratch data dirs")
+    ap.add_argument("--_factor", type=float, help=argparse.SUPPRESS)
+    ap.add_argument("--_out", type=Path, help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args._factor is not None:
+        args._out.write_text(json.dumps(run_factor(args._factor, args.repeat, args.backend, args.workers)))
+        sys.exit(0)
+
+    report = run_all(args.sf, args.repeat, args.backend, args.workers, args.keep)
+    _print(report)
+    if args.out:
+        args.out.write_text(json.dumps(report, indent=2))
+        print("\nwrote", args.out)
+    if args.baseline:
+        regressions = compare(report, json.loads(args.baseline.read_text()), args.threshold, args.min_seconds)
+        for sf, metric, old, new in regressions:
+            print(f"❌ SF {sf} {metric}: {old:.4f}s -> {new:.4f}s ({new / old - 1:+.0%})")
+        if regressions:
+            sys.exit(1)
+        print(f"✅ no regressions beyond {args.threshold:.0%} vs {args.baseline}")
@@ -0,0 +1,106 @@
+import time, pandas as pd
+from contextlib import contextmanager
+import instrument
+
+# PRAGMAs applied for the duration of a load; the connection's previous values are
+# put back afterwards so the .sqlite file is left in its normal rollback-journal mode
+LOAD_PRAGMAS = {
+    "journal_mode": "WAL",      # or OFF for throwaway rebuilds
+    "synchronous": "OFF",
+    "cache_size": -262144,      # negative = KiB, i.e. a 256 MiB page cache
+    "temp_store": "MEMORY",
+}
+
+
+@contextmanager
+def load_pragmas(con, **overrides):
+    settings = {**LOAD_PRAGMAS, **overrides}
+    previous = {k: con.execute(f"PRAGMA {k}").fetchone()[0] for k in settings}
+    if con.in_transaction:
+        con.commit()
+    for k, v in settings.items():
+        con.execute(f"PRAGMA {k} = {v}")
+    try:
+        yield
+    finally:
+        # anything the caller did not commit is discarded, never half-applied
+        if con.in_transaction:
+            con.rollback()
+        for k, v in previous.items():
+            con.execute(f"PRAGMA {k} = {v}")
+
+
+@contextmanager
+def transaction(con):
+    # explicit BEGIN so several bulk inserts can share one commit; nested use joins the outer one
+    if con.in_transaction:
+        yield
+        return
+    con.execute("BEGIN")
+    try:
+        yield
+    except BaseException:
+        con.rollback()
+        raise
+    con.commit()
+
+
+class LoadReport:
+    def __init__(self):
+        self.tables = {}
+        self.indexes = {}
+        self.stages = {}        # stage name -> wall seconds, in the order the stages ran
+
+    @contextmanager
+    def stage(self, name):
+        # also an instrument.stage, so an active Run records it with CPU/RSS/IO figures
+        start = time.perf_counter()
+        try:
+            with instrument.stage(name) as st:
+                yield st
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    def add(self, table, rows, seconds):
+        t = self.tables.setdefault(table, {"rows": 0, "seconds": 0.0})
+        t["rows"] += rows
+        t["seconds"] += seconds
+
+    def summary(self):
+        return {table: {**t, "rows_per_sec": t["rows"] / t["seconds"] if t["seconds"] else 0.0}
+                for table, t in self.tables.items()}
+
+
+def frame_rows(df):
+    # datetimes -> the same 'YYYY-MM-DD HH:MM:SS' text to_sql writes; NaN binds as NULL
+    df = df.assign(**{c: df[c].dt.strftime("%Y-%m-%d %H:%M:%S")
+                      for c in df.select_dtypes("datetime").columns})
+    return df.itertuples(index=False, name=None)
+
+
+def bulk_insert(con, table, data, columns=None, report=None, or_ignore=False):
+    """Insert a DataFrame (or an iterable of tuples plus `columns`) with one prepared
+    executemany inside a single transaction; returns the number of rows written."""
+    start = time.perf_counter()
+    if isinstance(data, pd.DataFrame):
+        if data.empty:
+            return 0
+        columns, data = list(data.columns), frame_rows(data)
+    sql = (f"INSERT {'OR IGNORE ' if or_ignore else ''}INTO {table}({', '.join(columns)}) "
+           f"VALUES ({', '.join('?' * len(columns))})")
+    with transaction(con):
+        n = con.executemany(sql, data).rowcount
+    if report is not None:
+        report.add(table, n, time.perf_counter() - start)
+    return n
+
+
+def create_indexes(con, statements, report=None):
+    # run after the data is in: one sorted build per index instead of per-row b-tree updates
+    for sql in statements:
+        start = time.perf_counter()
+        with transaction(con):
+            con.execute(sql)
+        if report is not None:
+            name = sql.split(" ON ")[0].split()[-1]
+            report.indexes[name] = report.indexes.get(name, 0.0) + time.perf_counter() - start
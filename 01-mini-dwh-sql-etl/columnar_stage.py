@@ -0,0 +1,145 @@
+import json, os
+from pathlib import Path
+
+# Typed, compressed, month-partitioned copy of the order sources:
+#   data/stage/<orders|order_items>/month_key=yyyymm/<source file>-<part>.parquet
+# Every CSV is converted once (its stamp is kept in _manifest.json); loads, backfills
+# and the raw DQ checks then read only the columns and month partitions they need
+# instead of re-parsing text. Order items land in the month of their order.
+# pyarrow is optional: without Parquet support the stage is written as Arrow IPC
+# files, and without pyarrow at all the ETL keeps reading the CSVs.
+try:
+    import pyarrow as pa, pyarrow.dataset as ds
+except ImportError:
+    pa = ds = None
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+STAGE_DIR = Path(os.environ.get("DWH_DATA_DIR", Path(__file__).parent / "data")) / "stage"
+FORMAT = "parquet" if pq else "ipc" if pa else None
+AVAILABLE = FORMAT is not None
+SUFFIX = ".parquet" if FORMAT == "parquet" else ".arrow"
+COMPRESSION = next((c for c in ("zstd", "lz4") if pa and pa.Codec.is_available(c)), None)
+UNKNOWN_MONTH = 0     # items whose order is not staged (yet)
+
+if pa:
+    _codes = pa.dictionary(pa.int32(), pa.string())
+    SCHEMAS = {
+        "orders": pa.schema([("order_id", pa.int64()), ("customer_id", pa.int64()),
+                             ("order_date", pa.timestamp("s")),
+                             ("status", _codes), ("payment_method", _codes)]),
+        "order_items": pa.schema([("order_id", pa.int64()), ("product_id", pa.int64()),
+                                  ("quantity", pa.int64()), ("unit_price", pa.float64()),
+                                  ("discount", pa.float64())]),
+    }
+    PARTITIONING = ds.partitioning(pa.schema([("month_key", pa.int32())]), flavor="hive")
+
+
+def _require():
+    if not AVAILABLE:
+        raise RuntimeError("the columnar stage needs pyarrow (pip install pyarrow)")
+
+
+def _safe(source):
+    return source.replace("/", "__").replace("\\", "__")
+
+
+# --- manifest: source file (relative to data/) -> stamp it was staged from
+def _manifest_path(kind):
+    return STAGE_DIR / kind / "_manifest.json"
+
+def stamps(kind):
+    p = _manifest_path(kind)
+    return json.loads(p.read_text()) if p.exists() else {}
+
+def save_stamps(kind, values):
+    p = _manifest_path(kind)
+    p.parent.mkdir(parents=True, exist_ok=True)
+    tmp = p.with_name(".manifest.tmp")
+    tmp.write_text(json.dumps(values, indent=1, sort_keys=True))
+    os.replace(tmp, p)
+
+
+# --- writing
+def parts_of(kind, source):
+    return sorted((STAGE_DIR / kind).glob(f"month_key=*/{_safe(source)}-*{SUFFIX}"))
+
+def drop_source(kind, source):
+    for p in parts_of(kind, source):
+        p.unlink()
+
+def _write(table, path):
+    # leading dot: dataset discovery skips the file until it is complete and renamed
+    tmp = path.with_name(f".{path.name}.tmp")
+    if FORMAT == "parquet":
+        pq.write_table(table, tmp, compression=COMPRESSION or "none")
+    else:
+        options = pa.ipc.IpcWriteOptions(compression=COMPRESSION)
+        with pa.OSFile(str(tmp), "wb") as f, pa.ipc.new_file(f, table.schema, options=options) as w:
+            w.write_table(table)
+    os.replace(tmp, path)
+    return path.stat().st_size
+
+def write_parts(kind, source, df, part):
+    """Write one chunk of `source` (a path relative to data/) as one file per month;
+    `df` carries the typed columns plus month_key. Returns the bytes written."""
+    _require()
+    schema, nbytes = SCHEMAS[kind], 0
+    months = df["month_key"].fillna(UNKNOWN_MONTH).astype("int64")
+    for month, g in df.groupby(months, sort=True):
+        table = pa.Table.from_pandas(g[schema.names], schema=schema, preserve_index=False)
+        out = STAGE_DIR / kind / f"month_key={month}" / f"{_safe(source)}-{part:05d}{SUFFIX}"
+        out.parent.mkdir(parents=True, exist_ok=True)
+        nbytes += _write(table, out)
+    return nbytes
+
+
+# --- reading: projection + partition pruning + row-group predicate pushdown
+def dataset(kind):
+    _require()
+    (STAGE_DIR / kind).mkdir(parents=True, exist_ok=True)
+    return ds.dataset(STAGE_DIR / kind, format=FORMAT, partitioning=PARTITIONING)
+
+def _filter(months, where):
+    flt = None if months is None else ds.field("month_key").isin(sorted({int(m) for m in months}))
+    if where is not None:
+        flt = where if flt is None else flt & where
+    return flt
+
+def scan(kind, columns=None, months=None, where=None, batch_size=100_000):
+    """Yield pandas frames of a staged source, reading only `columns`, only the month
+    partitions in `months` (None = all) and only rows matching the pyarrow expression
+    `where`."""
+    batches = dataset(kind).to_batches(columns=columns, filter=_filter(months, where), batch_size=batch_size)
+    for batch in batches:
+        if batch.num_rows:
+            yield batch.to_pandas()
+
+def count(kind, months=None, where=None):
+    return dataset(kind).count_rows(filter=_filter(months, where))
+
+def order_months():
+    # order_id -> month_key, read from just those two columns of the staged orders
+    t = dataset("orders").to_table(columns=["order_id", "month_key"])
+    return t.to_pandas().set_index("order_id")["month_key"]
+
+def of_orders(order_ids):
+    # scan() `where` for the rows of the given order ids
+    return ds.field("order_id").isin(sorted(int(i) for i in order_ids))
+
+def has_unknown_month(kind):
+    return any((STAGE_DIR / kind / f"month_key={UNKNOWN_MONTH}").glob(f"*{SUFFIX}"))
+
+
+def dq_counts(months=None):
+    """Raw-layer counterparts of the dq_nulls / dq_negative_qty views, counted on the
+    stage before anything reaches SQLite."""
+    f = ds.field
+    return {
+        "null_keys": count("orders", months, f("order_id").is_null() | f("customer_id").is_null())
+                     + count("order_items", months, f("order_id").is_null() | f("product_id").is_null()),
+        "negative_qty": count("order_items", months, (f("quantity") < 0) | (f("unit_price") < 0)),
+        "orphan_items": count("order_items", [UNKNOWN_MONTH]) if months is None or UNKNOWN_MONTH in months else 0,
+    }
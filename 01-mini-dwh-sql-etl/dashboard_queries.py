@@ -0,0 +1,209 @@
+import os, pandas as pd
+import hll, partitions
+from aggregates import KPI_STATUSES, ROLLUP
+
+# Turns the dashboard's sidebar selections into parameterized, aggregated SQL so only
+# the small result sets behind each card/chart ever leave SQLite.
+#
+# Distinct counts the cube cannot add up exactly (customers, and orders for category
+# sets it does not materialize) come from HyperLogLog sketches merged in Python when
+# DWH_DISTINCT is "approx" (default); "exact" counts them on fact_sales instead.
+DISTINCT_MODES = ("approx", "exact")
+DISTINCT = os.environ.get("DWH_DISTINCT", "approx")
+
+_FROM = """
+    FROM {facts} fs
+    JOIN dim_product dp ON dp.product_sk = fs.product_sk
+    WHERE {where}"""
+
+
+def month_key(month):
+    # 'YYYY-MM' -> yyyymm; None for anything else so the range simply matches nothing
+    try:
+        y, m = str(month).split("-")
+        return int(y) * 100 + int(m)
+    except ValueError:
+        return None
+
+
+def filter_sql(sel_range, sel_cats, sel_pmts):
+    clauses, params = [f"fs.status IN {KPI_STATUSES}"], []
+    lo, hi = (month_key(m) for m in sel_range)
+    clauses.append("fs.month_key BETWEEN ? AND ?")
+    params += [lo, hi]
+    # an empty multiselect means "nothing selected", not "no filter"
+    for col, values in (("dp.category", sel_cats), ("fs.payment_method", sel_pmts)):
+        clauses.append(f"{col} IN ({', '.join('?' * len(values))})" if values else "0")
+        params += list(values)
+    return " AND ".join(clauses), tuple(params)
+
+
+def build_queries(sel_range, sel_cats, sel_pmts, top_n=10, parts=None):
+    """Return {name: (sql, params)} for the KPI cards, monthly trend, top products
+    and category breakdown under the given filters. With `parts` ({month_key: table}
+    of the online fact partitions) only the partitions in the month range are read."""
+    where, params = filter_sql(sel_range, sel_cats, sel_pmts)
+    facts = partitions.VIEW
+    if parts is not None:
+        lo, hi = (month_key(m) for m in sel_range)
+        facts = partitions.source(t for m, t in sorted(parts.items())
+                                  if m and lo is not None and hi is not None and lo <= m <= hi)
+    base = _FROM.format(facts=facts, where=where)
+    return {
+        "totals": (f"""
+    SELECT COALESCE(SUM(fs.revenue), 0) AS revenue,
+           COUNT(DISTINCT fs.order_id) AS orders{base}""", params),
+        "monthly": (f"""
+    SELECT printf('%04d-%02d', fs.month_key / 100, fs.month_key % 100) AS month,
+           COUNT(DISTINCT fs.order_id) AS orders,
+           SUM(fs.revenue) AS revenue,
+           ROUND(SUM(fs.revenue) / COUNT(DISTINCT fs.order_id), 2) AS aov{base}
+    GROUP BY fs.month_key
+    ORDER BY fs.month_key""", params),
+        "top_products": (f"""
+    SELECT fs.product_id, dp.category, dp.subcategory,
+           SUM(fs.revenue) AS revenue,
+           COUNT(DISTINCT fs.order_id) AS orders{base}
+    GROUP BY fs.product_id, dp.category, dp.subcategory
+    ORDER BY revenue DESC
+    LIMIT {int(top_n)}""", params),
+        "category": (f"""
+    SELECT dp.category,
+           SUM(fs.revenue) AS revenue,
+           COUNT(DISTINCT fs.order_id) AS orders{base}
+    GROUP BY dp.category
+    ORDER BY revenue DESC""", params),
+        "customers": (f"""
+    SELECT COUNT(DISTINCT fs.customer_id) AS customers{base}""", params),
+    }
+
+
+def cube_layout(run_sql):
+    """Read what agg_cube materializes, via run_sql(sql) -> DataFrame: the category bits,
+    the category sets present and the payment methods. None when the cube is empty."""
+    bits = run_sql("SELECT category, bit FROM agg_cube_category")
+    if bits.empty:
+        return None
+    sets = run_sql(f"SELECT DISTINCT category_set FROM agg_cube "
+                   f"WHERE month_key = 0 AND status = '{ROLLUP}' AND payment_method = '{ROLLUP}'")
+    pmts = run_sql(f"SELECT DISTINCT payment_method FROM agg_cube WHERE payment_method <> '{ROLLUP}'")
+    return {"bits": dict(zip(bits["category"], bits["bit"].astype(int))),
+            "sets": set(sets["category_set"].astype(int)),
+            "payments": set(pmts["payment_method"])}
+
+
+def merge_sketches(df, by=()):
+    """Collapse rows of (*by, sums..., *_hll blobs) to one row per `by` value: the other
+    columns are added up and every <name>_hll column becomes the distinct count <name>
+    of its merged sketches. Without `by` there is always exactly one row."""
+    by = list(by)
+    groups = df.groupby(by, sort=True) if by else [((), df)]
+    rows = []
+    for key, g in groups:
+        row = dict(zip(by, key if isinstance(key, tuple) else (key,)))
+        for col in df.columns.difference(by, sort=False):
+            if col.endswith("_hll"):
+                row[col[:-4]] = hll.count_blobs(g[col])
+            else:
+                row[col] = g[col].sum()
+        rows.append(row)
+    return pd.DataFrame(rows, columns=by + [c[:-4] if c.endswith("_hll") else c
+                                            for c in df.columns.difference(by, sort=False)])
+
+
+def _monthly_from_sketches(df):
+    out = merge_sketches(df, ["month"])
+    orders = out["orders"].astype(float)
+    out["aov"] = (out["revenue"].astype(float) / orders.where(orders > 0)).round(2)
+    return out[["month", "orders", "revenue", "aov"]]
+
+
+def run_queries(queries, run_sql):
+    """Run build_queries/cube_queries output through run_sql(sql, params) -> DataFrame;
+    entries with a third element pass their result through it (sketch merging)."""
+    out = {}
+    for name, (sql, params, *finish) in queries.items():
+        df = run_sql(sql, params)
+        out[name] = finish[0](df) if finish else df
+    return out
+
+
+def cube_queries(sel_range, sel_cats, sel_pmts, layout, top_n=10, distinct=None, parts=None):
+    """Same result sets as build_queries, answered from the agg_cube* tables by summing
+    a few precomputed cells. Without `layout` (cube_layout) everything falls back to
+    build_queries (with `parts`); so do unmaterialized category sets and customers in exact mode."""
+    distinct = distinct or DISTINCT
+    if distinct not in DISTINCT_MODES:
+        raise ValueError(f"unknown distinct mode {distinct!r}; expected one of {DISTINCT_MODES}")
+    cats = list(sel_cats)
+    exact = build_queries(sel_range, sel_cats, sel_pmts, top_n, parts)
+    if layout is None or any(c not in layout["bits"] for c in cats):
+        return exact
+    mask = sum(layout["bits"][c] for c in set(cats))
+    materialized = not mask or mask in layout["sets"]
+
+    lo, hi = (month_key(m) for m in sel_range)
+    # every payment method selected: agg_cube's payment rollup replaces summing them
+    rollup = [ROLLUP] if sel_pmts and set(sel_pmts) >= layout["payments"] else list(sel_pmts)
+
+    def where(a, pmts):
+        pmt = f"{a}payment_method IN ({', '.join('?' * len(pmts))})" if pmts else "0"
+        return f"{a}status IN {KPI_STATUSES} AND {a}month_key BETWEEN ? AND ? AND {pmt}", (lo, hi, *pmts)
+
+    cube_where, params = where("", rollup)
+    cells = f"""
+    FROM agg_cube
+    WHERE {cube_where} AND category_set = ?"""
+    # single-category cells of the selection, the ones carrying sketches
+    singles = f"""
+    FROM agg_cube
+    WHERE {cube_where} AND category_set & ? AND category_set & (category_set - 1) = 0"""
+    product_where, product_params = where("cp.", list(sel_pmts))
+    cat_sql = f"dp.category IN ({', '.join('?' * len(cats))})" if cats else "0"
+    queries = {
+        "totals": (f"""
+    SELECT COALESCE(SUM(revenue), 0) AS revenue,
+           COALESCE(SUM(orders), 0) AS orders{cells}""", params + (mask,)),
+        "monthly": (f"""
+    SELECT printf('%04d-%02d', month_key / 100, month_key % 100) AS month,
+           SUM(orders) AS orders,
+           SUM(revenue) AS revenue,
+           ROUND(SUM(revenue) / SUM(orders), 2) AS aov{cells}
+    GROUP BY month_key
+    ORDER BY month_key""", params + (mask,)),
+        "top_products": (f"""
+    SELECT cp.product_id, dp.category, dp.subcategory,
+           SUM(cp.revenue) AS revenue,
+           SUM(cp.orders) AS orders
+    FROM agg_cube_product cp
+    JOIN dim_product dp ON dp.product_sk = cp.product_sk
+    WHERE {product_where}
+      AND {cat_sql}
+    GROUP BY cp.product_id, dp.category, dp.subcategory
+    ORDER BY revenue DESC
+    LIMIT {int(top_n)}""", product_params + tuple(cats)),
+        "category": (f"""
+    SELECT cc.category,
+           SUM(c.revenue) AS revenue,
+           SUM(c.orders) AS orders
+    FROM agg_cube c
+    JOIN agg_cube_category cc ON cc.bit = c.category_set
+    WHERE {where("c.", rollup)[0]}
+      AND c.category_set & ?
+    GROUP BY cc.category
+    ORDER BY revenue DESC""", params + (mask,)),
+        "customers": (f"""
+    SELECT customers_hll{singles}""", params + (mask,), merge_sketches),
+    }
+    if distinct == "exact":
+        queries["customers"] = exact["customers"]
+        if not materialized:
+            queries.update(totals=exact["totals"], monthly=exact["monthly"])
+    elif not materialized:
+        queries.update(
+            totals=(f"""
+    SELECT revenue, orders_hll{singles}""", params + (mask,), merge_sketches),
+            monthly=(f"""
+    SELECT printf('%04d-%02d', month_key / 100, month_key % 100) AS month,
+           revenue, orders_hll{singles}""", params + (mask,), _monthly_from_sketches))
+    return queries
@@ -0,0 +1,88 @@
+import sqlite3, threading, time
+from contextlib import contextmanager
+from pathlib import Path
+
+# Read-only connections tuned for dashboard reads. Each one is opened once and reused,
+# so the file open, schema parse and page cache survive across queries and sessions.
+READ_PRAGMAS = {
+    "query_only": "ON",
+    "mmap_size": 256 << 20,      # bytes of the DB file memory-mapped
+    "cache_size": -65536,        # negative = KiB, i.e. 64 MiB of page cache per connection
+    "temp_store": "MEMORY",
+}
+
+
+class ReadOnlyPool:
+    def __init__(self, db_path, size=4, timeout=30.0, **pragmas):
+        self.db_path, self.size, self.timeout = Path(db_path), int(size), float(timeout)
+        self.pragmas = {**READ_PRAGMAS, **pragmas}
+        self._idle = []                  # LIFO: the most recently used (warmest) connection goes out first
+        self._cond = threading.Condition()
+        self._stats = {"created": 0, "acquired": 0, "waits": 0, "wait_seconds": 0.0, "discarded": 0}
+        self._in_use = 0
+
+    def _open(self):
+        con = sqlite3.connect(f"{self.db_path.resolve().as_uri()}?mode=ro", uri=True,
+                              timeout=self.timeout, check_same_thread=False)
+        for k, v in self.pragmas.items():
+            con.execute(f"PRAGMA {k} = {v}")
+        return con
+
+    def _acquire(self):
+        with self._cond:
+            start = time.perf_counter()
+            waited = False
+            while not self._idle and self._in_use + len(self._idle) >= self.size:
+                waited = True
+                if not self._cond.wait(self.timeout - (time.perf_counter() - start)):
+                    raise TimeoutError(f"no free connection to {self.db_path} after {self.timeout}s")
+            if waited:
+                self._stats["waits"] += 1
+                self._stats["wait_seconds"] += time.perf_counter() - start
+            self._in_use += 1
+            self._stats["acquired"] += 1
+            if self._idle:
+                return self._idle.pop()
+        try:
+            con = self._open()
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._stats["created"] += 1
+        return con
+
+    def _release(self, con, broken):
+        with self._cond:
+            self._in_use -= 1
+            if broken:
+                self._stats["discarded"] += 1
+                con.close()
+            else:
+                self._idle.append(con)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        con = self._acquire()
+        broken = False
+        try:
+            yield con
+        except sqlite3.DatabaseError:
+            # e.g. the file was replaced underneath us; don't hand this one out again
+            broken = True
+            raise
+        finally:
+            self._release(con, broken)
+
+    def stats(self):
+        with self._cond:
+            return {**self._stats, "size": self.size, "in_use": self._in_use, "idle": len(self._idle)}
+
+    def close(self):
+        with self._cond:
+            for con in self._idle:
+                con.close()
+            self._idle.clear()
@@ -0,0 +1,148 @@
+import os, time
+from concurrent.futures import ThreadPoolExecutor
+from bulk_load import transaction
+from db_pool import ReadOnlyPool
+import partitions
+
+# Data-quality rules, evaluated once per ETL run and stored in dq_results, so readers
+# get a precomputed summary (v_dq_latest) instead of rescanning the facts.
+#
+# RULES flag individual rows: name -> (table, severity, predicate). All rules of a table
+# are fused into one pass of SUM(CASE WHEN ...) columns, and a large table is split into
+# rowid ranges scanned in parallel on read-only connections (SQLite releases the GIL
+# while it steps, so threads are enough); fact_sales is scanned partition by partition.
+# Each rule also gets a dq_<name> view of its
+# failing rows for drill-down. CHECKS reconcile whole tables: name -> (table, severity,
+# sql returning one (checked_rows, failed_rows) row).
+RULES = {
+    "nulls": ("fact_sales", "error", "order_id IS NULL OR customer_id IS NULL OR product_id IS NULL"),
+    "negative_qty": ("fact_sales", "error", "quantity < 0 OR unit_price < 0"),
+    "revenue_mismatch": ("fact_sales", "error",
+                         "ABS(revenue - quantity * unit_price * (1 - COALESCE(discount, 0))) > 0.001"),
+    "orphan_orders": ("fact_sales", "error",
+                      "NOT EXISTS (SELECT 1 FROM stg_orders o WHERE o.order_id = fact_sales.order_id)"),
+    "missing_date": ("fact_sales", "warn", "date_key IS NULL"),
+    "unresolved_dimension": ("fact_sales", "warn", "product_sk IS NULL OR customer_sk IS NULL"),
+    "discount_range": ("fact_sales", "warn", "discount < 0 OR discount > 1"),
+    "order_null_keys": ("stg_orders", "error", "order_id IS NULL OR customer_id IS NULL OR order_date IS NULL"),
+    "unknown_status": ("stg_orders", "warn",
+                       "status IS NULL OR status NOT IN ('completed','shipped','cancelled')"),
+    "product_attributes": ("dim_product", "warn", "category IS NULL OR price IS NULL OR price <= 0"),
+}
+
+CHECKS = {
+    "fact_rows": ("fact_sales", "error", """
+      SELECT (SELECT COUNT(*) FROM stg_order_items),
+             ABS((SELECT COUNT(*) FROM fact_sales) - (SELECT COUNT(*) FROM stg_order_items)
+                 + (SELECT COALESCE(SUM(rows), 0) FROM etl_partition WHERE state = 'archived'))"""),
+    "duplicate_orders": ("stg_orders", "error", """
+      SELECT COUNT(*), COUNT(order_id) - COUNT(DISTINCT order_id) FROM stg_orders"""),
+    "aggregates_match": ("agg_sales_month", "error", """
+      SELECT COUNT(*), COALESCE(SUM(f.revenue IS NULL OR ABS(a.revenue - f.revenue) > 0.01), 0)
+      FROM agg_sales_month a
+      LEFT JOIN (SELECT month_key, SUM(revenue) AS revenue FROM fact_sales
+                 WHERE status IN ('completed','shipped') GROUP BY month_key) f USING(month_key)
+      WHERE a.month_key NOT IN (SELECT month_key FROM etl_partition WHERE state = 'archived')"""),
+}
+
+PARTITION_ROWS = 250_000        # rows per parallel scan of one table
+WORKERS = min(4, os.cpu_count() or 1)
+KEEP_RUNS = 50                  # dq_results keeps the most recent runs only
+
+RESULTS_DDL = """
+  CREATE TABLE IF NOT EXISTS dq_results(
+    run_id TEXT NOT NULL,
+    rule TEXT NOT NULL,
+    table_name TEXT,
+    severity TEXT,
+    checked_rows INTEGER,
+    failed_rows INTEGER,
+    seconds REAL,
+    checked_at TEXT,
+    PRIMARY KEY (run_id, rule)
+  )"""
+LATEST_VIEW = """
+  CREATE VIEW IF NOT EXISTS v_dq_latest AS
+    SELECT rule, table_name, severity, checked_rows, failed_rows, seconds, checked_at
+    FROM dq_results
+    WHERE run_id = (SELECT run_id FROM dq_results ORDER BY checked_at DESC, run_id DESC LIMIT 1)"""
+
+
+def create_views(cur):
+    """dq_results, v_dq_latest and one dq_<rule> view of failing rows per rule."""
+    cur.executescript(f"{RESULTS_DDL};\n{LATEST_VIEW};\n" + "".join(
+        f"CREATE VIEW IF NOT EXISTS dq_{name} AS SELECT * FROM {table} WHERE {pred};\n"
+        for name, (table, _, pred) in RULES.items()))
+
+
+def drop_views(cur):
+    cur.executescript("".join(f"DROP VIEW IF EXISTS dq_{name};\n" for name in RULES))
+
+
+def _scan(pool, table, part, names, lo, hi):
+    # part is the physical table; aliased to `table` so the rules can name it
+    sums = ", ".join(f"SUM(CASE WHEN {RULES[n][2]} THEN 1 ELSE 0 END)" for n in names)
+    start = time.perf_counter()
+    with pool.connection() as con:
+        row = con.execute(f"SELECT COUNT(*), {sums} FROM {part} AS {table} WHERE rowid BETWEEN ? AND ?",
+                          (lo, hi)).fetchone()
+    return table, [v or 0 for v in row], time.perf_counter() - start
+
+
+def _check(pool, name):
+    start = time.perf_counter()
+    with pool.connection() as con:
+        checked, failed = con.execute(CHECKS[name][2]).fetchone()
+    return name, checked, failed, time.perf_counter() - start
+
+
+def evaluate(db_path, workers=WORKERS, partition_rows=PARTITION_ROWS):
+    """Run every rule and check against the warehouse at db_path; returns one dict per
+    rule: rule, table_name, severity, checked_rows, failed_rows, seconds."""
+    by_table = {}
+    for name, (table, _, _) in RULES.items():
+        by_table.setdefault(table, []).append(name)
+    pool = ReadOnlyPool(db_path, size=max(int(workers), 1))
+    try:
+        with pool.connection() as con:
+            parts = {partitions.VIEW: [t for (t,) in con.execute(
+                "SELECT table_name FROM etl_partition WHERE state = 'online'")]}
+            bounds = {(t, p): con.execute(f"SELECT MIN(rowid), MAX(rowid) FROM {p}").fetchone()
+                      for t in by_table for p in parts.get(t, [t])}
+        with ThreadPoolExecutor(max(int(workers), 1)) as ex:
+            scans = [ex.submit(_scan, pool, t, p, by_table[t], a, min(a + partition_rows - 1, hi))
+                     for (t, p), (lo, hi) in bounds.items() if lo is not None
+                     for a in range(lo, hi + 1, partition_rows)]
+            checks = [ex.submit(_check, pool, name) for name in CHECKS]
+            totals = {t: [0] * (len(names) + 1) for t, names in by_table.items()}
+            seconds = dict.fromkeys(by_table, 0.0)
+            for f in scans:
+                table, row, secs = f.result()
+                totals[table] = [a + b for a, b in zip(totals[table], row)]
+                seconds[table] += secs
+            checked = [f.result() for f in checks]
+    finally:
+        pool.close()
+    # a fused pass costs the same for each of its rules, so each row carries the pass time
+    results = [{"rule": n, "table_name": t, "severity": RULES[n][1], "checked_rows": totals[t][0],
+                "failed_rows": totals[t][i + 1], "seconds": seconds[t]}
+               for t, names in by_table.items() for i, n in enumerate(names)]
+    results += [{"rule": n, "table_name": CHECKS[n][0], "severity": CHECKS[n][1], "checked_rows": c,
+                 "failed_rows": f, "seconds": s} for n, c, f, s in checked]
+    return results
+
+
+def record(con, run_id, results, keep_runs=KEEP_RUNS):
+    """Store one run's results in dq_results and drop runs older than the last keep_runs."""
+    now = time.strftime("%Y-%m-%d %H:%M:%S")
+    with transaction(con):
+        con.execute(RESULTS_DDL)
+        con.executemany(
+            "INSERT OR REPLACE INTO dq_results VALUES (:run_id, :rule, :table_name, :severity, :checked_rows,"
+            " :failed_rows, :seconds, :checked_at)",
+            [{**r, "run_id": run_id, "checked_at": now} for r in results])
+        con.execute("""
+          DELETE FROM dq_results WHERE run_id NOT IN (
+            SELECT run_id FROM dq_results GROUP BY run_id ORDER BY MAX(checked_at) DESC, run_id DESC LIMIT ?)""",
+                    (keep_runs,))
+    return results
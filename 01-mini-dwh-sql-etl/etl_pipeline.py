@@ -1,168 +1,951 @@
-import sqlite3, pandas as pd, requests
+import hashlib, itertools, os, sqlite3, time, pandas as pd
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from bulk_load import LoadReport, bulk_insert, create_indexes, load_pragmas, transaction
+from aggregates import AGG_TABLES, refresh_aggregates
+import api_extract, columnar_stage, dq, instrument, partitions
+from query_cache import bump_data_version
 
-DATA_DIR = Path(__file__).parent / "data"
+# DWH_DATA_DIR / DWH_DB_PATH point a run somewhere else (e.g. the benchmark's scratch dir)
+DATA_DIR = Path(os.environ.get("DWH_DATA_DIR", Path(__file__).parent / "data"))
 ASSETS = Path(__file__).parent / "assets"
-DB_PATH = Path(__file__).parent / "mini_dwh.sqlite"
+DB_PATH = Path(os.environ.get("DWH_DB_PATH", Path(__file__).parent / "mini_dwh.sqlite"))
 
 DATA_DIR.mkdir(parents=True, exist_ok=True)
 ASSETS.mkdir(parents=True, exist_ok=True)
 
-def make_synthetic():
+# customers per generated block: every block draws from its own seeded stream, so a
+# given (seed, scale) always produces the same files and memory stays flat at any scale
+SYN_BLOCK = 50_000
+
+@instrument.timed()
+def make_synthetic(n_customers=400, n_products=50, months=9, items_per_order=5, seed=42):
     import numpy as np
-    rng = np.random.default_rng(42)
-
-    products = pd.DataFrame({
-        "product_id": range(1, 51),
-        "category": rng.choice(["Beverages","Snacks","Electronics","Home"], 50),
-        "subcategory": rng.choice(["Premium","Budget","Organic","Standard"], 50),
-        "price": rng.integers(50, 2000, 50).astype(float)
-    }).drop_duplicates(subset=["product_id"])
-    products.to_csv(DATA_DIR/"products.csv", index=False)
-
-    customers = pd.DataFrame({
-        "customer_id": range(1, 401),
-        "signup_date": pd.date_range("2024-01-01", periods=400, freq="D"),
-        "city": rng.choice(["Delhi","Mumbai","Bengaluru","Chandigarh","Jaipur"], 400),
-        "state": rng.choice(["DL","MH","KA","PB","RJ"], 400)
-    })
-    customers.to_csv(DATA_DIR/"customers.csv", index=False)
-
-    orders, items = [], []
-    order_id = 1
-    for cid in customers["customer_id"]:
-        n_orders = int(rng.integers(0, 5))
-        for _ in range(n_orders):
-            od = pd.Timestamp("2024-01-01") + pd.Timedelta(days=int(rng.integers(0, 270)))
-            status = rng.choice(["completed","shipped","cancelled"], p=[0.7,0.2,0.1])
-            payment = rng.choice(["UPI","Card","COD"])
-            orders.append([order_id, cid, od, status, payment])
-
-            n_items = int(rng.integers(1, 6))
-            for _ in range(n_items):
-                pid = int(rng.integers(1, 51))
-                qty = int(rng.integers(1, 4))
-                price = float(products.loc[products.product_id==pid, "price"].sample(1, random_state=42).iloc[0])
-                disc = float(rng.choice([0,0.05,0.1,0.2], p=[0.5,0.2,0.2,0.1]))
-                items.append([order_id, pid, qty, price, disc])
-            order_id += 1
-
-    pd.DataFrame(orders, columns=["order_id","customer_id","order_date","status","payment_method"]) \
-      .to_csv(DATA_DIR/"orders.csv", index=False)
-    pd.DataFrame(items, columns=["order_id","product_id","quantity","unit_price","discount"]) \
-      .to_csv(DATA_DIR/"order_items.csv", index=False)
+    rng = np.random.default_rng(seed)
+
+    with instrument.stage("synthetic.products") as st:
+        products = pd.DataFrame({
+            "product_id": np.arange(1, n_products + 1),
+            "category": rng.choice(["Beverages","Snacks","Electronics","Home"], n_products),
+            "subcategory": rng.choice(["Premium","Budget","Organic","Standard"], n_products),
+            "price": rng.integers(50, 2000, n_products).astype(float)
+        })
+        products.to_csv(DATA_DIR/"products.csv", index=False)
+        st.rows_out = n_products
+    prices = products["price"].to_numpy()
+
+    start = np.datetime64("2024-01-01")
+    days = max(int(months * 30), 1)
+    out = {
+        "customers.csv": ["customer_id","signup_date","city","state"],
+        "orders.csv": ["order_id","customer_id","order_date","status","payment_method"],
+        "order_items.csv": ["order_id","product_id","quantity","unit_price","discount"],
+    }
+    for name, cols in out.items():
+        pd.DataFrame(columns=cols).to_csv(DATA_DIR/name, index=False)
+
+    n_orders = n_items = 0
+    for block, lo in enumerate(range(1, n_customers + 1, SYN_BLOCK)):
+        r = np.random.default_rng([seed, block])
+        cid = np.arange(lo, min(lo + SYN_BLOCK, n_customers + 1))
+
+        pd.DataFrame({
+            "customer_id": cid,
+            # one signup per day, wrapping every ten years so huge scales stay in range
+            "signup_date": start + ((cid - 1) % 3650).astype("timedelta64[D]"),
+            "city": r.choice(["Delhi","Mumbai","Bengaluru","Chandigarh","Jaipur"], len(cid)),
+            "state": r.choice(["DL","MH","KA","PB","RJ"], len(cid))
+        }).to_csv(DATA_DIR/"customers.csv", mode="a", header=False, index=False)
 
+        per_customer = r.integers(0, 5, len(cid))
+        k = int(per_customer.sum())
+        oid = np.arange(n_orders + 1, n_orders + k + 1)
+        pd.DataFrame({
+            "order_id": oid,
+            "customer_id": np.repeat(cid, per_customer),
+            "order_date": start + r.integers(0, days, k).astype("timedelta64[D]"),
+            "status": r.choice(["completed","shipped","cancelled"], k, p=[0.7,0.2,0.1]),
+            "payment_method": r.choice(["UPI","Card","COD"], k)
+        }).to_csv(DATA_DIR/"orders.csv", mode="a", header=False, index=False)
+
+        per_order = r.integers(1, items_per_order + 1, k)
+        m = int(per_order.sum())
+        pid = r.integers(1, n_products + 1, m)
+        pd.DataFrame({
+            "order_id": np.repeat(oid, per_order),
+            "product_id": pid,
+            "quantity": r.integers(1, 4, m),
+            "unit_price": prices[pid - 1],
+            "discount": r.choice([0,0.05,0.1,0.2], m, p=[0.5,0.2,0.2,0.1])
+        }).to_csv(DATA_DIR/"order_items.csv", mode="a", header=False, index=False)
+
+        n_orders += k
+        n_items += m
+    instrument.annotate(rows_out=n_customers + n_products + n_orders + n_items)
+    return {"customers": n_customers, "products": n_products, "orders": n_orders, "items": n_items}
+
+@instrument.timed()
 def fetch_api_sample():
-    # tiny API example -> creates a small CSV
+    # tiny API example -> creates a small CSV (retried with backoff, "demo" if still unreachable)
+    instrument.annotate(rows_out=1)
     try:
-        j = requests.get("https://httpbin.org/json", timeout=5).json()
-        pd.DataFrame([{"sample_title": j.get("slideshow",{}).get("title","demo")}]) \
-          .to_csv(DATA_DIR/"api_sample.csv", index=False)
-    except Exception:
-        pd.DataFrame([{"sample_title":"demo"}]).to_csv(DATA_DIR/"api_sample.csv", index=False)
+        j = api_extract.get_json("https://httpbin.org/json", retries=2, timeout=5)
+        title = j.get("slideshow", {}).get("title", "demo")
+    except Exception as e:
+        print(f"⚠️  API sample unavailable, using the demo row ({e})")
+        instrument.annotate(fallback=str(e))
+        title = "demo"
+    pd.DataFrame([{"sample_title": title}]).to_csv(DATA_DIR/"api_sample.csv", index=False)
 
-def load_to_sqlite():
-    con = sqlite3.connect(DB_PATH)
-    cur = con.cursor()
+SOURCES = ["products.csv", "customers.csv", "orders.csv", "order_items.csv"]
+ORDER_COLS = ["order_id", "customer_id", "order_date", "status", "payment_method"]
+ITEM_COLS = ["order_id", "product_id", "quantity", "unit_price", "discount"]
+STAGE_DDL = {
+    "orders": "(order_id INTEGER, customer_id INTEGER, order_date TEXT, status TEXT, payment_method TEXT)",
+    "order_items": "(order_id INTEGER, product_id INTEGER, quantity INTEGER, unit_price REAL, discount REAL)",
+}
+
+WAREHOUSE_TABLES = ["dim_product", "dim_customer", "dim_date", "fact_sales", "etl_partition",
+                    "stg_orders", "stg_order_items", *AGG_TABLES]
+
+# secondary indexes, built only once the tables are populated
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS ix_stg_orders_order_id ON stg_orders(order_id)",
+    "CREATE INDEX IF NOT EXISTS ix_stg_order_items_order_id ON stg_order_items(order_id)",
+    # the fact build reads one month of orders at a time
+    "CREATE INDEX IF NOT EXISTS ix_stg_orders_order_date ON stg_orders(order_date)",
+    "CREATE INDEX IF NOT EXISTS ix_dim_date_month ON dim_date(month_key)",
+]
+
+# rows per streamed chunk: peak memory of a load is roughly chunk_rows x row width,
+# independent of file size
+CHUNK_ROWS = 100_000
+# first month of the fiscal year in dim_date (April: FY2025 runs Apr 2024 - Mar 2025)
+FISCAL_YEAR_START = 4
+# SCD type 2 dimensions: table -> (natural key, surrogate key, source). Every change of a
+# row's attributes closes its current version (valid_to = the load's as-of date) and opens
+# a new one; a key's first version is valid from SCD_START, so it covers all older facts.
+# Facts carry the surrogate key of the version valid on their order date.
+SCD2 = {"dim_product": ("product_id", "product_sk", "products.csv"),
+        "dim_customer": ("customer_id", "customer_sk", "customers.csv")}
+SCD_START, SCD_END = "1900-01-01", "9999-12-31"
+
+def _file_checksum(path, block=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(block), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+# partitioned drops (data/orders/*.csv, data/order_items/*.csv, e.g. orders/2024-06-14.csv)
+# are loaded alongside the single data/<source>.csv; each partition file is parsed by
+# one worker process while the main process stays the only SQLite writer
+PARTITION_GLOB = "*.csv"
+WORKERS = min(4, os.cpu_count() or 1)
+
+def _source_files(name):
+    single = DATA_DIR/name
+    files = ([single] if single.exists() else []) + sorted((DATA_DIR/Path(name).stem).glob(PARTITION_GLOB))
+    if not files:
+        raise FileNotFoundError(f"no {name} or {Path(name).stem}/{PARTITION_GLOB} under {DATA_DIR}")
+    return files
+
+def _file_sums(name):
+    return {str(f.relative_to(DATA_DIR)): _file_checksum(f) for f in _source_files(name)}
+
+def _source_checksum(name, sums):
+    if list(sums) == [name]:
+        return sums[name]    # same stamp a single-file source always had
+    h = hashlib.sha256()
+    for rel, digest in sums.items():
+        h.update(f"{rel}:{digest}\n".encode())
+    return h.hexdigest()
+
+def _read_csv(name, path, chunk_rows=None):
+    cols, parse = (ORDER_COLS, ["order_date"]) if name == "orders.csv" else (ITEM_COLS, None)
+    frames = pd.read_csv(path, usecols=cols, parse_dates=parse, chunksize=chunk_rows)
+    return (c[cols] for c in frames) if chunk_rows else frames[cols]
+
+def _parse_partition(job):
+    # runs in a pool worker: parse one whole partition file and ship the typed frame back
+    name, path = job
+    start, cpu = time.perf_counter(), time.process_time()
+    df = _read_csv(name, path)
+    return df, {"source": name, "file": str(path.relative_to(DATA_DIR)), "rows": len(df), "pid": os.getpid(),
+                "parse_seconds": time.perf_counter() - start, "cpu_seconds": time.process_time() - cpu}
+
+def _pool_map(fn, jobs, workers, initializer=None):
+    # results come back in submission order, with at most 2 x workers partitions parsed
+    # ahead of the writer, so memory stays bounded however many files a drop has
+    if workers <= 1 or len(jobs) <= 1:
+        if initializer:
+            initializer()
+        yield from map(fn, jobs)
+        return
+    with ProcessPoolExecutor(min(workers, len(jobs)), initializer=initializer) as ex:
+        pending = deque()
+        for job in jobs:
+            pending.append(ex.submit(fn, job))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def _stream_single(name, path, chunk_rows):
+    chunks = _read_csv(name, path, chunk_rows)
+    while True:
+        start, cpu = time.perf_counter(), time.process_time()
+        chunk = next(chunks, None)
+        if chunk is None:
+            return
+        yield chunk, {"source": name, "file": name, "rows": len(chunk), "pid": os.getpid(),
+                      "parse_seconds": time.perf_counter() - start, "cpu_seconds": time.process_time() - cpu}
+
+def _iter_source(name, chunk_rows, workers=1, timings=None, columnar=False):
+    """Yield typed frames of at most chunk_rows rows for one source: the single CSV is
+    streamed in-process, partition files are parsed in a pool of `workers` processes.
+    One timing entry per file (parse time in its worker, load time spent by the
+    consumer on its frames) is appended to `timings`. With `columnar`, the frames are
+    read from the already synced columnar stage instead."""
+    if columnar:
+        cols = ORDER_COLS if name == "orders.csv" else ITEM_COLS
+        yield from columnar_stage.scan(Path(name).stem, cols, batch_size=chunk_rows)
+        return
+    files = _source_files(name)
+    parts = [(name, f) for f in files if f != DATA_DIR/name]
+    frames = _pool_map(_parse_partition, parts, workers)
+    if files[0] == DATA_DIR/name:
+        frames = itertools.chain(_stream_single(name, files[0], chunk_rows), frames)
+    per_file = {}
+    for frame, info in frames:
+        t = per_file.get(info["file"])
+        if t is None:
+            t = per_file[info["file"]] = {**info, "load_seconds": 0.0}
+            if timings is not None:
+                timings.append(t)
+        else:
+            for k in ("rows", "parse_seconds", "cpu_seconds"):
+                t[k] += info[k]
+        start = time.perf_counter()
+        for i in range(0, len(frame), chunk_rows):
+            yield frame.iloc[i:i + chunk_rows]
+        t["load_seconds"] += time.perf_counter() - start
+
+_ORDER_MONTHS = None
+
+def _init_stage_worker():
+    global _ORDER_MONTHS
+    _ORDER_MONTHS = columnar_stage.order_months()
+
+def _stage_file(job):
+    # pool worker: convert one CSV, chunk by chunk, into typed month partitions
+    name, path, chunk_rows = job
+    start, cpu = time.perf_counter(), time.process_time()
+    kind, rel = Path(name).stem, str(path.relative_to(DATA_DIR))
+    columnar_stage.drop_source(kind, rel)
+    rows = nbytes = 0
+    for part, chunk in enumerate(_read_csv(name, path, chunk_rows)):
+        if kind == "orders":
+            d = chunk["order_date"].dt
+            chunk = chunk.assign(month_key=d.year * 100 + d.month)
+        else:
+            chunk = chunk.assign(month_key=chunk["order_id"].map(_ORDER_MONTHS))
+        nbytes += columnar_stage.write_parts(kind, rel, chunk, part)
+        rows += len(chunk)
+    return {"source": name, "file": rel, "rows": rows, "bytes": nbytes, "pid": os.getpid(),
+            "parse_seconds": time.perf_counter() - start, "cpu_seconds": time.process_time() - cpu,
+            "load_seconds": 0.0}
+
+def _sync_stage(sums, chunk_rows, workers, timings):
+    """Bring the columnar stage in line with the CSVs: convert new or changed files,
+    drop the parts of removed ones. Orders go first since items are partitioned by
+    their order's month."""
+    dirty = False
+    for name in ("orders.csv", "order_items.csv"):
+        kind = Path(name).stem
+        old, new = columnar_stage.stamps(kind), dict(sums[name])
+        if kind == "orders":
+            # only rewritten or removed order files can move existing orders between months
+            dirty = any(new.get(rel) != stamp for rel, stamp in old.items())
+            added = bool(set(new) - set(old))
+            todo = [rel for rel in new if old.get(rel) != new[rel]]
+        elif dirty:
+            todo = list(new)
+        else:
+            # items staged before their order arrived are re-bucketed once new orders land
+            todo = list(new) if added and columnar_stage.has_unknown_month(kind) else \
+                   [rel for rel in new if old.get(rel) != new[rel]]
+        for rel in set(old) - set(new):
+            columnar_stage.drop_source(kind, rel)
+        jobs = [(name, DATA_DIR/rel, chunk_rows) for rel in todo]
+        init = _init_stage_worker if kind == "order_items" and jobs else None
+        for info in _pool_map(_stage_file, jobs, workers, init):
+            timings.append(info)
+        columnar_stage.save_stamps(kind, new)
+
+def _date_dim(start, end):
+    # every day of the months start..end, all attributes derived once from one date_range
+    d = pd.Series(pd.date_range(start.to_period("M").start_time, end.to_period("M").end_time.normalize()))
+    year, month, day, dow = d.dt.year, d.dt.month, d.dt.day, d.dt.dayofweek
+    iso = d.dt.isocalendar().astype("int64")
+    week_start = d - pd.to_timedelta(dow, unit="D")
+    fiscal_period = (month - FISCAL_YEAR_START) % 12 + 1
+    return pd.DataFrame({
+        "date_key": year * 10000 + month * 100 + day,
+        "full_date": d.dt.strftime("%Y-%m-%d"),
+        "year": year, "month": month, "day": day,
+        "month_key": year * 100 + month,
+        "month_start_key": year * 10000 + month * 100 + 1,
+        "quarter": d.dt.quarter,
+        "quarter_key": year * 10 + d.dt.quarter,
+        "day_of_week": dow + 1,
+        "is_weekend": (dow >= 5).astype("int64"),
+        "week_start_key": week_start.dt.year * 10000 + week_start.dt.month * 100 + week_start.dt.day,
+        "iso_year": iso["year"], "iso_week": iso["week"],
+        "iso_week_key": iso["year"] * 100 + iso["week"],
+        "fiscal_year": year + (month >= FISCAL_YEAR_START) * (FISCAL_YEAR_START > 1),
+        "fiscal_quarter": (fiscal_period - 1) // 3 + 1,
+        "fiscal_period": fiscal_period,
+    })
+
+def _fill_calendar(con, report):
+    # dim_date spans every month from the first to the last order date ever seen, with no gaps
+    bounds = con.execute("""SELECT MIN(order_date), MAX(order_date) FROM stg_orders
+                            UNION ALL SELECT MIN(full_date), MAX(full_date) FROM dim_date""").fetchall()
+    dates = [pd.Timestamp(v) for row in bounds for v in row if v is not None]
+    if not dates:
+        return 0
+    return bulk_insert(con, "dim_date", _date_dim(min(dates), max(dates)), report=report, or_ignore=True)
+
+def _row_hashes(df):
+    # one 64-bit hash per row over its attributes, in a single vectorized pass; hashed as
+    # text so a column's inferred dtype can't make an unchanged row look different
+    return pd.util.hash_pandas_object(df.astype(str), index=False).to_numpy().view("int64")
+
+def _merge_scd2(con, table, df, as_of, report=None):
+    """Diff a source snapshot against the current versions of an SCD2 dimension by row
+    hash; only new, changed and vanished keys are written. Returns the changed keys."""
+    key, sk, _ = SCD2[table]
+    attrs = [c for c in df.columns if c != key]
+    new = df.drop_duplicates(key, keep="last")
+    # nullable Int64: the outer join must not round the hashes through float64
+    new = new.assign(row_hash=pd.array(_row_hashes(new[attrs]), dtype="Int64"))
+    cur = pd.read_sql(f"SELECT {sk}, {key}, row_hash FROM {table} WHERE is_current = 1", con) \
+        .astype({sk: "Int64", "row_hash": "Int64"})
+    closed = {r[0] for r in con.execute(f"SELECT DISTINCT {key} FROM {table} WHERE is_current = 0")}
+    m = new.merge(cur.astype({key: new[key].dtype}), on=key, how="outer", suffixes=("", "_old"), indicator=True)
+    both = m[m["_merge"] == "both"]
+    changed = both[both["row_hash"] != both["row_hash_old"]]
+    added, gone = m[m["_merge"] == "left_only"], m[m["_merge"] == "right_only"]
+    # a key seen for the first time is valid from SCD_START; a returning one from as_of
+    opened = pd.concat([changed.assign(valid_from=as_of),
+                        added.assign(valid_from=added[key].isin(closed).map({True: as_of, False: SCD_START}))])
+    with transaction(con):
+        con.executemany(f"UPDATE {table} SET valid_to = ?, is_current = 0 WHERE {sk} = ?",
+                        ((as_of, int(v)) for v in pd.concat([changed, gone])[f"{sk}"]))
+        bulk_insert(con, table, opened[[key, *attrs, "row_hash", "valid_from"]]
+                    .astype({"row_hash": "int64"}).assign(valid_to=SCD_END, is_current=1), report=report)
+    return set(changed[key]) | set(added[key]) | set(gone[key])
+
+def _pit(table, key_expr, date_expr):
+    # surrogate key of the version valid on date_expr (NULL date: the latest version);
+    # a SEARCH on ix_<table>_pit, newest first
+    key, sk, _ = SCD2[table]
+    return (f"(SELECT d.{sk} FROM {table} d WHERE d.{key} = {key_expr} "
+            f"AND d.valid_from <= COALESCE({date_expr}, '{SCD_END}') ORDER BY d.valid_from DESC, d.{sk} DESC LIMIT 1)")
+
+def _repoint_facts(con, changed):
+    """Point the facts of changed dimension keys at the version valid on their date;
+    returns the month_keys of the facts that moved."""
+    months = set()
+    day = "printf('%04d-%02d-%02d', date_key / 10000, date_key / 100 % 100, date_key % 100)"
+    for table, keys in changed.items():
+        key, sk, _ = SCD2[table]
+        pit = _pit(table, f"fact_sales.{key}", f"CASE WHEN date_key IS NOT NULL THEN {day} END")
+        con.execute("CREATE TEMP TABLE tmp_scd_keys(k PRIMARY KEY)")
+        con.executemany("INSERT INTO tmp_scd_keys VALUES (?)", ((k,) for k in keys))
+        for month, part in partitions.online(con).items():
+            if con.execute(f"UPDATE {part} AS fact_sales SET {sk} = {pit} WHERE {key} IN (SELECT k FROM tmp_scd_keys) "
+                           f"AND {sk} IS NOT {pit}").rowcount:
+                months.add(month)
+        con.execute("DROP TABLE tmp_scd_keys")
+    return months
+
+def _create_views(cur):
+    # dq_results, v_dq_latest and the dq_<rule> drill-down views
+    dq.create_views(cur)
     cur.executescript("""
-      PRAGMA foreign_keys = ON;
-      DROP TABLE IF EXISTS fact_sales;
-      DROP TABLE IF EXISTS dim_product;
-      DROP TABLE IF EXISTS dim_customer;
+      -- the KPI views are thin selects over the aggregates kept fresh by refresh_aggregates()
+      CREATE VIEW IF NOT EXISTS v_monthly_kpis AS
+        SELECT printf('%04d-%02d', month_key / 100, month_key % 100) AS month,
+               orders,
+               ROUND(revenue,2) AS revenue,
+               ROUND(revenue/NULLIF(orders,0),2) AS aov
+        FROM agg_sales_month
+        ORDER BY month_key;
+
+      CREATE VIEW IF NOT EXISTS v_top_products AS
+        SELECT a.product_id, dp.category, dp.subcategory,
+               ROUND(SUM(a.revenue),2) AS revenue
+        FROM agg_sales_month_product a
+        JOIN dim_product dp ON dp.product_sk = a.product_sk
+        GROUP BY 1,2,3
+        ORDER BY revenue DESC LIMIT 10;
+
+      CREATE VIEW IF NOT EXISTS v_category_contribution AS
+        SELECT category,
+               ROUND(SUM(revenue),2) AS revenue,
+               ROUND(100.0 * SUM(revenue) /
+                     (SELECT SUM(revenue) FROM agg_sales_month_category_payment), 2) AS pct
+        FROM agg_sales_month_category_payment
+        GROUP BY category
+        ORDER BY revenue DESC;
+    """)
+
+def _write_watermarks(con, checksums, max_id=None, max_date=None):
+    now = pd.Timestamp.now().isoformat(timespec="seconds")
+    rows = [(name, *((max_id, max_date) if name == "orders.csv" else (None, None)), checksums[name], now)
+            for name in SOURCES]
+    con.executemany("""
+      INSERT INTO etl_watermark(source, max_order_id, max_order_date, checksum, loaded_at)
+      VALUES (?,?,?,?,?)
+      ON CONFLICT(source) DO UPDATE SET
+        max_order_id = COALESCE(excluded.max_order_id, max_order_id),
+        max_order_date = COALESCE(excluded.max_order_date, max_order_date),
+        checksum = excluded.checksum, loaded_at = excluded.loaded_at
+    """, rows)
+
+# the items <-> orders join runs inside SQLite, so fact rows never pass through pandas
+FACT_COLS = ["order_id", "date_key", "month_key", "customer_id", "customer_sk", "product_id", "product_sk",
+             "quantity", "unit_price", "discount", "status", "payment_method", "revenue"]
+_FACT_INSERT = f"""
+  INSERT INTO {{table}}({", ".join(FACT_COLS)})
+  SELECT i.order_id,
+         CAST(strftime('%Y%m%d', o.order_date) AS INTEGER),
+         CAST(strftime('%Y%m', o.order_date) AS INTEGER),
+         o.customer_id, {_pit("dim_customer", "o.customer_id", "o.order_date")},
+         i.product_id, {_pit("dim_product", "i.product_id", "o.order_date")},
+         i.quantity, i.unit_price, i.discount, o.status, o.payment_method,
+         i.quantity * i.unit_price * (1 - COALESCE(i.discount, 0.0))
+  FROM {{source}}
+  WHERE {{month}} AND {{where}}"""
+# one month: a range seek on ix_stg_orders_order_date, then the items of each order
+_MONTH = ("stg_orders o JOIN stg_order_items i ON i.order_id = o.order_id",
+          "o.order_date >= ? AND o.order_date < ? AND strftime('%Y%m', o.order_date) = ?")
+# lines without an order or a parsable order date
+_NO_MONTH = ("stg_order_items i LEFT JOIN stg_orders o ON o.order_id = i.order_id",
+             "strftime('%Y%m', o.order_date) IS NULL")
+
+def _build_facts(con, report, orders=None, target=None, months=None):
+    """Insert the fact rows of the order_ids selected by `orders` (SQL, None = all) into
+    their month partitions, one transaction per month; archived months are skipped
+    unless named in `months`, which limits the build to those month_keys.
+    target(month) names the table to fill instead of the live partition (which is
+    created when missing). Returns (rows, months written)."""
+    start, n, built = time.perf_counter(), 0, set()
+    def only(alias):
+        return "1" if orders is None else f"{alias}.order_id IN ({orders})"
+    if months is None:
+        months = {r[0] for r in con.execute(
+            "SELECT DISTINCT CAST(strftime('%Y%m', order_date) AS INTEGER) FROM stg_orders o "
+            f"WHERE {only('o')} AND strftime('%Y%m', order_date) IS NOT NULL")}
+        months = {*months, partitions.UNKNOWN_MONTH} - set(partitions.archived(con))
+    for m in sorted(int(m or partitions.UNKNOWN_MONTH) for m in months):
+        with transaction(con):
+            table = target(m) if target else partitions.ensure(con, m)
+            if m == partitions.UNKNOWN_MONTH:
+                source, month = _NO_MONTH
+                rows = con.execute(_FACT_INSERT.format(table=table, source=source, month=month, where=only("i")))
+            else:
+                (source, month), (y, mm) = _MONTH, divmod(m, 100)
+                rows = con.execute(_FACT_INSERT.format(table=table, source=source, month=month, where=only("o")),
+                                   (f"{y:04d}-{mm:02d}", f"{y + mm // 12:04d}-{mm % 12 + 1:02d}", str(m)))
+        n += rows.rowcount
+        if rows.rowcount:
+            built.add(m)
+    if target is None:
+        with transaction(con):
+            partitions.create_view(con)
+    report.add("fact_sales", n, time.perf_counter() - start)
+    return n, built
+
+def _full_load(con, checksums, chunk_rows, report, read, as_of, reset_history=False):
+    cur = con.cursor()
+    dq.drop_views(cur)
+    # the SCD2 dimensions hold history no source file has, so a full load keeps them
+    # (dimensions from before SCD2, keyed on the natural key, are rebuilt); reset_history
+    # drops them too, so every key starts over with one version valid since SCD_START
+    cols = {t: {r[1] for r in cur.execute(f"PRAGMA table_info({t})")} for t in SCD2}
+    legacy = [t for t, (_, sk, _) in SCD2.items() if cols[t] and (reset_history or sk not in cols[t])]
+    # fact_sales is a view over one table per month (partitions.py), all rebuilt here;
+    # the partitions reference the dimensions, so they go first
+    with transaction(con):
+        partitions.drop_all(con)
+    cur.executescript(f"""
+      DROP VIEW IF EXISTS v_monthly_kpis;
+      DROP VIEW IF EXISTS v_top_products;
+      DROP VIEW IF EXISTS v_category_contribution;
+      {"".join(f"DROP TABLE IF EXISTS {t};" for t in legacy)}
       DROP TABLE IF EXISTS dim_date;
+      DROP TABLE IF EXISTS stg_orders;
+      DROP TABLE IF EXISTS stg_order_items;
+      DROP TABLE IF EXISTS etl_watermark;
+      DROP TABLE IF EXISTS agg_sales_month;
+      DROP TABLE IF EXISTS agg_sales_month_product;
+      DROP TABLE IF EXISTS agg_sales_month_category_payment;
+      DROP TABLE IF EXISTS agg_cube_category;
+      DROP TABLE IF EXISTS agg_cube;
+      DROP TABLE IF EXISTS agg_cube_product;
 
-      CREATE TABLE dim_product(
-        product_id INTEGER PRIMARY KEY,
-        category TEXT, subcategory TEXT, price REAL
+      CREATE TABLE IF NOT EXISTS dim_product(
+        product_sk INTEGER PRIMARY KEY,    -- one per version
+        product_id INTEGER NOT NULL,
+        category TEXT, subcategory TEXT, price REAL,
+        row_hash INTEGER NOT NULL,         -- 64-bit hash of the attributes, for change detection
+        valid_from TEXT NOT NULL,          -- yyyy-mm-dd, inclusive
+        valid_to TEXT NOT NULL,            -- exclusive; '{SCD_END}' while current
+        is_current INTEGER NOT NULL
       );
-      CREATE TABLE dim_customer(
-        customer_id INTEGER PRIMARY KEY,
-        signup_date TEXT, city TEXT, state TEXT
+      CREATE TABLE IF NOT EXISTS dim_customer(
+        customer_sk INTEGER PRIMARY KEY,
+        customer_id INTEGER NOT NULL,
+        signup_date TEXT, city TEXT, state TEXT,
+        row_hash INTEGER NOT NULL,
+        valid_from TEXT NOT NULL,
+        valid_to TEXT NOT NULL,
+        is_current INTEGER NOT NULL
       );
+      -- the diff reads the current versions, point-in-time lookups seek (key, valid_from)
+      CREATE UNIQUE INDEX IF NOT EXISTS ux_dim_product_current ON dim_product(product_id) WHERE is_current = 1;
+      CREATE INDEX IF NOT EXISTS ix_dim_product_pit ON dim_product(product_id, valid_from);
+      CREATE UNIQUE INDEX IF NOT EXISTS ux_dim_customer_current ON dim_customer(customer_id) WHERE is_current = 1;
+      CREATE INDEX IF NOT EXISTS ix_dim_customer_pit ON dim_customer(customer_id, valid_from);
       CREATE TABLE dim_date(
-        date_key TEXT PRIMARY KEY,
-        year INTEGER, month INTEGER, day INTEGER
+        date_key INTEGER PRIMARY KEY,      -- yyyymmdd
+        full_date TEXT NOT NULL,           -- ISO yyyy-mm-dd
+        year INTEGER, month INTEGER, day INTEGER,
+        month_key INTEGER NOT NULL,        -- yyyymm
+        month_start_key INTEGER,           -- yyyymm01
+        quarter INTEGER,
+        quarter_key INTEGER,               -- yyyyq
+        day_of_week INTEGER,               -- ISO: 1 = Monday .. 7 = Sunday
+        is_weekend INTEGER,
+        week_start_key INTEGER,            -- yyyymmdd of that week's Monday
+        iso_year INTEGER, iso_week INTEGER,
+        iso_week_key INTEGER,              -- iso_year * 100 + iso_week
+        fiscal_year INTEGER,               -- named after the calendar year it ends in
+        fiscal_quarter INTEGER,
+        fiscal_period INTEGER              -- 1 = the month FISCAL_YEAR_START
       );
-      CREATE TABLE fact_sales(
-        order_id INTEGER,
-        order_date TEXT,
-        customer_id INTEGER,
-        product_id INTEGER,
-        quantity INTEGER,
-        unit_price REAL,
-        discount REAL,
-        status TEXT,
-        payment_method TEXT,
-        revenue REAL
+      CREATE TABLE stg_orders{STAGE_DDL["orders"]};
+      CREATE TABLE stg_order_items{STAGE_DDL["order_items"]};
+      -- one row per source file: last checksum seen and, for orders, the high watermark
+      CREATE TABLE etl_watermark(
+        source TEXT PRIMARY KEY,
+        max_order_id INTEGER,
+        max_order_date TEXT,
+        checksum TEXT,
+        loaded_at TEXT
       );
     """)
 
-    pd.read_csv(DATA_DIR/"products.csv").to_sql("dim_product", con, if_exists="append", index=False)
-    pd.read_csv(DATA_DIR/"customers.csv").to_sql("dim_customer", con, if_exists="append", index=False)
+    with report.stage("dim_load") as st:
+        st.rows_out = sum(len(_merge_scd2(con, t, pd.read_csv(DATA_DIR/source), as_of, report))
+                          for t, (_, _, source) in SCD2.items())
 
-    orders = pd.read_csv(DATA_DIR/"orders.csv", parse_dates=["order_date"])
-    items  = pd.read_csv(DATA_DIR/"order_items.csv")
-    orders.to_sql("stg_orders", con, if_exists="replace", index=False)
-    items.to_sql("stg_order_items", con, if_exists="replace", index=False)
+    with report.stage("orders_load") as st:
+        n_orders = sum(bulk_insert(con, "stg_orders", chunk, report=report) for chunk in read("orders.csv"))
+        st.rows_in = st.rows_out = n_orders
+    with report.stage("order_items_load") as st:
+        n_items = sum(bulk_insert(con, "stg_order_items", chunk, report=report) for chunk in read("order_items.csv"))
+        st.rows_in = st.rows_out = n_items
+    # the fact build seeks orders by date and items by order_id
+    with report.stage("staging_indexes"):
+        create_indexes(con, INDEXES[:3], report)
 
-    dates = pd.DataFrame({"date_key": orders["order_date"].dt.date.astype(str)}).drop_duplicates().sort_values("date_key")
-    dates["year"] = pd.to_datetime(dates["date_key"]).dt.year
-    dates["month"] = pd.to_datetime(dates["date_key"]).dt.month
-    dates["day"] = pd.to_datetime(dates["date_key"]).dt.day
-    dates.to_sql("dim_date", con, if_exists="append", index=False)
+    # dim_date goes in before the facts that reference it
+    with report.stage("date_dim") as st:
+        st.rows_in, st.rows_out = n_orders, _fill_calendar(con, report)
+    with report.stage("fact_load") as st:
+        st.rows_in, (st.rows_out, _) = n_items, _build_facts(con, report)
+    with report.stage("indexes"):
+        create_indexes(con, INDEXES + partitions.index_statements(con), report)
+        with transaction(con):
+            partitions.update_counts(con)
+    with report.stage("aggregates"):
+        refresh_aggregates(con)
 
-    fact = items.merge(orders, on="order_id", how="left")
-    fact["revenue"] = fact["quantity"] * fact["unit_price"] * (1 - fact["discount"].fillna(0.0))
-    fact.to_sql("fact_sales", con, if_exists="append", index=False)
+    with report.stage("views"):
+        _create_views(cur)
+    with report.stage("watermarks"), transaction(con):
+        max_id, max_date = con.execute("SELECT MAX(order_id), MAX(order_date) FROM stg_orders").fetchone()
+        _write_watermarks(con, checksums, max_id, max_date)
+        bump_data_version(con, {*WAREHOUSE_TABLES, "etl_watermark", *partitions.online(con).values()})
+    return {"mode": "full", "orders": n_orders, "items": n_items, "months": None}
 
-    cur.executescript("""
-      DROP VIEW IF EXISTS dq_nulls;
-      DROP VIEW IF EXISTS dq_negative_qty;
-      DROP VIEW IF EXISTS v_monthly_kpis;
-      DROP VIEW IF EXISTS v_top_products;
-      DROP VIEW IF EXISTS v_category_contribution;
+def _incremental_load(con, checksums, chunk_rows, report, read, as_of):
+    # one transaction for the whole refresh (the stages' own transactions join it), so
+    # readers keep the previous load until every fact, aggregate and stamp of this one commits
+    with transaction(con):
+        stats = _apply_changes(con, checksums, chunk_rows, report, read, as_of)
+    # executescript commits, so the views (normally already there) come after
+    with report.stage("views"):
+        _create_views(con.cursor())
+    return stats
 
-      CREATE VIEW dq_nulls AS
-        SELECT * FROM fact_sales
-        WHERE order_id IS NULL OR customer_id IS NULL OR product_id IS NULL;
+def _apply_changes(con, checksums, chunk_rows, report, read, as_of):
+    marks = {r[0]: r for r in con.execute(
+        "SELECT source, max_order_id, max_order_date, checksum FROM etl_watermark")}
+    changed = {n for n in SOURCES if n not in marks or marks[n][3] != checksums[n]}
 
-      CREATE VIEW dq_negative_qty AS
-        SELECT * FROM fact_sales WHERE quantity < 0 OR unit_price < 0;
+    touched, scd_changed = set(), {}
+    with report.stage("dim_load"), transaction(con):
+        for table, (_, _, source) in SCD2.items():
+            if source in changed:
+                keys = _merge_scd2(con, table, pd.read_csv(DATA_DIR/source), as_of, report)
+                if keys:
+                    scd_changed[table] = keys
+                    touched.add(table)
 
-      CREATE VIEW v_monthly_kpis AS
-        SELECT substr(order_date,1,7) AS month,
-               COUNT(DISTINCT order_id) AS orders,
-               ROUND(SUM(revenue),2) AS revenue,
-               ROUND(SUM(revenue)/NULLIF(COUNT(DISTINCT order_id),0),2) AS aov
-        FROM fact_sales
-        WHERE status IN ('completed','shipped')
-        GROUP BY 1 ORDER BY 1;
-
-      CREATE VIEW v_top_products AS
-        SELECT dp.product_id, dp.category, dp.subcategory,
-               ROUND(SUM(fs.revenue),2) AS revenue
-        FROM fact_sales fs
-        JOIN dim_product dp ON dp.product_id = fs.product_id
-        WHERE fs.status IN ('completed','shipped')
-        GROUP BY 1,2,3
-        ORDER BY revenue DESC LIMIT 10;
+    n_orders = n_items = 0
+    max_id = max_date = None
+    fact_months = set()         # partitions whose rows changed
+    if changed & {"orders.csv", "order_items.csv"}:
+        oc, ic = ", ".join(ORDER_COLS), ", ".join(ITEM_COLS)
+        for table, kind in (("tmp_orders", "orders"), ("tmp_order_items", "order_items")):
+            with report.stage(f"{kind}_load"):
+                con.execute(f"DROP TABLE IF EXISTS {table}")
+                con.execute(f"CREATE TABLE {table}{STAGE_DDL[kind]}")
+                for chunk in read(f"{kind}.csv"):
+                    bulk_insert(con, table, chunk, report=report)
+                con.execute(f"CREATE INDEX ix_{table}_order_id ON {table}(order_id)")
+        wm = int((marks.get("orders.csv") or (None, None))[1] or 0)
 
-      CREATE VIEW v_category_contribution AS
-        SELECT dp.category,
-               ROUND(SUM(fs.revenue),2) AS revenue,
-               ROUND(100.0 * SUM(fs.revenue) /
-                     (SELECT SUM(revenue) FROM fact_sales WHERE status IN ('completed','shipped')), 2) AS pct
-        FROM fact_sales fs
-        JOIN dim_product dp ON dp.product_id = fs.product_id
-        WHERE fs.status IN ('completed','shipped')
-        GROUP BY dp.category
-        ORDER BY revenue DESC;
-    """)
+        with report.stage("merge"), transaction(con):
+            # orders above the watermark are new by definition; only the range at or
+            # below it has to be diffed against what staging already holds
+            con.execute("DROP TABLE IF EXISTS tmp_changed")
+            con.execute("CREATE TABLE tmp_changed(order_id INTEGER PRIMARY KEY)")
+            con.execute(f"""
+              INSERT OR IGNORE INTO tmp_changed
+                SELECT order_id FROM tmp_orders WHERE order_id > {wm}
+                UNION SELECT order_id FROM (SELECT {oc} FROM tmp_orders WHERE order_id <= {wm}
+                                            EXCEPT SELECT {oc} FROM stg_orders)
+                UNION SELECT order_id FROM (SELECT {oc} FROM stg_orders EXCEPT SELECT {oc} FROM tmp_orders)
+                UNION SELECT order_id FROM (SELECT {ic} FROM tmp_order_items WHERE order_id <= {wm}
+                                            EXCEPT SELECT {ic} FROM stg_order_items)
+                UNION SELECT order_id FROM (SELECT {ic} FROM stg_order_items EXCEPT SELECT {ic} FROM tmp_order_items)
+            """)
+            if con.execute("SELECT COUNT(*) FROM tmp_changed").fetchone()[0]:
+                touched |= {"stg_orders", "stg_order_items", "dim_date", *AGG_TABLES}
+            fact_months |= partitions.delete_where(con, "order_id IN (SELECT order_id FROM tmp_changed)")
+            for table in ("stg_orders", "stg_order_items"):
+                con.execute(f"DELETE FROM {table} WHERE order_id IN (SELECT order_id FROM tmp_changed)")
+            con.execute(f"INSERT INTO stg_orders({oc}) SELECT {oc} FROM tmp_orders "
+                        "WHERE order_id IN (SELECT order_id FROM tmp_changed)")
+            con.execute(f"INSERT INTO stg_order_items({ic}) SELECT {ic} FROM tmp_order_items "
+                        "WHERE order_id IN (SELECT order_id FROM tmp_changed)")
+
+        changed_ids = "order_id IN (SELECT order_id FROM tmp_changed)"
+        with report.stage("date_dim"):
+            _fill_calendar(con, report)
+        with report.stage("fact_load") as st:
+            n_items, built = _build_facts(con, report, "SELECT order_id FROM tmp_changed")
+            st.rows_out = n_items
+            fact_months |= built
+        n_orders = con.execute(f"SELECT COUNT(*) FROM tmp_orders WHERE {changed_ids}").fetchone()[0]
+        max_id, max_date = con.execute("SELECT MAX(order_id), MAX(order_date) FROM tmp_orders").fetchone()
 
-    con.commit(); con.close()
+        with transaction(con):
+            for table in ("tmp_orders", "tmp_order_items", "tmp_changed"):
+                con.execute(f"DROP TABLE {table}")
+
+    # facts keep the dimension version of their order date, so a dimension change only
+    # moves the facts dated on/after its as-of date (and those of keys first seen now)
+    if scd_changed:
+        with report.stage("scd_repoint"), transaction(con):
+            moved = _repoint_facts(con, scd_changed)
+        if moved:
+            fact_months |= moved
+            touched |= set(AGG_TABLES)
+    if fact_months:
+        touched |= {"fact_sales", "etl_partition", *(partitions.table(m) for m in fact_months)}
+
+    with report.stage("indexes"):
+        create_indexes(con, INDEXES + partitions.index_statements(con, fact_months), report)
+        with transaction(con):
+            partitions.update_counts(con, fact_months)
+    months = fact_months - set(partitions.archived(con))
+    # a category the cube has no bit for yet changes its set enumeration: refresh every month
+    new_category = con.execute("""SELECT 1 FROM dim_product WHERE category IS NOT NULL
+                                  AND category NOT IN (SELECT category FROM agg_cube_category) LIMIT 1""").fetchone()
+    with report.stage("aggregates"):
+        if new_category:
+            refresh_aggregates(con)
+            months = None
+            touched |= set(AGG_TABLES)
+        else:
+            refresh_aggregates(con, months)
+            months = sorted(m for m in months if m)
+    with report.stage("watermarks"), transaction(con):
+        _write_watermarks(con, checksums, max_id, max_date)
+        bump_data_version(con, {*touched, "etl_watermark"})
+    return {"mode": "incremental", "orders": n_orders, "items": n_items,
+            "changed_sources": sorted(changed), "months": months, "tables_changed": sorted(touched)}
+
+def _has_warehouse(con):
+    names = {r[0] for r in con.execute("SELECT name FROM sqlite_master WHERE type IN ('table','view')")}
+    return {*WAREHOUSE_TABLES, "etl_watermark"} <= names
+
+def load_to_sqlite(mode="full", chunk_rows=CHUNK_ROWS, pragmas=None, workers=WORKERS, columnar=None, as_of=None,
+                   reset_history=False):
+    """as_of: yyyy-mm-dd from which dimension changes in this load apply (default today).
+    A full load keeps the SCD2 dimension history; reset_history=True rebuilds it too."""
+    if mode not in ("full", "incremental"):
+        raise ValueError(f"unknown load mode: {mode!r}")
+    if reset_history and mode != "full":
+        raise ValueError("reset_history needs a full load")
+    # stages land in etl_run_log: under the caller's Run if there is one, else a run of their own
+    with instrument.ensure_run("load_to_sqlite", db_path=DB_PATH) as run, \
+            instrument.stage(f"load_to_sqlite.{mode}"):
+        return _load_to_sqlite(mode, chunk_rows, pragmas, workers, columnar, run.run_id,
+                               as_of or pd.Timestamp.now().strftime("%Y-%m-%d"), reset_history)
+
+def _check_quality(con, run_id, workers):
+    # the rules read the committed load on their own read-only connections
+    with instrument.stage("dq") as st:
+        results = dq.evaluate(DB_PATH, workers)
+        with transaction(con):
+            dq.record(con, run_id, results)
+            bump_data_version(con, {"dq_results"})
+        st.rows_out = sum(r["failed_rows"] for r in results)
+    return {r["rule"]: r["failed_rows"] for r in results}
+
+def _load_to_sqlite(mode, chunk_rows, pragmas, workers, columnar, run_id, as_of, reset_history=False):
+    with instrument.stage("checksums") as st:
+        sums = {name: _file_sums(name) for name in SOURCES}
+        checksums = {name: _source_checksum(name, sums[name]) for name in SOURCES}
+        st.rows_in = sum(map(len, sums.values()))
+    report, timings = LoadReport(), []
+    # columnar=None: stage through Parquet/Arrow whenever pyarrow is installed
+    columnar = columnar_stage.AVAILABLE if columnar is None else columnar
+    if columnar:
+        with report.stage("stage_sync"):
+            _sync_stage(sums, chunk_rows, workers, timings)
+    def read(name):
+        return _iter_source(name, chunk_rows, workers, timings, columnar)
+    con = sqlite3.connect(DB_PATH)
+    con.execute("PRAGMA foreign_keys = ON")
+    try:
+        with load_pragmas(con, **(pragmas or {})):
+            # an incremental run needs something to increment on; fall back to a full build
+            if mode == "incremental" and _has_warehouse(con):
+                stats = _incremental_load(con, checksums, chunk_rows, report, read, as_of)
+            else:
+                stats = _full_load(con, checksums, chunk_rows, report, read, as_of, reset_history)
+            con.commit()
+        stats["dq"] = _check_quality(con, run_id, workers)
+    finally:
+        con.close()
+    stats["tables"] = report.summary()
+    stats["indexes"] = dict(report.indexes)
+    stats["stages"] = dict(report.stages)
+    stats["partitions"] = timings
+    if columnar:
+        stats["stage_dq"] = columnar_stage.dq_counts()
+    return stats
+
+def backfill(months, chunk_rows=CHUNK_ROWS, pragmas=None, workers=WORKERS):
+    """Rebuild the staging, fact and aggregate rows of the given month_keys (yyyymm)
+    from the columnar stage, reading only those month partitions. The stage is synced
+    with the CSVs first; the rebuild itself runs as one transaction."""
+    with instrument.ensure_run("backfill", db_path=DB_PATH) as run, instrument.stage("backfill"):
+        return _backfill(months, chunk_rows, pragmas, workers, run.run_id)
+
+def _backfill(months, chunk_rows, pragmas, workers, run_id):
+    months = sorted({int(m) for m in months})
+    report, timings = LoadReport(), []
+    _sync_stage({name: _file_sums(name) for name in ("orders.csv", "order_items.csv")},
+                chunk_rows, workers, timings)
+    con = sqlite3.connect(DB_PATH)
+    con.execute("PRAGMA foreign_keys = ON")
+    try:
+        if not _has_warehouse(con):
+            raise RuntimeError("no warehouse to backfill; run a full load first")
+        keys = ", ".join(map(str, months))
+        with load_pragmas(con, **(pragmas or {})), transaction(con):
+            # the orders now staged in these months plus whatever the warehouse had there
+            con.execute("CREATE TEMP TABLE bf_orders(order_id INTEGER PRIMARY KEY)")
+            for chunk in columnar_stage.scan("orders", ["order_id"], months, batch_size=chunk_rows):
+                con.executemany("INSERT OR IGNORE INTO bf_orders VALUES (?)",
+                                ((int(i),) for i in chunk["order_id"].dropna()))
+            con.execute("INSERT OR IGNORE INTO bf_orders SELECT order_id FROM "
+                        + partitions.source(partitions.online(con, months).values()))
+            con.execute("INSERT OR IGNORE INTO bf_orders SELECT order_id FROM stg_orders "
+                        f"WHERE CAST(substr(order_date, 1, 4) || substr(order_date, 6, 2) AS INTEGER) IN ({keys})")
+            for table in ("stg_orders", "stg_order_items"):
+                con.execute(f"DELETE FROM {table} WHERE order_id IN (SELECT order_id FROM bf_orders)")
+            # orders whose date moved out of these months are re-read from the month they
+            # are staged in now, so they land in their new partition instead of vanishing
+            ids = [r[0] for r in con.execute("SELECT order_id FROM bf_orders")]
+            staged_in = columnar_stage.order_months()
+            moved = sorted({int(m) for m in staged_in[staged_in.index.isin(ids)].dropna()} - set(months))
+            def rows(kind, cols):
+                yield from columnar_stage.scan(kind, cols, months, batch_size=chunk_rows)
+                if moved:
+                    yield from columnar_stage.scan(kind, cols, moved, columnar_stage.of_orders(ids), chunk_rows)
+            n_orders = sum(bulk_insert(con, "stg_orders", chunk, report=report) for chunk in rows("orders", ORDER_COLS))
+            for chunk in rows("order_items", ITEM_COLS):
+                bulk_insert(con, "stg_order_items", chunk, report=report)
+            _fill_calendar(con, report)
+            # every partition gaining or losing orders is rebuilt next to the live one
+            # (its other rows copied over) and swapped in with the rest of the backfill
+            keep = "order_id NOT IN (SELECT order_id FROM bf_orders)"
+            staged = {m: partitions.stage(con, m, keep) for m, t in partitions.online(con).items()
+                      if con.execute(f"SELECT 1 FROM {t} WHERE order_id IN (SELECT order_id FROM bf_orders)").fetchone()}
+            def target(m):
+                if m not in staged:
+                    staged[m] = partitions.stage(con, m, keep)
+                return staged[m]
+            n_items, _ = _build_facts(con, report, "SELECT order_id FROM bf_orders", target)
+            partitions.swap(con, staged)
+            con.execute("DROP TABLE bf_orders")
+            touched = set(staged) | set(months) | set(moved)
+            refresh_aggregates(con, touched)
+            bump_data_version(con, {"fact_sales", "etl_partition", *(partitions.table(m) for m in staged),
+                                    "stg_orders", "stg_order_items", "dim_date", *AGG_TABLES})
+        quality = _check_quality(con, run_id, workers)
+    finally:
+        con.close()
+    return {"mode": "backfill", "orders": n_orders, "items": n_items, "months": sorted(m for m in touched if m),
+            "tables": report.summary(), "indexes": {}, "partitions": timings, "dq": quality}
+
+def archive(months, archive_dir=partitions.ARCHIVE_DIR):
+    """Detach the fact partitions of the given month_keys into archive_dir, one .sqlite
+    file each; their aggregate rows stay. Returns {month_key: file}."""
+    con = sqlite3.connect(DB_PATH)
+    try:
+        files = partitions.detach(con, sorted({int(m) for m in months}), archive_dir)
+        with transaction(con):
+            bump_data_version(con, {"fact_sales", "etl_partition", *(partitions.table(m) for m in files)})
+    finally:
+        con.close()
+    return files
+
+def restore(paths):
+    """Bring archived partitions back online; returns their month_keys. Incremental loads
+    only change staging for an archived month, so each month is rebuilt from staging
+    (its file names the month) rather than copied back with rows that may be stale."""
+    con = sqlite3.connect(DB_PATH)
+    con.execute("PRAGMA foreign_keys = ON")
+    report = LoadReport()
+    def fill(table, month):
+        _build_facts(con, report, target=lambda m: table, months=[month])
+    try:
+        months = [partitions.restore(con, p, fill) for p in paths]
+        refresh_aggregates(con, months)
+        with transaction(con):
+            bump_data_version(con, {"fact_sales", "etl_partition", *(partitions.table(m) for m in months),
+                                    *AGG_TABLES})
+    finally:
+        con.close()
+    return months
 
 if __name__ == "__main__":
-    make_synthetic()
-    fetch_api_sample()
-    load_to_sqlite()
-    print("✅ Mini DWH built at", DB_PATH)
+    import argparse
+    ap = argparse.ArgumentParser(description="Build the mini DWH from data/*.csv")
+    ap.add_argument("--mode", choices=["full", "incremental"], default="full",
+                    help="full: rebuild staging, facts and aggregates, keeping the SCD2 dimension history "
+                         "(changes close versions at --as-of); incremental: apply only new/changed source rows")
+    ap.add_argument("--reset-history", action="store_true",
+                    help="with a full load, also drop dim_product/dim_customer history and rebuild them from the sources")
+    ap.add_argument("--skip-synthetic", action="store_true",
+                    help="load the CSVs already in data/ instead of regenerating them")
+    ap.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS,
+                    help="rows per streamed CSV chunk; caps peak memory of the load")
+    ap.add_argument("--workers", type=int, default=WORKERS,
+                    help="processes parsing partitioned orders/ and order_items/ files (1 = in-process)")
+    ap.add_argument("--no-columnar", action="store_true",
+                    help="read the CSVs directly instead of the Parquet/Arrow stage in data/stage/")
+    ap.add_argument("--backfill", nargs="+", metavar="YYYY-MM",
+                    help="only rebuild these months from the columnar stage (implies --skip-synthetic)")
+    ap.add_argument("--archive", nargs="+", metavar="YYYY-MM",
+                    help="only detach these months' fact partitions into --archive-dir")
+    ap.add_argument("--restore", nargs="+", metavar="FILE", help="only bring archived partition files back online")
+    ap.add_argument("--archive-dir", default=str(partitions.ARCHIVE_DIR))
+    ap.add_argument("--as-of", metavar="YYYY-MM-DD",
+                    help="date from which product/customer changes in this load apply (default today)")
+    ap.add_argument("--journal-mode", choices=["WAL", "OFF", "MEMORY", "DELETE"], default="WAL",
+                    help="journal mode used while loading (restored afterwards)")
+    ap.add_argument("--customers", type=int, default=400, help="synthetic scale: number of customers")
+    ap.add_argument("--products", type=int, default=50, help="synthetic scale: number of products")
+    ap.add_argument("--months", type=float, default=9, help="synthetic scale: months of order history")
+    ap.add_argument("--items-per-order", type=int, default=5, help="synthetic scale: max line items per order")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--api", action="append", default=[], metavar="NAME=URL",
+                    help="also extract this paginated JSON API into stg_api_NAME (repeatable)")
+    ap.add_argument("--api-concurrency", type=int, default=api_extract.CONCURRENCY, help="API requests in flight")
+    ap.add_argument("--api-rate", type=float, help="max API requests per second")
+    ap.add_argument("--trace", metavar="PATH", help="also write the run's stages as Chrome-trace JSON")
+    ap.add_argument("--profile", choices=["cprofile", "tracemalloc"],
+                    help="run under cProfile (stats written next to the trace) or tracemalloc (per-stage Python peaks)")
+    args = ap.parse_args()
+    if any("=" not in a for a in args.api):
+        ap.error("--api expects NAME=URL")
+    if args.reset_history and args.mode != "full":
+        ap.error("--reset-history needs --mode full")
+
+    if args.archive or args.restore:
+        from dashboard_queries import month_key
+        months = [month_key(m) for m in args.archive or ()]
+        if None in months:
+            ap.error("--archive expects months as YYYY-MM")
+        for m, path in (archive(months, args.archive_dir) if months else {}).items():
+            print(f"  archived {partitions.table(m)} -> {path}")
+        for m in restore(args.restore) if args.restore else ():
+            print(f"  restored {partitions.table(m)}")
+        raise SystemExit(0)
+
+    # every stage of this run goes to etl_run_log (and the trace / profile, if asked for)
+    with instrument.Run("etl_pipeline", db_path=DB_PATH, trace_path=args.trace, profile=args.profile) as run:
+        if args.backfill:
+            from dashboard_queries import month_key
+            months = [month_key(m) for m in args.backfill]
+            if None in months:
+                ap.error("--backfill expects months as YYYY-MM")
+            stats = backfill(months, args.chunk_rows, {"journal_mode": args.journal_mode}, args.workers)
+        else:
+            if not args.skip_synthetic:
+                make_synthetic(args.customers, args.products, args.months, args.items_per_order, args.seed)
+            fetch_api_sample()
+            if args.api:
+                api_stats = api_extract.extract_api(DB_PATH, dict(a.split("=", 1) for a in args.api),
+                                                    concurrency=args.api_concurrency, rate=args.api_rate)
+                for name, r in api_stats.items():
+                    if name != "_http":
+                        print(f"  stg_api_{name:<28} {r['rows']:>12,} rows {r['seconds']:>8.2f}s "
+                              f"{r['pages']:>6,} pages" + (f"  FAILED {r['error']}" if r["error"] else ""))
+            stats = load_to_sqlite(args.mode, args.chunk_rows, {"journal_mode": args.journal_mode}, args.workers,
+                                   False if args.no_columnar else None, args.as_of, args.reset_history)
+    print("✅ Mini DWH built at", DB_PATH, f"({stats['mode']}: {stats['orders']:,} orders, {stats['items']:,} items)")
+    parts = sorted(stats["partitions"], key=lambda p: -(p["parse_seconds"] + p["load_seconds"]))
+    # one name column wide enough for the longest table, index (per partition) or file name
+    width = max(36, *map(len, stats["tables"]), *map(len, stats["indexes"]), *(len(p["file"]) for p in parts[:10]))
+    for table, t in stats["tables"].items():
+        print(f"  {table:<{width}} {t['rows']:>12,} rows {t['seconds']:>8.2f}s {t['rows_per_sec']:>14,.0f} rows/s")
+    for name, secs in stats["indexes"].items():
+        print(f"  {name:<{width}} {'index':>17} {secs:>8.2f}s")
+    if parts:
+        print(f"  {len(parts)} source file(s); slowest:")
+    for p in parts[:10]:
+        print(f"  {p['file']:<{width}} {p['rows']:>12,} rows {p['parse_seconds']:>8.2f}s parse "
+              f"{p['load_seconds']:>8.2f}s load  (pid {p['pid']})")
+    if stats.get("dq"):
+        print("  DQ:", ", ".join(f"{k}={v:,}" for k, v in stats["dq"].items()))
+    if "stage_dq" in stats:
+        print("  stage DQ:", ", ".join(f"{k}={v:,}" for k, v in stats["stage_dq"].items()))
+    print(f"\nrun {run.run_id} (etl_run_log):")
+    print(run.summary())
+    if run.report:
+        print(run.report)
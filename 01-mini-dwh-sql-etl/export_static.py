@@ -1,60 +1,248 @@
 from pathlib import Path
-import sqlite3, json, pandas as pd
+from contextlib import closing
+import argparse, gzip, hashlib, json, math, os, sqlite3
+from aggregates import KPI_STATUSES, ROLLUP
+from query_backend import get_backend
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 BASE = Path(__file__).resolve().parent
 DB_PATH = BASE / "mini_dwh.sqlite"
+# 👇 root/docs (one level UP from 01-mini-dwh-sql-etl/)
 DOCS = BASE.parent / "docs"
-DOCS.mkdir(parents=True, exist_ok=True)
+DATA = DOCS / "data"
+MANIFEST = DATA / "manifest.json"
 
+# Lazy, per-section export. Each section is one JSON file under docs/data/, declared as
+# name -> (tables it depends on, sql, orient[, finish]). A section is re-queried only when
+# the ETL version stamps (etl_data_version) of its tables moved since the manifest was
+# written, and its file is rewritten only when the content hash changed. With nothing
+# changed the run never opens the query engine. Files are replaced atomically; the
+# manifest goes last and carries each section's hash, which the page uses as a cache key.
+#
+# The page filters by month range, categories and payment methods on its own, by summing
+# cells of the cube sections: revenue and quantity per month x payment x category, distinct
+# orders per month x payment x category set (agg_cube's sets, so they stay exact), and per
+# product cells for the top list. All are columnar: axis lists plus flat row-major arrays,
+# money as integer cents. Their size is bounded by the cube (CUBE_MAX_CATEGORIES) and
+# EXPORT_MAX_PRODUCTS; the manifest records every file's raw and gzip size.
+EXPORT_MAX_PRODUCTS = 500       # products with cells in the export, by total revenue
+EXPORT_BUDGET_BYTES = 256_000   # gzip size of all sections above which the CLI warns
+_KPI = f"status IN {KPI_STATUSES} AND month_key <> 0 AND payment_method <> '{ROLLUP}'"
+SECTIONS = {
+    "cube_cells": (["agg_cube", "agg_cube_category"], f"""
+      SELECT c.month_key, c.payment_method, cc.category, SUM(c.revenue) AS revenue, SUM(c.quantity) AS quantity
+      FROM agg_cube c
+      JOIN agg_cube_category cc ON cc.bit = c.category_set
+      WHERE c.{_KPI.replace(" AND ", " AND c.")}
+      GROUP BY c.month_key, c.payment_method, cc.category""", "records",
+                   lambda rows: _dense(rows, ["month_key", "payment_method", "category"], {"revenue": _cents, "quantity": int})),
+    # cc.category names the single-category sets, which gives the page each category's bit
+    "cube_orders": (["agg_cube", "agg_cube_category"], f"""
+      SELECT c.month_key, c.payment_method, c.category_set, cc.category, SUM(c.orders) AS orders
+      FROM agg_cube c
+      LEFT JOIN agg_cube_category cc ON cc.bit = c.category_set
+      WHERE c.{_KPI.replace(" AND ", " AND c.")}
+      GROUP BY c.month_key, c.payment_method, c.category_set, cc.category""", "records",
+                    lambda rows: {**_dense(rows, ["month_key", "payment_method", "category_set"], {"orders": int}),
+                                  "bits": {r["category"]: int(r["category_set"]) for r in rows if r["category"]}}),
+    "cube_products": (["agg_cube_product", "dim_product"], f"""
+      WITH cells AS (
+        SELECT cp.month_key, cp.payment_method, cp.product_id, dp.category, dp.subcategory,
+               SUM(cp.revenue) AS revenue, SUM(cp.orders) AS orders
+        FROM agg_cube_product cp
+        JOIN dim_product dp ON dp.product_sk = cp.product_sk
+        WHERE cp.{_KPI.replace(" AND ", " AND cp.")}
+        GROUP BY cp.month_key, cp.payment_method, cp.product_id, dp.category, dp.subcategory),
+      ranked AS (
+        SELECT product_id, ROW_NUMBER() OVER (ORDER BY SUM(revenue) DESC, product_id) AS n
+        FROM cells GROUP BY product_id)
+      SELECT c.* FROM cells c JOIN ranked r USING (product_id)
+      WHERE r.n <= {EXPORT_MAX_PRODUCTS}
+      ORDER BY c.month_key, c.payment_method, c.product_id, c.category, c.subcategory""", "records",
+                      lambda rows: _sparse(rows, ["month_key", "payment_method", ("product_id", "category", "subcategory")],
+                                           {"revenue": _cents, "orders": int})),
+    # totals over every filter, plus the failures recorded by the last ETL run's DQ rules
+    "kpis": (["agg_sales_month", "dq_results"], """
+      SELECT COALESCE(SUM(revenue), 0) AS revenue, COALESCE(SUM(orders), 0) AS orders,
+             (SELECT COALESCE(SUM(failed_rows), 0) FROM v_dq_latest) AS dq_issues
+      FROM v_monthly_kpis""", "records", lambda rows: _kpis(**rows[0])),
+}
+COMPRESSORS = {"gzip": ".gz", "brotli": ".br"}
 
-# 👇 root/docs (one level UP from 01-mini-dwh-sql-etl/)
 
+def _kpis(revenue, orders, dq_issues):
+    revenue, orders = float(revenue), int(orders)
+    return {"revenue": round(revenue, 2), "orders": orders, "aov": round(revenue / max(orders, 1), 2),
+            "dq_issues": int(dq_issues)}
+
+
+def _cents(value):
+    return int(round(float(value or 0) * 100))
+
+
+def _axis(rows, key):
+    # sorted distinct values of a column (or of a tuple of columns)
+    cols = key if isinstance(key, tuple) else (key,)
+    values = sorted({tuple(r[c] for c in cols) for r in rows}, key=lambda v: tuple(str(x) for x in v))
+    return [v if isinstance(key, tuple) else v[0] for v in values]
+
+
+def _dense(rows, keys, measures):
+    """Columnar cube: one axis list per key and, per measure, a flat row-major array
+    over all axis combinations (missing cells are 0)."""
+    axes = [_axis(rows, k) for k in keys]
+    index = [{v: i for i, v in enumerate(a)} for a in axes]
+    size = math.prod(map(len, axes))
+    out = {"axes": keys, **{k: a for k, a in zip(keys, axes)}, **{m: [0] * size for m in measures}}
+    for r in rows:
+        i = 0
+        for k, idx, a in zip(keys, index, axes):
+            i = i * len(a) + idx[r[k]]
+        for m, conv in measures.items():
+            out[m][i] = conv(r[m])
+    return out
+
+
+def _sparse(rows, keys, measures):
+    """Columnar cells for sparse data: axis lists, one index array per key and one
+    array per measure, a row per non-empty cell. A tuple key becomes parallel lists."""
+    axes = [_axis(rows, k) for k in keys]
+    out = {}
+    for k, a in zip(keys, axes):
+        if isinstance(k, tuple):
+            out.update({c: [v[j] for v in a] for j, c in enumerate(k)})
+        else:
+            out[k] = a
+    index = [{v: i for i, v in enumerate(a)} for a in axes]
+    names = ["_".join(k) if isinstance(k, tuple) else k for k in keys]
+    for k, name, idx in zip(keys, names, index):
+        out[f"{name}_idx"] = [idx[tuple(r[c] for c in k) if isinstance(k, tuple) else r[k]] for r in rows]
+    out.update({m: [conv(r[m]) for r in rows] for m, conv in measures.items()})
+    return out
+
+
+def _compact(value, digits=2):
+    # floats rounded to `digits`, whole floats written as integers
+    if isinstance(value, float):
+        value = round(value, digits) if math.isfinite(value) else None
+        return int(value) if value is not None and value.is_integer() else value
+    if isinstance(value, dict):
+        return {k: _compact(v, digits) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_compact(v, digits) for v in value]
+    return value
+
+
+def encode(payload, compact=False):
+    if compact:
+        return json.dumps(_compact(payload), separators=(",", ":"), default=str).encode()
+    return json.dumps(payload, indent=2, default=str).encode()
+
+
+def write_atomic(path, data):
+    """Write bytes to path via a temp file in the same directory and an atomic rename."""
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+def _compress(kind, data):
+    if kind == "gzip":
+        return gzip.compress(data, 9, mtime=0)
+    return brotli.compress(data, quality=11) if brotli is not None else None
 
-# --- read from SQLite views (already created by your ETL)
-con = sqlite3.connect(DB_PATH)
-
-monthly = pd.read_sql("""
-  SELECT month, revenue, orders, aov
-  FROM v_monthly_kpis
-  ORDER BY month
-""", con)
-
-top = pd.read_sql("""
-  SELECT product_id, category, subcategory, revenue
-  FROM v_top_products
-  ORDER BY revenue DESC
-  LIMIT 10
-""", con)
-
-cat = pd.read_sql("""
-  SELECT category, revenue, pct
-  FROM v_category_contribution
-  ORDER BY revenue DESC
-""", con)
-
-dq_null = pd.read_sql("SELECT COUNT(*) AS issues FROM dq_nulls;", con)["issues"].iloc[0]
-dq_neg  = pd.read_sql("SELECT COUNT(*) AS issues FROM dq_negative_qty;", con)["issues"].iloc[0]
-
-tot_rev = float(monthly["revenue"].sum())
-tot_orders = int(monthly["orders"].sum())
-aov = float(tot_rev / max(tot_orders, 1))
-payload = {
-    "kpis": {
-        "revenue": round(tot_rev, 2),
-        "orders": tot_orders,
-        "aov": round(aov, 2),
-        "dq_issues": int(dq_null + dq_neg)
-    },
-    "monthly": monthly.to_dict(orient="list"),
-    "top_products": top.to_dict(orient="records"),
-    "category": cat.to_dict(orient="records")
-}
 
-# --- write JSON
-(DOCS / "data.json").write_text(json.dumps(payload, indent=2), encoding="utf-8")
+def publish(path, data, compress=(), force=False):
+    """Write data to path unless it already holds exactly that, plus pre-compressed
+    siblings (file.gz / file.br) a static host can serve as-is; siblings of formats no
+    longer asked for are removed so they never go stale. Returns "written" or "unchanged"."""
+    changed = force or not path.is_file() or path.read_bytes() != data
+    if changed:
+        write_atomic(path, data)
+    for kind, suffix in COMPRESSORS.items():
+        sibling = path.with_name(path.name + suffix)
+        if kind not in compress:
+            sibling.unlink(missing_ok=True)
+        elif changed or not sibling.is_file():
+            packed = _compress(kind, data)
+            if packed is not None:
+                write_atomic(sibling, packed)
+    return "written" if changed else "unchanged"
 
-# --- write a static HTML dashboard that loads data.json and draws charts
-html = """<!doctype html>
+
+def _versions(db_path):
+    try:
+        with closing(sqlite3.connect(f"{Path(db_path).resolve().as_uri()}?mode=ro", uri=True)) as con:
+            return dict(con.execute("SELECT table_name, version FROM etl_data_version"))
+    except sqlite3.Error:
+        return {}
+
+
+def _load_manifest():
+    try:
+        return json.loads(MANIFEST.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def export(db_path=DB_PATH, compact=False, compress=(), force=False):
+    """Bring docs/ up to date with the warehouse; returns {file: "written" | "unchanged"}."""
+    DATA.mkdir(parents=True, exist_ok=True)
+    compress = tuple(compress)
+    old = _load_manifest()
+    # sections written with other encoding options are re-encoded
+    old_sections = old.get("sections", {}) if old.get("options") == [compact, list(compress)] else {}
+    versions = _versions(db_path)
+    status, sections, todo = {}, {}, []
+    for name, (tables, sql, *_) in SECTIONS.items():
+        # no stamp for a table (no ETL run recorded it yet): always re-query, compare content
+        stamps = [versions.get(t) for t in tables]
+        source = None if None in stamps else hashlib.sha256(repr((sql, stamps)).encode()).hexdigest()
+        prev = old_sections.get(name, {})
+        if not force and source and prev.get("source") == source and (DATA / prev.get("file", "")).is_file():
+            sections[name], status[f"data/{prev['file']}"] = prev, "unchanged"
+        else:
+            todo.append((name, source))
+
+    if todo:
+        # --- read only the stale sections through the configured engine (DWH_BACKEND: sqlite or duckdb)
+        engine = get_backend(os.environ.get("DWH_BACKEND"), db_path)
+        try:
+            frames = {name: engine.query(SECTIONS[name][1]) for name, _ in todo}
+        finally:
+            engine.close()
+        for name, source in todo:
+            _, _, orient, *finish = SECTIONS[name]
+            payload = frames[name].to_dict(orient=orient)
+            data = encode(finish[0](payload) if finish else payload, compact)
+            digest = hashlib.sha256(data).hexdigest()[:16]
+            path = DATA / f"{name}.json"
+            status[f"data/{path.name}"] = publish(path, data, compress, force)
+            sections[name] = {"file": path.name, "hash": digest, "bytes": len(data),
+                              "gzip_bytes": len(_compress("gzip", data)), "source": source}
+
+    # files of sections that are no longer declared go, with their compressed copies
+    for name, prev in old.get("sections", {}).items():
+        if name not in SECTIONS and prev.get("file"):
+            for suffix in ("", *COMPRESSORS.values()):
+                (DATA / (prev["file"] + suffix)).unlink(missing_ok=True)
+    status["index.html"] = publish(DOCS / "index.html", HTML.encode(), compress, force)
+    manifest = {"options": [compact, list(compress)], "sections": sections}
+    if manifest != old:
+        write_atomic(MANIFEST, json.dumps(manifest, indent=2).encode())
+    return status
+
+
+# --- a static HTML dashboard that loads the sections listed in data/manifest.json, then
+# filters and draws entirely in the browser by summing the cube cells
+HTML = """<!doctype html>
 <html lang="en">
 <head>
 <meta charset="utf-8"/>
@@ -73,6 +261,8 @@ html = """<!doctype html>
   .label { color:var(--muted); font-size:13px; }
   .value { font-size:24px; font-weight:800; }
   .two { grid-template-columns:1fr 1fr; }
+  .filters { display:flex; flex-wrap:wrap; gap:12px 28px; align-items:center; margin-bottom:16px; font-size:14px; }
+  .filters label { margin-right:10px; white-space:nowrap; }
   footer { margin-top:24px; text-align:center; color:var(--muted); font-size:14px; }
   @media (max-width:900px) {
     .kpis { grid-template-columns:1fr 1fr; }
@@ -85,6 +275,12 @@ html = """<!doctype html>
   <h1>Mini Data Warehouse — E-commerce KPIs</h1>
   <div class="sub">Static snapshot (instant load). Built from CSV/API → SQLite views.</div>
 
+  <div class="card filters">
+    <div><span class="label">Months</span> <select id="from"></select> – <select id="to"></select></div>
+    <div><span class="label">Categories</span> <span id="cats"></span></div>
+    <div><span class="label">Payment</span> <span id="pmts"></span></div>
+  </div>
+
   <div class="grid kpis">
     <div class="card"><div class="label">Revenue</div><div class="value" id="rev">–</div></div>
     <div class="card"><div class="label">Orders</div><div class="value" id="ord">–</div></div>
@@ -104,39 +300,106 @@ html = """<!doctype html>
 
 <script src="https://cdn.plot.ly/plotly-2.35.2.min.js"></script>
 <script>
-fetch('data.json').then(r => r.json()).then(d => {
-  // KPI cards
-  const fmt = (n)=> Number(n).toLocaleString();
-  document.getElementById('rev').textContent = fmt(Math.round(d.kpis.revenue));
-  document.getElementById('ord').textContent = fmt(d.kpis.orders);
-  document.getElementById('aov').textContent = fmt(Math.round(d.kpis.aov));
-  document.getElementById('dq').textContent  = fmt(d.kpis.dq_issues);
-
-  // Monthly line (revenue + orders, twin axes)
-  const months = d.monthly.month, rev = d.monthly.revenue, ord = d.monthly.orders;
-  Plotly.newPlot('monthly', [
-    {x: months, y: rev, name:'Revenue', mode:'lines+markers'},
-    {x: months, y: ord, name:'Orders', mode:'lines+markers', yaxis:'y2'}
-  ], {
-    title:'Monthly KPIs', margin:{t:30,r:40,l:50,b:40},
-    yaxis:{title:'Revenue'}, yaxis2:{title:'Orders', overlaying:'y', side:'right'}
-  }, {displayModeBar:false, responsive:true});
-
-  // Top products bar
-  const tp = d.top_products, px = tp.map(t=>t.product_id), py = tp.map(t=>t.revenue);
-  Plotly.newPlot('top', [{x:px, y:py, type:'bar', name:'Revenue'}],
-    {title:'Top 10 Products by Revenue', margin:{t:30,r:10,l:40,b:80}, xaxis:{tickangle:-45}},
-    {displayModeBar:false, responsive:true});
-
-  // Category share pie
-  const cx = d.category.map(c=>c.category), cy = d.category.map(c=>c.revenue);
-  Plotly.newPlot('cat', [{labels: cx, values: cy, type:'pie', textinfo:'label+percent'}],
-    {title:'Category Contribution', margin:{t:30,r:10,l:10,b:10}},
-    {displayModeBar:false, responsive:true});
+// the manifest is always revalidated; a section URL changes with its content hash, so it can be cached
+const section = (m, name) => fetch('data/' + m.sections[name].file + '?v=' + m.sections[name].hash).then(r => r.json());
+const $ = (id) => document.getElementById(id);
+const fmt = (n) => Number(n).toLocaleString();
+const month = (k) => String(k).slice(0, 4) + '-' + String(k).slice(4);
+const opts = {displayModeBar:false, responsive:true};
+
+fetch('data/manifest.json', {cache:'no-cache'}).then(r => r.json()).then(m => Promise.all(
+  ['cube_cells', 'cube_orders', 'cube_products', 'kpis'].map(n => section(m, n))
+)).then(([cells, ord, prod, k]) => {
+  $('dq').textContent = fmt(k.dq_issues);
+  const M = cells.month_key, P = cells.payment_method, C = cells.category;
+  for (const id of ['from', 'to'])
+    $(id).innerHTML = M.map((mk, i) => `<option value="${i}">${month(mk)}</option>`).join('');
+  $('to').value = M.length - 1;
+  const boxes = (id, values) => $(id).innerHTML = values.map((v, i) =>
+    `<label><input type="checkbox" value="${i}" checked> ${v}</label>`).join('');
+  boxes('cats', C); boxes('pmts', P);
+  const checked = (id) => [...$(id).querySelectorAll('input:checked')].map(e => +e.value);
+  // cube_orders has its own axes; map them by value
+  const oM = M.map(mk => ord.month_key.indexOf(mk)), oP = P.map(p => ord.payment_method.indexOf(p));
+  const S = ord.category_set.length;
+
+  function draw() {
+    let lo = +$('from').value, hi = +$('to').value;
+    if (lo > hi) [lo, hi] = [hi, lo];
+    const ms = M.map((_, i) => i).filter(i => i >= lo && i <= hi), ps = checked('pmts'), cs = checked('cats');
+    const catRev = C.map(() => 0), monRev = [], monOrd = [];
+    // an order can span categories, so orders come from the row of the selected set;
+    // a set the cube did not materialize falls back to the sum of its categories (an upper bound)
+    const mask = cs.reduce((a, c) => a | ord.bits[C[c]], 0), s = ord.category_set.indexOf(mask);
+    const sets = s >= 0 ? [s] : cs.map(c => ord.category_set.indexOf(ord.bits[C[c]]));
+    for (const mi of ms) {
+      let r = 0, o = 0;
+      for (const p of ps) {
+        for (const c of cs) {
+          const v = cells.revenue[(mi * P.length + p) * C.length + c];
+          r += v; catRev[c] += v;
+        }
+        if (oM[mi] >= 0 && oP[p] >= 0) for (const x of sets) if (x >= 0) o += ord.orders[(oM[mi] * ord.payment_method.length + oP[p]) * S + x];
+      }
+      monRev.push(r / 100); monOrd.push(o);
+    }
+    const rev = monRev.reduce((a, b) => a + b, 0), orders = monOrd.reduce((a, b) => a + b, 0);
+    const approx = cs.length && s < 0 ? '≤ ' : '';
+    $('rev').textContent = fmt(Math.round(rev));
+    $('ord').textContent = approx + fmt(orders);
+    $('aov').textContent = fmt(Math.round(rev / Math.max(orders, 1)));
+
+    Plotly.react('monthly', [
+      {x: ms.map(i => month(M[i])), y: monRev, name:'Revenue', mode:'lines+markers'},
+      {x: ms.map(i => month(M[i])), y: monOrd, name:'Orders', mode:'lines+markers', yaxis:'y2'}
+    ], {
+      title:'Monthly KPIs', margin:{t:30,r:40,l:50,b:40},
+      yaxis:{title:'Revenue'}, yaxis2:{title:'Orders', overlaying:'y', side:'right'}
+    }, opts);
+
+    // top products: sum the sparse product cells that pass the filters, per product_id
+    // (a product with several dimension versions has cells under each of its categories)
+    const mk = new Set(ms.map(i => M[i])), pk = new Set(ps.map(p => P[p])), ck = new Set(cs.map(c => C[c]));
+    const byProduct = new Map(), pi = prod.product_id_category_subcategory_idx;
+    for (let i = 0; i < pi.length; i++) {
+      if (!mk.has(prod.month_key[prod.month_key_idx[i]]) || !pk.has(prod.payment_method[prod.payment_method_idx[i]])
+          || !ck.has(prod.category[pi[i]])) continue;
+      const id = prod.product_id[pi[i]];
+      byProduct.set(id, (byProduct.get(id) || 0) + prod.revenue[i]);
+    }
+    const top = [...byProduct].sort((a, b) => b[1] - a[1] || a[0] - b[0]).slice(0, 10);
+    Plotly.react('top', [{x: top.map(t => String(t[0])), y: top.map(t => t[1] / 100), type:'bar', name:'Revenue'}],
+      {title:'Top 10 Products by Revenue', margin:{t:30,r:10,l:40,b:80}, xaxis:{tickangle:-45, type:'category'}}, opts);
+
+    Plotly.react('cat', [{labels: cs.map(c => C[c]), values: cs.map(c => catRev[c] / 100), type:'pie', textinfo:'label+percent'}],
+      {title:'Category Contribution', margin:{t:30,r:10,l:10,b:10}}, opts);
+  }
+  document.querySelectorAll('.filters select, .filters input').forEach(e => e.addEventListener('change', draw));
+  draw();
 });
 </script>
 </body>
 </html>
 """
-(DOCS / "index.html").write_text(html, encoding="utf-8")
-print(f"✅ Wrote {DOCS/'index.html'} and {DOCS/'data.json'}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Export the KPI views as a static site in docs/")
+    ap.add_argument("--compact", action="store_true",
+                    help="minified JSON, floats rounded to 2 decimals and whole numbers written as integers")
+    ap.add_argument("--compress", nargs="+", choices=sorted(COMPRESSORS), default=[],
+                    help="also write pre-compressed .gz / .br copies (brotli needs the optional brotli package)")
+    ap.add_argument("--force", action="store_true", help="re-query and rewrite every section")
+    args = ap.parse_args()
+    if "brotli" in args.compress and brotli is None:
+        print("⚠️  brotli is not installed; skipping .br copies")
+    status = export(DB_PATH, args.compact, args.compress, args.force)
+    sections = _load_manifest().get("sections", {})
+    for name, sec in sections.items():
+        print(f"   {sec['file']:<22} {sec['bytes']:>9,} bytes  {sec.get('gzip_bytes', 0):>8,} gzip")
+    packed = sum(sec.get("gzip_bytes", 0) for sec in sections.values())
+    if packed > EXPORT_BUDGET_BYTES:
+        print(f"⚠️  sections total {packed:,} gzip bytes, over the {EXPORT_BUDGET_BYTES:,} budget")
+    written = [f for f, s in status.items() if s == "written"]
+    print(f"✅ {DOCS}: " + (f"wrote {', '.join(written)}" if written else "up to date")
+          + f" ({len(status) - len(written)} unchanged)")
@@ -0,0 +1,190 @@
+import hashlib, math, os, numpy as np
+
+# HyperLogLog sketches for distinct counts that have to survive pre-aggregation:
+# a sketch per aggregate row, merged (register-wise max) across any set of rows,
+# gives the distinct count of their union within ~1.04/sqrt(2^p) relative error.
+# DWH_HLL_ERROR picks the precision p. Blobs start with p and an encoding byte;
+# small sketches are stored sparse as (register << 8 | rank) uint32 pairs, large
+# ones as the dense 2^p register bytes, whichever is shorter.
+ERROR = float(os.environ.get("DWH_HLL_ERROR", 0.02))
+MIN_P, MAX_P = 4, 16
+DENSE, SPARSE = 0, 1
+_MASK = (1 << 64) - 1
+
+
+def precision_for(error):
+    """Smallest precision whose standard error is within `error`."""
+    return min(max(math.ceil(math.log2((1.04 / error) ** 2)), MIN_P), MAX_P)
+
+PRECISION = precision_for(ERROR)
+
+
+def _key(value):
+    # integers hash as their 64-bit two's complement, anything else through its text
+    if isinstance(value, (int, np.integer)):
+        return int(value) & _MASK
+    return int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), "little")
+
+
+def _mix(x):
+    # splitmix64 finalizer, on numpy uint64 arrays (wrapping) or masked Python ints
+    if isinstance(x, np.ndarray):
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return x ^ (x >> np.uint64(31))
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _MASK
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MASK
+    return x ^ (x >> 31)
+
+
+def _clz64(x):
+    # exact leading zeros of uint64s: each 32-bit half is exact as a float64
+    hi, lo = (x >> np.uint64(32)).astype(np.float64), (x & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    with np.errstate(divide="ignore"):
+        return np.where(hi > 0, 31 - np.floor(np.log2(hi)),
+                        np.where(lo > 0, 63 - np.floor(np.log2(lo)), 64)).astype(np.uint8)
+
+
+def _sigma(x):
+    if x == 1:
+        return math.inf
+    y, z = 1.0, x
+    while True:
+        x *= x
+        z, prev = z + x * y, z
+        y += y
+        if z == prev:
+            return z
+
+
+def _tau(x):
+    if x in (0, 1):
+        return 0.0
+    y, z = 1.0, 1 - x
+    while True:
+        x = math.sqrt(x)
+        y *= 0.5
+        z, prev = z - (1 - x) ** 2 * y, z
+        if z == prev:
+            return z / 3
+
+
+class HLL:
+    __slots__ = ("p", "registers")
+
+    def __init__(self, p=PRECISION, registers=None):
+        if not MIN_P <= p <= MAX_P:
+            raise ValueError(f"HLL precision must be in [{MIN_P}, {MAX_P}], got {p}")
+        self.p = p
+        self.registers = np.zeros(1 << p, np.uint8) if registers is None else registers
+
+    @classmethod
+    def of(cls, values, p=PRECISION):
+        return cls(p).update(values)
+
+    def update(self, values):
+        """Add an iterable (or array) of values; None/NaN are skipped like COUNT(DISTINCT)."""
+        arr = np.asarray(values)
+        if arr.dtype.kind in "iu":
+            keys = arr.astype(np.uint64)
+        else:
+            keys = np.fromiter((_key(v) for v in arr.ravel() if v is not None and v == v),
+                               np.uint64)
+        if keys.size:
+            h = _mix(keys)
+            idx = (h >> np.uint64(64 - self.p)).astype(np.int64)
+            rank = np.minimum(_clz64(h << np.uint64(self.p)) + 1, 64 - self.p + 1).astype(np.uint8)
+            np.maximum.at(self.registers, idx, rank)
+        return self
+
+    def add(self, value):
+        if value is None or value != value:
+            return self
+        h = _mix(_key(value))
+        idx, rest = h >> (64 - self.p), (h << self.p) & _MASK
+        rank = min(64 - rest.bit_length() + 1, 64 - self.p + 1)
+        if rank > self.registers[idx]:
+            self.registers[idx] = rank
+        return self
+
+    def merge(self, other):
+        if other.p != self.p:
+            raise ValueError(f"cannot merge HLL sketches of precision {self.p} and {other.p}")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def count(self):
+        # Ertl's improved estimator ("New cardinality estimation algorithms for
+        # HyperLogLog sketches", 2017): unbiased from 0 up, no empirical bias tables
+        m, q = 1 << self.p, 64 - self.p
+        c = np.bincount(self.registers, minlength=q + 2)
+        z = m * _tau(1 - c[q + 1] / m)
+        for k in range(q, 0, -1):
+            z = 0.5 * (z + c[k])
+        z += m * _sigma(c[0] / m)
+        return 0 if math.isinf(z) else int(round(m * m / (2 * math.log(2) * z)))
+
+    def to_bytes(self):
+        nz = np.flatnonzero(self.registers)
+        if len(nz) * 4 < len(self.registers):
+            pairs = (nz.astype("<u4") << 8) | self.registers[nz]
+            return bytes((self.p, SPARSE)) + pairs.astype("<u4").tobytes()
+        return bytes((self.p, DENSE)) + self.registers.tobytes()
+
+    @classmethod
+    def from_bytes(cls, blob):
+        p, encoding, body = blob[0], blob[1], bytes(blob[2:])
+        if encoding == DENSE:
+            return cls(p, np.frombuffer(body, np.uint8).copy())
+        pairs = np.frombuffer(body, "<u4")
+        sketch = cls(p)
+        sketch.registers[(pairs >> 8).astype(np.int64)] = (pairs & 0xFF).astype(np.uint8)
+        return sketch
+
+
+def merge_all(blobs, p=PRECISION):
+    """Union of serialized sketches (None entries are empty)."""
+    out = None
+    for blob in blobs:
+        if blob is not None:
+            sketch = HLL.from_bytes(blob)
+            out = sketch if out is None else out.merge(sketch)
+    return out or HLL(p)
+
+
+def count_blobs(blobs):
+    return merge_all(blobs).count()
+
+
+# --- SQLite: hll_sketch(value) / hll_merge(blob) aggregates, hll_count(blob) scalar
+def register(con, p=PRECISION):
+    """Register the HLL functions on a sqlite3 connection."""
+    class Sketch:
+        def __init__(self):
+            self.values = []
+
+        def step(self, value):
+            if value is not None:
+                self.values.append(value)
+
+        def finalize(self):
+            return HLL.of(self.values, p).to_bytes()
+
+    class Merge:
+        def __init__(self):
+            self.blobs = []
+
+        def step(self, blob):
+            self.blobs.append(blob)
+
+        def finalize(self):
+            # like SUM(), NULL when there was nothing to merge
+            if all(b is None for b in self.blobs):
+                return None
+            return merge_all(self.blobs, p).to_bytes()
+
+    con.create_aggregate("hll_sketch", 1, Sketch)
+    con.create_aggregate("hll_merge", 1, Merge)
+    con.create_function("hll_count", 1, lambda blob: None if blob is None else HLL.from_bytes(blob).count(),
+                        deterministic=True)
+    return con
@@ -0,0 +1,244 @@
+import contextvars, io, json, os, resource, sqlite3, threading, time, uuid
+from contextlib import contextmanager
+
+# Per-stage instrumentation for the ETL. Code marks its steps with
+#     with stage("fact_load") as st: ...; st.rows_out = n
+# and whatever Run is active records wall/CPU time, peak RSS, rows in/out and the bytes
+# the process read/wrote (Linux /proc counters; None elsewhere). Outside a Run a stage
+# costs two clock reads and records nothing. A Run can persist to etl_run_log, write a
+# Chrome trace (chrome://tracing, ui.perfetto.dev) and wrap everything in cProfile or
+# tracemalloc.
+
+RUN_LOG_DDL = """
+  CREATE TABLE IF NOT EXISTS etl_run_log(
+    run_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    stage TEXT NOT NULL,
+    parent TEXT,
+    started_at TEXT,
+    wall_seconds REAL,
+    cpu_seconds REAL,
+    peak_rss_mb REAL,
+    rows_in INTEGER,
+    rows_out INTEGER,
+    bytes_read INTEGER,
+    bytes_written INTEGER,
+    extra TEXT,
+    PRIMARY KEY (run_id, seq)
+  )"""
+
+_current = contextvars.ContextVar("etl_run", default=None)
+_open = contextvars.ContextVar("etl_stage", default=None)
+
+
+def _io():
+    # bytes moved through read()/write() by this process, page cache included
+    try:
+        with open("/proc/self/io") as f:
+            fields = dict(line.split(":") for line in f)
+        return int(fields["rchar"]), int(fields["wchar"])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _hwm_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024     # KiB on Linux
+
+
+def _reset_hwm():
+    # "5" resets VmHWM to the current RSS, so each stage sees its own peak (Linux only)
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+class Stage:
+    __slots__ = ("name", "parent", "started", "wall", "cpu", "peak_rss_mb", "rows_in", "rows_out",
+                 "bytes_read", "bytes_written", "extra", "_t0", "_cpu0", "_io0", "_child_peak")
+
+    def __init__(self, name, parent=None, **extra):
+        self.name, self.parent, self.extra = name, parent, extra
+        self.rows_in = self.rows_out = self.bytes_read = self.bytes_written = None
+        self.wall = self.cpu = self.peak_rss_mb = None
+        self._child_peak = 0.0
+
+    def as_row(self):
+        return {"stage": self.name, "parent": self.parent.name if self.parent else None,
+                "started_at": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.started)),
+                "wall_seconds": self.wall, "cpu_seconds": self.cpu, "peak_rss_mb": self.peak_rss_mb,
+                "rows_in": self.rows_in, "rows_out": self.rows_out,
+                "bytes_read": self.bytes_read, "bytes_written": self.bytes_written,
+                "extra": self.extra}
+
+
+@contextmanager
+def stage(name, **extra):
+    """Time one step of the active Run (if any); yields a Stage whose rows_in/rows_out
+    (and extra dict) the caller may fill in."""
+    run, parent = _current.get(), _open.get()
+    st = Stage(name, parent, **extra)
+    st.started, st._t0, st._cpu0 = time.time(), time.perf_counter(), time.process_time()
+    if run is None:
+        yield st
+        st.wall = time.perf_counter() - st._t0
+        return
+    if parent is not None:
+        parent._child_peak = max(parent._child_peak, _hwm_mb())
+    run._hwm_resettable = run._hwm_resettable and _reset_hwm()
+    if run.profile == "tracemalloc":
+        run._tracemalloc.reset_peak()
+    st._io0 = _io()
+    token = _open.set(st)
+    try:
+        yield st
+    finally:
+        _open.reset(token)
+        st.wall = time.perf_counter() - st._t0
+        st.cpu = time.process_time() - st._cpu0
+        st.peak_rss_mb = max(_hwm_mb(), st._child_peak)
+        io1 = _io()
+        if st._io0 and io1:
+            st.bytes_read, st.bytes_written = io1[0] - st._io0[0], io1[1] - st._io0[1]
+        if run.profile == "tracemalloc":
+            st.extra["py_peak_mb"] = run._tracemalloc.get_traced_memory()[1] / 2**20
+        if parent is not None:
+            parent._child_peak = max(parent._child_peak, st.peak_rss_mb)
+        run._record(st)
+
+
+def annotate(**fields):
+    """Set rows_in/rows_out/bytes_* (or extra keys) on the innermost open stage."""
+    st = _open.get()
+    if st is None:
+        return
+    for k, v in fields.items():
+        if k in Stage.__slots__ and not k.startswith("_"):
+            setattr(st, k, v)
+        else:
+            st.extra[k] = v
+
+
+def timed(name=None):
+    """Decorator form of stage()."""
+    def wrap(fn):
+        def inner(*args, **kwargs):
+            with stage(name or fn.__name__):
+                return fn(*args, **kwargs)
+        inner.__name__, inner.__doc__, inner.__wrapped__ = fn.__name__, fn.__doc__, fn
+        return inner
+    return wrap
+
+
+class Run:
+    """Collects the stages run inside it. db_path: persist them to etl_run_log on exit;
+    trace_path: write a Chrome trace JSON; profile: None, "cprofile" or "tracemalloc"
+    (profile_path receives the cProfile stats, default <trace or run_id>.prof)."""
+
+    def __init__(self, name="etl", db_path=None, trace_path=None, profile=None, profile_path=None):
+        if profile not in (None, "cprofile", "tracemalloc"):
+            raise ValueError(f"unknown profile mode: {profile!r}")
+        self.name, self.db_path, self.trace_path = name, db_path, trace_path
+        self.profile, self.profile_path = profile, profile_path
+        self.run_id = time.strftime("%Y%m%dT%H%M%S-") + uuid.uuid4().hex[:6]
+        self.stages, self.report = [], None
+        self._lock = threading.Lock()
+        self._hwm_resettable = True
+        self._token = self._root = self._profiler = self._tracemalloc = None
+
+    def _record(self, st):
+        with self._lock:
+            self.stages.append(st)
+
+    def __enter__(self):
+        if self.profile == "cprofile":
+            import cProfile
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        elif self.profile == "tracemalloc":
+            import tracemalloc
+            self._tracemalloc = tracemalloc
+            tracemalloc.start(10)
+        self._token = _current.set(self)
+        self._root = stage(self.name)
+        self._root.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        self._root.__exit__(*exc)
+        _current.reset(self._token)
+        if self._profiler:
+            self._profiler.disable()
+            import pstats
+            path = self.profile_path or f"{self.trace_path or self.run_id}.prof"
+            self._profiler.dump_stats(path)
+            out = io.StringIO()
+            pstats.Stats(self._profiler, stream=out).sort_stats("cumulative").print_stats(20)
+            self.report = f"cProfile stats written to {path}\n{out.getvalue()}"
+        if self._tracemalloc:
+            top = self._tracemalloc.take_snapshot().statistics("lineno")[:15]
+            self._tracemalloc.stop()
+            self.report = "top allocations still live at the end of the run:\n" + "\n".join(map(str, top))
+        if self.trace_path:
+            self.write_trace(self.trace_path)
+        if self.db_path and exc[0] is None:
+            self.persist(self.db_path)
+        return False
+
+    def rows(self):
+        return [{"run_id": self.run_id, "seq": i, **st.as_row()} for i, st in enumerate(self.stages)]
+
+    def persist(self, db_path):
+        con = sqlite3.connect(db_path)
+        try:
+            with con:
+                con.execute(RUN_LOG_DDL)
+                con.executemany(
+                    "INSERT INTO etl_run_log VALUES (:run_id, :seq, :stage, :parent, :started_at, :wall_seconds,"
+                    " :cpu_seconds, :peak_rss_mb, :rows_in, :rows_out, :bytes_read, :bytes_written, :extra)",
+                    [{**r, "extra": json.dumps(r["extra"]) if r["extra"] else None} for r in self.rows()])
+        finally:
+            con.close()
+
+    def write_trace(self, path):
+        pid = os.getpid()
+        events = [{"name": st.name, "cat": "etl", "ph": "X", "pid": pid, "tid": 1,
+                   "ts": int(st.started * 1e6), "dur": int(st.wall * 1e6),
+                   "args": {k: v for k, v in st.as_row().items()
+                            if k not in ("stage", "parent", "started_at", "wall_seconds") and v not in (None, {})}}
+                  for st in self.stages]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms",
+                       "otherData": {"run_id": self.run_id}}, f)
+
+    def summary(self):
+        lines = [f"  {'stage':<34} {'wall s':>8} {'cpu s':>8} {'peak MiB':>9} {'rows out':>12} {'MiB read':>9} {'MiB written':>11}"]
+        for st in sorted(self.stages, key=lambda s: s.started):
+            depth, p = 0, st.parent
+            while p is not None:
+                depth, p = depth + 1, p.parent
+            mib = lambda b: "" if b is None else f"{b / 2**20:,.1f}"
+            lines.append(f"  {'  ' * depth + st.name:<34} {st.wall:>8.2f} {st.cpu:>8.2f} {st.peak_rss_mb:>9,.0f} "
+                         f"{'' if st.rows_out is None else f'{st.rows_out:,}':>12} {mib(st.bytes_read):>9} "
+                         f"{mib(st.bytes_written):>11}")
+        return "\n".join(lines)
+
+
+@contextmanager
+def ensure_run(name, db_path=None, **options):
+    """Join the active Run, or start (and on exit persist) a new one."""
+    run = _current.get()
+    if run is not None:
+        yield run
+        return
+    with Run(name, db_path=db_path, **options) as run:
+        yield run
@@ -0,0 +1,224 @@
+import time
+from pathlib import Path
+from bulk_load import transaction
+
+# fact_sales is stored as one table per order month, fact_sales_m<yyyymm> (fact_sales_m0
+# holds the lines whose month is unknown), behind a UNION ALL view named fact_sales.
+# Readers that know their month range route to just those tables with source(); a
+# month can be rebuilt next to the live one and swapped in atomically, and old months
+# can be detached into their own .sqlite file for archiving and restored later.
+# etl_partition is the catalog: one row per month, online or archived (with its file).
+VIEW = "fact_sales"
+PREFIX = "fact_sales_m"
+UNKNOWN_MONTH = 0
+ARCHIVE_DIR = Path(__file__).parent / "archive"
+
+FACT_DDL = """(
+    sales_id INTEGER PRIMARY KEY,            -- unique within its partition
+    order_id INTEGER,
+    date_key INTEGER REFERENCES dim_date(date_key),
+    month_key INTEGER,
+    customer_id INTEGER,
+    customer_sk INTEGER REFERENCES dim_customer(customer_sk),
+    product_id INTEGER,
+    product_sk INTEGER REFERENCES dim_product(product_sk),
+    quantity INTEGER,
+    unit_price REAL,
+    discount REAL,
+    status TEXT,
+    payment_method TEXT,
+    revenue REAL
+  )"""
+
+CATALOG_DDL = """
+  CREATE TABLE IF NOT EXISTS etl_partition(
+    month_key INTEGER PRIMARY KEY,     -- yyyymm, 0 = unknown month
+    table_name TEXT NOT NULL,
+    state TEXT NOT NULL,               -- online | archived
+    rows INTEGER,
+    location TEXT,                     -- the archive file while archived
+    changed_at TEXT
+  )"""
+
+# built per partition once it is populated
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS ix_{t}_order_id ON {t}(order_id)",
+    # covers the aggregate refresh: status filter, month grouping, product key, plus the measures
+    "CREATE INDEX IF NOT EXISTS ix_{t}_status_month_product ON {t}(status, month_key, product_sk, product_id, order_id, revenue)",
+    "CREATE INDEX IF NOT EXISTS ix_{t}_customer ON {t}(customer_id)",
+]
+
+
+def table(month):
+    return f"{PREFIX}{int(month or UNKNOWN_MONTH)}"
+
+
+def _now():
+    return time.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def online(con, months=None):
+    """{month_key: table} of the online partitions, optionally only those in `months`."""
+    con.execute(CATALOG_DDL)
+    rows = con.execute("SELECT month_key, table_name FROM etl_partition WHERE state = 'online' ORDER BY month_key")
+    keep = None if months is None else {int(m or UNKNOWN_MONTH) for m in months}
+    return {m: t for m, t in rows if keep is None or m in keep}
+
+
+def archived(con):
+    con.execute(CATALOG_DDL)
+    return {m: loc for m, loc in con.execute("SELECT month_key, location FROM etl_partition WHERE state = 'archived'")}
+
+
+def ensure(con, month):
+    """Create the partition of `month` if it does not exist yet; returns its table."""
+    name = table(month)
+    con.execute(CATALOG_DDL)
+    con.execute(f"CREATE TABLE IF NOT EXISTS {name}{FACT_DDL}")
+    con.execute("INSERT OR IGNORE INTO etl_partition(month_key, table_name, state, changed_at) VALUES (?, ?, 'online', ?)",
+                (int(month or UNKNOWN_MONTH), name, _now()))
+    return name
+
+
+def create_view(con):
+    """(Re)define the fact_sales view over every online partition."""
+    parts = online(con) or {UNKNOWN_MONTH: ensure(con, UNKNOWN_MONTH)}
+    con.execute(f"DROP VIEW IF EXISTS {VIEW}")
+    con.execute(f"CREATE VIEW {VIEW} AS " + " UNION ALL ".join(f"SELECT * FROM {t}" for t in parts.values()))
+
+
+def source(tables):
+    """FROM-clause source reading only `tables` (partition names): the table itself, a
+    UNION ALL subquery, or an empty row set with the fact columns."""
+    tables = list(tables)
+    if len(tables) == 1:
+        return tables[0]
+    if not tables:
+        return f"(SELECT * FROM {VIEW} WHERE 0)"
+    return "(" + " UNION ALL ".join(f"SELECT * FROM {t}" for t in tables) + ")"
+
+
+def index_statements(con, months=None):
+    return [sql.format(t=t) for t in online(con, months).values() for sql in INDEXES]
+
+
+def update_counts(con, months=None):
+    for m, t in online(con, months).items():
+        con.execute("UPDATE etl_partition SET rows = (SELECT COUNT(*) FROM " + t + "), changed_at = ? "
+                    "WHERE month_key = ?", (_now(), m))
+
+
+def drop_all(con):
+    """Drop the view and every partition and empty the catalog, for a rebuild from the
+    sources: archived months come back online (their archive files are left alone)."""
+    con.execute(CATALOG_DDL)
+    kinds = dict(con.execute("SELECT name, type FROM sqlite_master WHERE name = ?", (VIEW,)))
+    if VIEW in kinds:
+        con.execute(f"DROP {kinds[VIEW].upper()} {VIEW}")      # a table before partitioning
+    for t in online(con).values():
+        con.execute(f"DROP TABLE IF EXISTS {t}")
+    con.execute("DELETE FROM etl_partition")
+
+
+def delete_where(con, where):
+    """DELETE the matching fact rows from every online partition; returns their months."""
+    months = set()
+    for m, t in online(con).items():
+        if con.execute(f"DELETE FROM {t} WHERE {where}").rowcount:
+            months.add(m)
+    return months
+
+
+def staged(month):
+    return f"{table(month)}__new"
+
+
+def stage(con, month, keep_where=None):
+    """Create the side table a month is rebuilt in, seeded with the live rows matching
+    keep_where (SQL over the partition's columns); returns its name."""
+    name = staged(month)
+    con.execute(f"DROP TABLE IF EXISTS {name}")
+    con.execute(f"CREATE TABLE {name}{FACT_DDL}")
+    live = online(con, [month])
+    if live and keep_where:
+        con.execute(f"INSERT INTO {name} SELECT * FROM {live[int(month or UNKNOWN_MONTH)]} WHERE {keep_where}")
+    return name
+
+
+def swap(con, months):
+    """Replace the live partitions of `months` by their staged tables, in the caller's
+    transaction: readers see either every old partition or every new one."""
+    con.execute(f"DROP VIEW IF EXISTS {VIEW}")
+    # the views over fact_sales (dq_*) would fail the rename's schema check until the
+    # view is back; the legacy rename skips that check
+    con.execute("PRAGMA legacy_alter_table = ON")
+    try:
+        for m in months:
+            con.execute(f"DROP TABLE IF EXISTS {table(m)}")
+            con.execute(f"ALTER TABLE {staged(m)} RENAME TO {table(m)}")
+    finally:
+        con.execute("PRAGMA legacy_alter_table = OFF")
+    for m in months:
+        name = table(m)
+        con.execute("INSERT INTO etl_partition(month_key, table_name, state, changed_at) VALUES (?, ?, 'online', ?) "
+                    "ON CONFLICT(month_key) DO UPDATE SET state = 'online', location = NULL, changed_at = excluded.changed_at",
+                    (int(m or UNKNOWN_MONTH), name, _now()))
+        for sql in INDEXES:
+            con.execute(sql.format(t=name))
+    update_counts(con, months)
+    create_view(con)
+
+
+def detach(con, months, archive_dir=ARCHIVE_DIR):
+    """Move the partitions of `months` into archive_dir/<table>.sqlite and out of the
+    warehouse; returns {month: file}. Aggregates keep the months' figures."""
+    archive_dir = Path(archive_dir)
+    archive_dir.mkdir(parents=True, exist_ok=True)
+    if con.in_transaction:
+        con.commit()
+    out = {}
+    for m, name in online(con, months).items():
+        path = archive_dir / f"{name}.sqlite"
+        con.execute("ATTACH DATABASE ? AS arc", (str(path),))
+        try:
+            # the copy is committed before the live table goes, so a crash leaves it online
+            with transaction(con):
+                con.execute(f"DROP TABLE IF EXISTS arc.{name}")
+                con.execute(f"CREATE TABLE arc.{name}{FACT_DDL}")
+                con.execute(f"INSERT INTO arc.{name} SELECT * FROM main.{name}")
+        finally:
+            con.execute("DETACH DATABASE arc")
+        with transaction(con):
+            rows = con.execute(f"SELECT COUNT(*) FROM {name}").fetchone()[0]
+            con.execute(f"DROP VIEW IF EXISTS {VIEW}")
+            con.execute(f"DROP TABLE {name}")
+            con.execute("UPDATE etl_partition SET state = 'archived', rows = ?, location = ?, changed_at = ? "
+                        "WHERE month_key = ?", (rows, str(path), _now(), m))
+            create_view(con)
+        out[m] = path
+    return out
+
+
+def restore(con, path, fill=None):
+    """Bring a detached partition back online from its archive file; returns its month.
+    fill(staged_table, month), when given, fills the rebuilt partition instead of the
+    archived rows (which miss any change made to the month while it was archived)."""
+    if con.in_transaction:
+        con.commit()
+    con.execute("ATTACH DATABASE ? AS arc", (str(path),))
+    try:
+        (name,) = [r[0] for r in con.execute(
+            "SELECT name FROM arc.sqlite_master WHERE type = 'table' AND name LIKE ?", (f"{PREFIX}%",))]
+        month = int(name[len(PREFIX):])
+        with transaction(con):
+            con.execute(CATALOG_DDL)
+            con.execute(f"DROP TABLE IF EXISTS {staged(month)}")
+            con.execute(f"CREATE TABLE {staged(month)}{FACT_DDL}")
+            if fill is None:
+                con.execute(f"INSERT INTO {staged(month)} SELECT * FROM arc.{name}")
+            else:
+                fill(staged(month), month)
+            swap(con, [month])
+    finally:
+        con.execute("DETACH DATABASE arc")
+    return month
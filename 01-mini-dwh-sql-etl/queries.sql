@@ -2,9 +2,11 @@
 SELECT * FROM v_monthly_kpis;
 SELECT * FROM v_top_products;
 SELECT * FROM v_category_contribution;
-SELECT COUNT(*) AS dq_null_issues FROM dq_nulls;
-SELECT COUNT(*) AS dq_negative_qty FROM dq_negative_qty;
+-- DQ rules (dq.py) run after every load: the last run's summary (dq_<rule> lists failing rows)
+SELECT rule, table_name, severity, checked_rows, failed_rows FROM v_dq_latest ORDER BY rule;
 
+-- 1)-3) and 7) are also evaluated per run as DQ checks (fact_rows, orphan_orders,
+--    revenue_mismatch, aggregates_match), the queries below recompute them ad hoc
 -- 1) fact rows must equal raw order_items rows
 SELECT
   (SELECT COUNT(*) FROM fact_sales)      AS fact_rows,
@@ -23,22 +25,139 @@ WHERE ABS(revenue - (quantity*unit_price*(1-COALESCE(discount,0)))) > 0.001;
 
 -- 4) (nice add) new vs repeat orders per month
 WITH first_order AS (
-  SELECT customer_id, MIN(order_date) AS first_date
+  SELECT customer_id, MIN(date_key) AS first_date
   FROM fact_sales WHERE status IN ('completed','shipped')
   GROUP BY customer_id
 )
-SELECT substr(fs.order_date,1,7) AS month,
-       SUM(CASE WHEN fs.order_date = fo.first_date THEN 1 ELSE 0 END) AS new_orders,
-       SUM(CASE WHEN fs.order_date <> fo.first_date THEN 1 ELSE 0 END) AS repeat_orders
+SELECT printf('%04d-%02d', fs.month_key / 100, fs.month_key % 100) AS month,
+       SUM(CASE WHEN fs.date_key = fo.first_date THEN 1 ELSE 0 END) AS new_orders,
+       SUM(CASE WHEN fs.date_key <> fo.first_date THEN 1 ELSE 0 END) AS repeat_orders
 FROM fact_sales fs
 JOIN first_order fo USING(customer_id)
-GROUP BY 1
-ORDER BY 1;
+GROUP BY fs.month_key
+ORDER BY fs.month_key;
 
 -- 5) (nice add) simple refund/cancel rate by month
-SELECT substr(order_date,1,7) AS month,
+SELECT printf('%04d-%02d', month_key / 100, month_key % 100) AS month,
        ROUND(100.0 * SUM(CASE WHEN status='cancelled' THEN 1 ELSE 0 END)
              / NULLIF(COUNT(*),0), 2) AS cancel_rate_pct
 FROM fact_sales
-GROUP BY 1
-ORDER BY 1;
+GROUP BY month_key
+ORDER BY month_key;
+
+-- 6) plan checks: the KPI views read only the agg_* tables, never fact_sales
+--    expect: SCAN agg_sales_month
+EXPLAIN QUERY PLAN SELECT * FROM v_monthly_kpis;
+--    expect: SCAN a (agg_sales_month_product) + SEARCH dp USING INTEGER PRIMARY KEY (rowid=?)
+EXPLAIN QUERY PLAN SELECT * FROM v_top_products;
+--    expect: SCAN agg_sales_month_category_payment (twice, incl. the scalar subquery)
+EXPLAIN QUERY PLAN SELECT * FROM v_category_contribution;
+
+--    ...and the per-month refresh that fills them is an index seek per partition
+--    (aggregates.py names the month's partition itself, so it reads only that one),
+--    here for the latest online month, whatever the data
+--    expect: SEARCH fact_sales_m<yyyymm> USING INDEX ix_fact_sales_m<yyyymm>_status_month_product (status=? AND month_key=?), once per partition
+EXPLAIN QUERY PLAN
+SELECT month_key, COUNT(DISTINCT order_id), SUM(revenue)
+FROM fact_sales
+WHERE status IN ('completed','shipped')
+  AND month_key IN (SELECT MAX(month_key) FROM etl_partition WHERE state = 'online')
+GROUP BY month_key;
+--    through the fact_sales view the filter is pushed into every partition
+--    expect: SEARCH fact_sales_m<yyyymm> USING INDEX ix_fact_sales_m<yyyymm>_customer (customer_id=?), once per partition
+EXPLAIN QUERY PLAN SELECT * FROM fact_sales WHERE customer_id = 42;
+
+-- 7) aggregates must match the facts they were refreshed from (expect 0 rows)
+SELECT a.month_key, a.revenue, f.revenue AS fact_revenue
+FROM agg_sales_month a
+JOIN (SELECT month_key, SUM(revenue) AS revenue FROM fact_sales
+      WHERE status IN ('completed','shipped') GROUP BY month_key) f USING(month_key)
+WHERE ABS(a.revenue - f.revenue) > 0.01;
+
+-- 8) the cube must match the facts too (each expects 0 rows)
+--    single-category cells vs the facts of that category
+SELECT c.month_key, c.status, c.payment_method, cc.category, c.orders, f.orders AS fact_orders
+FROM agg_cube c
+JOIN agg_cube_category cc ON cc.bit = c.category_set
+LEFT JOIN (SELECT fs.month_key, fs.status, fs.payment_method, dp.category,
+                  COUNT(DISTINCT fs.order_id) AS orders, SUM(fs.revenue) AS revenue
+           FROM fact_sales fs JOIN dim_product dp ON dp.product_sk = fs.product_sk
+           GROUP BY 1, 2, 3, 4) f
+  ON f.month_key = c.month_key AND f.status = c.status AND f.payment_method = c.payment_method
+ AND f.category = cc.category
+WHERE c.month_key <> 0 AND c.status <> 'ALL' AND c.payment_method <> 'ALL'
+  AND (f.orders IS NULL OR c.orders <> f.orders OR ABS(c.revenue - f.revenue) > 0.01);
+
+--    the all-categories grand total (every rollup level) vs distinct orders in the facts
+SELECT c.orders, c.revenue, f.orders AS fact_orders, f.revenue AS fact_revenue
+FROM agg_cube c,
+     (SELECT COUNT(DISTINCT fs.order_id) AS orders, SUM(fs.revenue) AS revenue
+      FROM fact_sales fs JOIN agg_cube_category cc
+        ON cc.category = (SELECT category FROM dim_product WHERE product_sk = fs.product_sk)
+      WHERE fs.month_key IS NOT NULL) f
+WHERE c.month_key = 0 AND c.status = 'ALL' AND c.payment_method = 'ALL'
+  AND c.category_set = (SELECT SUM(bit) FROM agg_cube_category)
+  AND (c.orders <> f.orders OR ABS(c.revenue - f.revenue) > 0.01);
+
+--    product cells vs the facts
+SELECT p.month_key, p.product_id, p.orders, p.revenue
+FROM (SELECT month_key, SUM(orders) AS orders, SUM(revenue) AS revenue, product_id
+      FROM agg_cube_product GROUP BY month_key, product_id) p
+JOIN (SELECT month_key, product_id, COUNT(DISTINCT order_id) AS orders, SUM(revenue) AS revenue
+      FROM fact_sales WHERE month_key IS NOT NULL GROUP BY month_key, product_id) f USING (month_key, product_id)
+WHERE p.orders <> f.orders OR ABS(p.revenue - f.revenue) > 0.01;
+
+-- 9) other time grains come from dim_date's integer columns, no date-string slicing
+--    revenue per ISO week
+SELECT d.iso_week_key, MIN(d.full_date) AS week_from, SUM(fs.revenue) AS revenue,
+       COUNT(DISTINCT fs.order_id) AS orders
+FROM fact_sales fs
+JOIN dim_date d ON d.date_key = fs.date_key
+WHERE fs.status IN ('completed','shipped')
+GROUP BY d.iso_week_key
+ORDER BY d.iso_week_key;
+
+--    revenue per fiscal quarter, weekday vs weekend
+SELECT d.fiscal_year, d.fiscal_quarter, d.is_weekend, SUM(fs.revenue) AS revenue
+FROM fact_sales fs
+JOIN dim_date d ON d.date_key = fs.date_key
+WHERE fs.status IN ('completed','shipped')
+GROUP BY d.fiscal_year, d.fiscal_quarter, d.is_weekend
+ORDER BY d.fiscal_year, d.fiscal_quarter, d.is_weekend;
+
+--    the calendar has no gaps: whole months with every day, and no month missing (each expects 0 rows)
+SELECT month_key, COUNT(*) AS days
+FROM dim_date
+GROUP BY month_key
+HAVING MIN(day) <> 1 OR COUNT(*) <> MAX(day) OR MAX(day) < 28;
+SELECT COUNT(DISTINCT month_key) AS months, MAX(year * 12 + month) - MIN(year * 12 + month) + 1 AS span
+FROM dim_date
+HAVING COUNT(DISTINCT month_key) <> MAX(year * 12 + month) - MIN(year * 12 + month) + 1;
+
+-- 10) SCD2 dimensions (each expects 0 rows)
+--    exactly one current version per key, and versions of a key never overlap
+SELECT product_id, SUM(is_current) AS current_versions FROM dim_product GROUP BY product_id HAVING SUM(is_current) <> 1;
+SELECT a.product_id, a.product_sk AS older_sk, b.product_sk AS newer_sk
+FROM dim_product a JOIN dim_product b
+  ON b.product_id = a.product_id AND b.product_sk > a.product_sk
+ AND b.valid_from < a.valid_to AND a.valid_from < b.valid_to;
+--    facts point at the version valid on their order date (a key gone from the source keeps its last one)
+SELECT fs.order_id, fs.product_id, fs.date_key, dp.valid_from, dp.valid_to
+FROM fact_sales fs JOIN dim_product dp ON dp.product_sk = fs.product_sk
+WHERE printf('%04d-%02d-%02d', fs.date_key / 10000, fs.date_key / 100 % 100, fs.date_key % 100) < dp.valid_from
+   OR (printf('%04d-%02d-%02d', fs.date_key / 10000, fs.date_key / 100 % 100, fs.date_key % 100) >= dp.valid_to
+       AND EXISTS (SELECT 1 FROM dim_product n WHERE n.product_id = dp.product_id AND n.valid_from > dp.valid_from));
+--    the point-in-time lookup the fact build runs per line
+--    expect: SEARCH d USING COVERING INDEX ix_dim_product_pit (product_id=? AND valid_from<?)
+EXPLAIN QUERY PLAN
+SELECT d.product_sk FROM dim_product d
+WHERE d.product_id = 5 AND d.valid_from <= '2024-06-01'
+ORDER BY d.valid_from DESC, d.product_sk DESC LIMIT 1;
+
+-- 11) fact partitions: the catalog counts what the online partitions hold (expect 0 rows)
+SELECT * FROM (
+  SELECT (SELECT SUM("rows") FROM etl_partition WHERE state = 'online') AS catalog_rows,
+         (SELECT COUNT(*) FROM fact_sales) AS fact_rows)
+WHERE catalog_rows <> fact_rows;
+--    archived months (their aggregate rows stay, their facts are in archive/)
+SELECT month_key, "rows", location FROM etl_partition WHERE state = 'archived' ORDER BY month_key;
@@ -0,0 +1,142 @@
+import os, re, sqlite3, threading, pandas as pd
+from contextlib import nullcontext
+from pathlib import Path
+from db_pool import ReadOnlyPool
+from query_cache import VERSION_TABLE
+
+# Engines the dashboard and static export can read the warehouse through. The ETL
+# always writes SQLite; "duckdb" serves the same tables and views from an embedded,
+# columnar DuckDB copy that reloads a table only when its ETL data version moves.
+# Pick one with DWH_BACKEND (default sqlite). duckdb is an optional dependency.
+BACKENDS = ("sqlite", "duckdb")
+DEFAULT_BACKEND = os.environ.get("DWH_BACKEND", "sqlite")
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+COPY_ROWS = 200_000     # rows per chunk when copying a table into DuckDB
+
+
+class SQLiteBackend:
+    name = "sqlite"
+
+    def __init__(self, db_path, pool=None):
+        self.db_path = Path(db_path)
+        self.pool = pool or ReadOnlyPool(db_path, size=1)
+
+    def _source(self, con):
+        return nullcontext(con) if con is not None else self.pool.connection()
+
+    def query(self, sql, params=(), con=None):
+        # `con`: an already open read connection to db_path, used instead of a pooled one
+        with self._source(con) as src:
+            return pd.read_sql(sql, src, params=tuple(params))
+
+    def close(self):
+        self.pool.close()
+
+
+def _duck_type(decl):
+    # SQLite's declared-type affinity rules, mapped onto DuckDB types
+    decl = (decl or "").upper()
+    if "INT" in decl:
+        return "BIGINT"
+    if any(t in decl for t in ("CHAR", "CLOB", "TEXT")) or not decl:
+        return "VARCHAR"
+    if "BLOB" in decl:
+        return "BLOB"
+    return "DOUBLE"
+
+
+class DuckDBBackend(SQLiteBackend):
+    name = "duckdb"
+
+    def __init__(self, db_path, pool=None, threads=None):
+        if duckdb is None:
+            raise RuntimeError("the duckdb backend needs duckdb (pip install duckdb)")
+        super().__init__(db_path, pool)
+        self._lock = threading.Lock()
+        self._duck = duckdb.connect(":memory:", config={"threads": int(threads)} if threads else {})
+        self._duck.execute("SET GLOBAL integer_division = true")    # int / int truncates, as in SQLite
+        self._loaded = {}           # table -> version stamp of the copy DuckDB holds
+
+    def _sync(self, src):
+        # copy every table whose stamp moved (or that is new), in one SQLite read snapshot
+        objects = src.execute("SELECT type, name, sql FROM sqlite_master "
+                              "WHERE type IN ('table','view') AND name NOT LIKE 'sqlite_%'").fetchall()
+        try:
+            versions = dict(src.execute(f"SELECT table_name, version FROM {VERSION_TABLE}"))
+        except sqlite3.OperationalError:
+            versions = {}
+        # the stamp table moves with its newest stamp; a table nothing stamps (etl_run_log,
+        # which is only appended to) is compared by its row count and largest rowid
+        versions[VERSION_TABLE] = max(versions.values(), default=0)
+        tables = {name: versions[name] if name in versions else
+                  src.execute(f'SELECT COUNT(*), MAX(rowid) FROM "{name}"').fetchone()
+                  for kind, name, _ in objects if kind == "table"}
+        stale = [t for t, v in tables.items() if self._loaded.get(t) != v]
+        gone = set(self._loaded) - set(tables)
+        if not stale and not gone:
+            return
+        duck = self._duck
+        duck.execute("BEGIN")
+        try:
+            for (view,) in duck.execute("SELECT view_name FROM duckdb_views() WHERE NOT internal").fetchall():
+                duck.execute(f'DROP VIEW "{view}"')
+            for t in gone:
+                duck.execute(f'DROP TABLE IF EXISTS "{t}"')
+            for t in stale:
+                cols = src.execute(f'PRAGMA table_info("{t}")').fetchall()
+                duck.execute(f'CREATE OR REPLACE TABLE "{t}"('
+                             + ", ".join(f'"{c[1]}" {_duck_type(c[2])}' for c in cols) + ")")
+                for chunk in pd.read_sql(f'SELECT * FROM "{t}"', src, chunksize=COPY_ROWS):
+                    duck.register("_chunk", chunk)
+                    duck.execute(f'INSERT INTO "{t}" SELECT * FROM _chunk')
+                    duck.unregister("_chunk")
+            # DuckDB binds a view when it is created, so the views it reads go first
+            views, created = {name: sql for kind, name, sql in objects if kind == "view"}, set()
+            def create(name):
+                created.add(name)
+                for dep in (set(re.findall(r"[A-Za-z_][A-Za-z0-9_]*", views[name])) & set(views)) - created:
+                    create(dep)
+                duck.execute(views[name])
+            for name in views:
+                if name not in created:
+                    create(name)
+            duck.execute("COMMIT")
+        except BaseException:
+            duck.execute("ROLLBACK")
+            raise
+        self._loaded = dict(tables)
+
+    def query(self, sql, params=(), con=None):
+        with self._source(con) as src, self._lock:
+            outer = src.in_transaction
+            if not outer:
+                src.execute("BEGIN")
+            try:
+                self._sync(src)
+            finally:
+                if not outer:
+                    src.rollback()
+            cur = self._duck.cursor()      # own cursor: DuckDB runs the query itself in parallel
+        try:
+            return cur.execute(sql, list(params)).df()
+        finally:
+            cur.close()
+
+    def close(self):
+        super().close()
+        self._duck.close()
+
+
+def get_backend(name=None, db_path=None, pool=None, **options):
+    """Return a backend by name (default: DWH_BACKEND) for the warehouse at db_path."""
+    name = (name or DEFAULT_BACKEND).lower()
+    if name == "sqlite":
+        return SQLiteBackend(db_path, pool)
+    if name == "duckdb":
+        return DuckDBBackend(db_path, pool, **options)
+    raise ValueError(f"unknown backend {name!r}; expected one of {BACKENDS}")
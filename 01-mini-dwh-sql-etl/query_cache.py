@@ -0,0 +1,168 @@
+import hashlib, pickle, re, sqlite3, threading, time
+from pathlib import Path
+
+# Shared, size-bounded cache for dashboard query results.
+#
+# Entries live in a small SQLite file so every Streamlit worker process sees the same
+# store. A key is normalized SQL + params + the version stamps (written by
+# load_to_sqlite into etl_data_version) of every table and view the query reads, views
+# expanded. A load therefore only invalidates entries that depend on what it touched.
+
+VERSION_TABLE = "etl_data_version"
+
+
+def bump_data_version(con, tables):
+    """Give every table in `tables` a new version stamp; call it in the transaction that
+    wrote them. Read here, by the static export and by the DuckDB backend's sync."""
+    con.execute(f"""
+      CREATE TABLE IF NOT EXISTS {VERSION_TABLE}(
+        table_name TEXT PRIMARY KEY,
+        version INTEGER NOT NULL,
+        loaded_at TEXT
+      )""")
+    version, now = time.time_ns(), time.strftime("%Y-%m-%dT%H:%M:%S")
+    con.executemany(f"""
+      INSERT INTO {VERSION_TABLE}(table_name, version, loaded_at) VALUES (?,?,?)
+      ON CONFLICT(table_name) DO UPDATE SET version = excluded.version, loaded_at = excluded.loaded_at
+    """, [(t, version, now) for t in sorted(tables)])
+
+_IDENT = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+_LITERAL = re.compile(r"('(?:[^']|'')*')")
+
+
+def normalize_sql(sql):
+    # collapse whitespace outside string literals and drop trailing semicolons
+    parts = _LITERAL.split(sql)
+    parts[::2] = [re.sub(r"\s+", " ", p) for p in parts[::2]]
+    return "".join(parts).strip().rstrip(";").strip()
+
+
+class QueryCache:
+    def __init__(self, path, max_bytes=64 << 20, ttl=3600.0):
+        self.path, self.max_bytes, self.ttl = Path(path), int(max_bytes), float(ttl)
+        self._lock = threading.Lock()
+        self._deps = {}          # (db, sql) -> tables it reads, after view expansion
+        self._seen = {}          # db -> last version stamps observed
+        self._con = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._con.executescript("""
+          PRAGMA journal_mode = WAL;
+          PRAGMA synchronous = NORMAL;
+          CREATE TABLE IF NOT EXISTS entries(
+            key TEXT PRIMARY KEY,
+            tables TEXT NOT NULL,
+            value BLOB NOT NULL,
+            nbytes INTEGER NOT NULL,
+            created REAL NOT NULL,
+            last_access REAL NOT NULL
+          );
+          CREATE INDEX IF NOT EXISTS ix_entries_last_access ON entries(last_access);
+          CREATE TABLE IF NOT EXISTS counters(name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+        """)
+
+    # --- metrics (shared across processes through the counters table)
+    def _count(self, name, n=1):
+        if n:
+            self._con.execute("INSERT INTO counters VALUES (?, ?) "
+                              "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value", (name, n))
+
+    def stats(self):
+        with self._lock:
+            out = dict(self._con.execute("SELECT name, value FROM counters"))
+            n, size = self._con.execute("SELECT COUNT(*), COALESCE(SUM(nbytes), 0) FROM entries").fetchone()
+        out = {k: out.get(k, 0) for k in ("hits", "misses", "evictions", "expirations", "invalidations")}
+        lookups = out["hits"] + out["misses"]
+        return {**out, "entries": n, "bytes": size, "max_bytes": self.max_bytes,
+                "hit_rate": out["hits"] / lookups if lookups else 0.0}
+
+    def clear(self):
+        with self._lock:
+            self._con.execute("DELETE FROM entries")
+
+    # --- dependency / version tracking against the warehouse
+    def _tables_for(self, db, sql, src):
+        key = (db, sql)
+        if key not in self._deps:
+            objects = {name: (kind, body) for kind, name, body in
+                       src.execute("SELECT type, name, sql FROM sqlite_master WHERE type IN ('table','view')")}
+            tables, todo = set(), set(_IDENT.findall(sql)) & set(objects)
+            while todo:
+                name = todo.pop()
+                kind, body = objects[name]
+                tables.add(name)
+                if kind == "view":
+                    # the view's own stamp too: its definition may change (e.g. fact_sales' partitions)
+                    todo |= (set(_IDENT.findall(body or "")) & set(objects)) - tables - {name}
+            self._deps[key] = frozenset(tables)
+        return self._deps[key]
+
+    def _versions(self, src):
+        try:
+            return dict(src.execute(f"SELECT table_name, version FROM {VERSION_TABLE}"))
+        except sqlite3.OperationalError:
+            return {}
+
+    def _invalidate(self, db, versions):
+        # drop entries that read a table whose stamp moved; their keys can never match again
+        changed = [t for t, v in versions.items() if self._seen.get(db, {}).get(t, v) != v]
+        for table in changed:
+            cur = self._con.execute("DELETE FROM entries WHERE ',' || tables || ',' LIKE ?", (f"%,{table},%",))
+            self._count("invalidations", cur.rowcount)
+        self._seen[db] = versions
+
+    # --- main entry point
+    def get_or_load(self, db_path, sql, params, loader, src=None, tag=""):
+        """Return loader(sql, params) for the warehouse at db_path, served from the cache
+        when an entry with the same SQL, params and table versions is present. `src` is
+        an open connection to db_path to read versions through (one is opened if omitted);
+        `tag` separates results of different loaders, e.g. query backends."""
+        db, norm = str(db_path), normalize_sql(sql)
+        own = src is None
+        if own:
+            src = sqlite3.connect(f"file:{db}?mode=ro", uri=True)
+        try:
+            versions = self._versions(src)
+            tables = self._tables_for(db, norm, src)
+        finally:
+            if own:
+                src.close()
+        stamp = sorted((t, versions.get(t, 0)) for t in tables)
+        key = hashlib.sha256(repr((db, norm, tuple(params), stamp, tag)).encode()).hexdigest()
+        now = time.time()
+
+        with self._lock:
+            self._invalidate(db, versions)
+            row = self._con.execute("SELECT value, created FROM entries WHERE key = ?", (key,)).fetchone()
+            if row and now - row[1] <= self.ttl:
+                self._con.execute("UPDATE entries SET last_access = ? WHERE key = ?", (now, key))
+                self._count("hits")
+                return pickle.loads(row[0])
+            if row:
+                self._con.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._count("expirations")
+            self._count("misses")
+
+        value = loader(sql, params)
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(blob) > self.max_bytes:
+            return value
+        with self._lock:
+            self._con.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                              (key, ",".join(sorted(tables)), blob, len(blob), now, now))
+            self._evict(now)
+        return value
+
+    def _evict(self, now):
+        cur = self._con.execute("DELETE FROM entries WHERE created < ?", (now - self.ttl,))
+        self._count("expirations", cur.rowcount)
+        total = self._con.execute("SELECT COALESCE(SUM(nbytes), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # least recently used first until the store fits again
+        victims, freed = [], 0
+        for key, nbytes in self._con.execute("SELECT key, nbytes FROM entries ORDER BY last_access"):
+            victims.append((key,))
+            freed += nbytes
+            if total - freed <= self.max_bytes:
+                break
+        self._con.executemany("DELETE FROM entries WHERE key = ?", victims)
+        self._count("evictions", len(victims))
@@ -0,0 +1,128 @@
+import os, sqlite3, threading, time
+from contextlib import closing, contextmanager
+from pathlib import Path
+
+# Startup check for the dashboard. Streamlit reruns app.py on every interaction, so the
+# checks live in one Warehouse per process: it probes the schema, the data version
+# (etl_data_version) and the source CSVs once, and when the warehouse is missing or its
+# sources changed after the last load read them (etl_watermark.loaded_at) it builds or
+# refreshes it in a background thread. A refresh is an incremental load, which commits
+# as one transaction in WAL mode, so sessions keep reading the previous load until the
+# new one is complete; they only look at the in-memory status on a rerun. A lock file
+# next to the database makes sure one process builds at a time; the others wait for it
+# and probe again.
+REQUIRED = ("fact_sales", "dim_product", "dim_customer", "dim_date", "etl_data_version", "v_dq_latest")
+SOURCES = ("orders.csv", "order_items.csv", "products.csv", "customers.csv")
+STALE_LOCK = 3600.0             # seconds after which a build lock is taken over
+POLL = 1.0                      # seconds between lock attempts while another process builds
+
+
+def probe(db_path, data_dir):
+    """One look at the warehouse and its sources: {"schema", "version", "sources", "stale"}.
+    version is the newest etl_data_version stamp (ns); sources maps each CSV to its
+    mtime (None when missing); stale means a CSV changed after the last load read it."""
+    db_path, data_dir = Path(db_path), Path(data_dir)
+    sources = {name: (data_dir / name).stat().st_mtime if (data_dir / name).is_file() else None
+               for name in SOURCES}
+    version = loaded = None
+    if db_path.is_file():
+        try:
+            with closing(sqlite3.connect(f"{db_path.resolve().as_uri()}?mode=ro", uri=True)) as con:
+                names = {r[0] for r in con.execute("SELECT name FROM sqlite_master WHERE type IN ('table','view')")}
+                if set(REQUIRED) <= names:
+                    version = con.execute("SELECT MAX(version) FROM etl_data_version").fetchone()[0]
+                if version is not None and "etl_watermark" in names:
+                    loaded = con.execute("SELECT MIN(loaded_at) FROM etl_watermark").fetchone()[0]
+        except sqlite3.Error:
+            version = None
+    newest = max((t for t in sources.values() if t is not None), default=None)
+    checked = time.mktime(time.strptime(loaded, "%Y-%m-%dT%H:%M:%S")) if loaded else None
+    stale = version is not None and newest is not None and (checked is None or newest > checked)
+    return {"schema": version is not None, "version": version, "sources": sources, "stale": stale}
+
+
+def _build(schema, sources):
+    # imported here: etl_pipeline creates its data directories at import
+    import etl_pipeline as etl
+    if None in sources.values():
+        etl.make_synthetic()
+        etl.fetch_api_sample()
+    return etl.load_to_sqlite(mode="incremental" if schema else "full")
+
+
+class Warehouse:
+    def __init__(self, db_path, data_dir, build=_build, stale_lock=STALE_LOCK):
+        self.db_path, self.data_dir = Path(db_path), Path(data_dir)
+        self.lock_path = self.db_path.with_name(self.db_path.name + ".build.lock")
+        self._build, self.stale_lock = build, float(stale_lock)
+        self._cond = threading.Condition()
+        self._worker = None
+        self.error = None
+        self.built_at = None
+        self.status = probe(self.db_path, self.data_dir)
+
+    @property
+    def ready(self):
+        """True while there is a warehouse to read, even an outdated one being refreshed."""
+        return self.status["schema"]
+
+    @property
+    def building(self):
+        return self._worker is not None and self._worker.is_alive()
+
+    def ensure(self):
+        """Start a background build if the warehouse is missing, incomplete or older than
+        its sources (or the sources are missing); returns True when one is running."""
+        with self._cond:
+            if self.building:
+                return True
+            s = self.status
+            if s["schema"] and not s["stale"] and None not in s["sources"].values():
+                return False
+            self.error = None
+            self._worker = threading.Thread(target=self._run, name="warehouse-build", daemon=True)
+            self._worker.start()
+            return True
+
+    def wait(self, timeout=None):
+        """Block until no build runs (or timeout); returns ready."""
+        with self._cond:
+            self._cond.wait_for(lambda: not self.building, timeout)
+        return self.ready
+
+    def _run(self):
+        try:
+            with self._locked():
+                # another process may have built while this one waited for the lock
+                s = probe(self.db_path, self.data_dir)
+                if not s["schema"] or s["stale"] or None in s["sources"].values():
+                    self._build(s["schema"], s["sources"])
+                    self.built_at = time.time()
+        except Exception as exc:
+            self.error = exc
+        finally:
+            status = probe(self.db_path, self.data_dir)
+            with self._cond:
+                self.status, self._worker = status, None
+                self._cond.notify_all()
+
+    @contextmanager
+    def _locked(self):
+        while True:
+            try:
+                fd = os.open(self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                try:
+                    if time.time() - self.lock_path.stat().st_mtime > self.stale_lock:
+                        self.lock_path.unlink(missing_ok=True)      # its builder died
+                        continue
+                except FileNotFoundError:
+                    continue
+                time.sleep(POLL)
+        try:
+            os.write(fd, str(os.getpid()).encode())
+            os.close(fd)
+            yield
+        finally:
+            self.lock_path.unlink(missing_ok=True)